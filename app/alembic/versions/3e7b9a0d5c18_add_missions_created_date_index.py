@@ -0,0 +1,23 @@
+"""add missions created_date index
+
+Revision ID: 3e7b9a0d5c18
+Revises: 8c1d4e6f2a93
+Create Date: 2026-10-19 15:48:21.904512
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7b9a0d5c18'
+down_revision = '8c1d4e6f2a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_missions_created_date_id', 'missions', ['created_date', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_missions_created_date_id', table_name='missions')
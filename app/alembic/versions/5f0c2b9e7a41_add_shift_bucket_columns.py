@@ -0,0 +1,61 @@
+"""add shift bucket columns
+
+Revision ID: 5f0c2b9e7a41
+Revises: b47fb2d7cddc
+Create Date: 2026-10-19 12:40:12.318290
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from app.env import DAY_SHIFT_BEGIN, DAY_SHIFT_END, TIMEZONE_OFFSET
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0c2b9e7a41'
+down_revision = 'b47fb2d7cddc'
+branch_labels = None
+depends_on = None
+
+
+def backfill(table_name: str, local_datetime: str):
+    """Fill shift_type/shift_date for existing rows, mirroring `get_shift_type_by_datetime` and `get_shift_date_by_datetime`."""
+    day_begin = datetime.strptime(DAY_SHIFT_BEGIN, "%H:%M")
+    day_end = datetime.strptime(DAY_SHIFT_END, "%H:%M")
+    begin_minutes = day_begin.hour * 60 + day_begin.minute
+    day_shift_seconds = ((day_end - day_begin).total_seconds()) % (24 * 60 * 60)
+
+    op.execute(
+        f"""
+        UPDATE {table_name}
+        SET
+            shift_date = DATE({local_datetime} - INTERVAL {begin_minutes} MINUTE),
+            shift_type = IF(TIME_TO_SEC(TIME({local_datetime} - INTERVAL {begin_minutes} MINUTE)) <= {int(day_shift_seconds)}, 0, 1)
+        WHERE {local_datetime} IS NOT NULL
+        """
+    )
+
+
+def upgrade():
+    for table_name in ['missions', 'missionevents', 'auditlogheaders']:
+        op.add_column(table_name, sa.Column('shift_type', sa.SmallInteger(), nullable=True))
+        op.add_column(table_name, sa.Column('shift_date', sa.Date(), nullable=True))
+
+    # missions and auditlogheaders are stored in UTC, missionevents are stored in local time.
+    backfill('missions', f'(created_date + INTERVAL {TIMEZONE_OFFSET} HOUR)')
+    backfill('auditlogheaders', f'(created_date + INTERVAL {TIMEZONE_OFFSET} HOUR)')
+    backfill('missionevents', 'event_start_date')
+
+    op.create_index('ix_missions_shift_type_shift_date', 'missions', ['shift_type', 'shift_date'], unique=False)
+    op.create_index('ix_missionevents_shift_type_shift_date', 'missionevents', ['shift_type', 'shift_date'], unique=False)
+    op.create_index('ix_auditlogheaders_shift_type_shift_date', 'auditlogheaders', ['shift_type', 'shift_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_auditlogheaders_shift_type_shift_date', table_name='auditlogheaders')
+    op.drop_index('ix_missionevents_shift_type_shift_date', table_name='missionevents')
+    op.drop_index('ix_missions_shift_type_shift_date', table_name='missions')
+
+    for table_name in ['missions', 'missionevents', 'auditlogheaders']:
+        op.drop_column(table_name, 'shift_date')
+        op.drop_column(table_name, 'shift_type')
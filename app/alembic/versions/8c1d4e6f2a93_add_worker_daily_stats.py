@@ -0,0 +1,75 @@
+"""add worker daily stats
+
+Revision ID: 8c1d4e6f2a93
+Revises: 5f0c2b9e7a41
+Create Date: 2026-10-19 15:02:47.530114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.env import TIMEZONE_OFFSET
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d4e6f2a93'
+down_revision = '5f0c2b9e7a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'worker_daily_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user', sa.String(length=100), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('accepted_count', sa.Integer(), nullable=True),
+        sa.Column('rejected_count', sa.Integer(), nullable=True),
+        sa.Column('login_count', sa.Integer(), nullable=True),
+        sa.Column('first_login_date', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_logout_date', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_logout_reason', sa.String(length=256), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['user'], ['users.username'], name='fk_worker_daily_stats_users_username_user', ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user', 'day', name='uc_worker_daily_stats_user_day'),
+    )
+
+    # backfill from the existing audit logs, days are in local time like `get_local_date_by_datetime`;
+    # like `count_worker_daily_stat`, only the first accept/reject of a mission by a worker is counted, on the day it happened
+    op.execute(
+        f"""
+        INSERT INTO worker_daily_stats
+            (user, day, accepted_count, rejected_count, login_count, first_login_date, last_logout_date)
+        SELECT
+            a.user,
+            DATE(a.created_date + INTERVAL {TIMEZONE_OFFSET} HOUR) AS day,
+            SUM(a.action = 'MISSION_ACCEPTED' AND f.id IS NOT NULL),
+            SUM(a.action = 'MISSION_REJECTED' AND f.id IS NOT NULL),
+            SUM(a.action = 'USER_LOGIN'),
+            MIN(CASE WHEN a.action = 'USER_LOGIN' THEN a.created_date END),
+            MAX(CASE WHEN a.action = 'USER_LOGOUT' THEN a.created_date END)
+        FROM auditlogheaders a
+        LEFT JOIN (
+            SELECT MIN(id) AS id
+            FROM auditlogheaders
+            WHERE user IS NOT NULL AND action IN ('MISSION_ACCEPTED', 'MISSION_REJECTED')
+            GROUP BY user, action, record_pk
+        ) f ON f.id = a.id
+        WHERE a.user IS NOT NULL
+        AND a.action IN ('MISSION_ACCEPTED', 'MISSION_REJECTED', 'USER_LOGIN', 'USER_LOGOUT')
+        GROUP BY a.user, day
+        """
+    )
+    op.execute(
+        """
+        UPDATE worker_daily_stats s
+        INNER JOIN auditlogheaders a ON a.user = s.user AND a.created_date = s.last_logout_date AND a.action = 'USER_LOGOUT'
+        SET s.last_logout_reason = a.description
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('worker_daily_stats')
@@ -5,9 +5,12 @@ import time
 from databases import Database
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
+from prometheus_client import start_http_server
 from pydantic import BaseModel
 from app.models.schema import MissionDto
 from app.services.device import get_workers_from_whitelist_devices
+from app.utils.metrics import ROUTINE_DURATION, instrument_database, metrics_scope
+from app.utils.profiler import profile_queries
 from app.utils.timer import Ticker
 from foxlink_dispatch.dispatch import Foxlink_dispatch
 from app.services.mission import assign_mission, get_mission_by_id, is_mission_in_whitelist
@@ -18,17 +21,20 @@ from app.services.user import (
     is_worker_in_whitelist,
 )
 from app.my_log_conf import LOGGER_NAME
-from app.utils.utils import get_shift_type_now
-from app.mqtt.main import connect_mqtt, publish, disconnect_mqtt
+from app.utils.utils import gather_with_limit, get_shift_type_now
+from app.mqtt.main import connect_mqtt, flush_mqtt, publish, disconnect_mqtt
+from app.mqtt.emqx import emqx_client
+from app.mqtt.presence import presence_map, sync_presence
 from app.env import (
+    DAEMON_METRICS_PORT,
     DISABLE_FOXLINK_DISPATCH,
     FOXLINK_DB_HOSTS,
+    FOXLINK_DB_POOL_MAX_SIZE,
+    FOXLINK_DB_POOL_MIN_SIZE,
     FOXLINK_DB_PWD,
     FOXLINK_DB_USER,
     MQTT_BROKER,
     MAX_NOT_ALIVE_TIME,
-    EMQX_USERNAME,
-    EMQX_PASSWORD,
     MOVE_TO_RESCUE_STATION_TIME,
     MQTT_PORT,
     OVERTIME_MISSION_NOTIFY_PERIOD,
@@ -80,10 +86,16 @@ class FoxlinkEvent(BaseModel):
 
 def show_duration(func):
     async def wrapper():
+        token = metrics_scope.set(func.__name__)
         start = time.perf_counter()
-        await func()
-        end = time.perf_counter()
-        logger.warning(f'[{func.__name__}] took {end - start:.2f} seconds.')
+        try:
+            with profile_queries(func.__name__):
+                await func()
+        finally:
+            end = time.perf_counter()
+            metrics_scope.reset(token)
+            ROUTINE_DURATION.labels(func.__name__).observe(end - start)
+            logger.debug(f'[{func.__name__}] took {end - start:.2f} seconds.')
     return wrapper
 
 
@@ -105,45 +117,66 @@ async def check_alive_worker_routine():
         .all()
     )
 
-    async with aiohttp.ClientSession() as session:
-        for w in alive_worker_status:
-            async with session.get(
-                f"http://{MQTT_BROKER}:18083/api/v4/clients/{w.worker.username}",
-                auth=aiohttp.BasicAuth(login=EMQX_USERNAME, password=EMQX_PASSWORD),
-            ) as resp:
-                if resp.status != 200:
-                    logger.warn("Error getting mqtt client status")
-                    continue
+    if len(alive_worker_status) == 0:
+        return
 
-                try:
-                    content = await resp.json()
-                    # if the woeker is still not connected to the broker
-                    if len(content["data"]) == 0:
-                        if datetime.utcnow() - w.check_alive_time > timedelta(
-                            minutes=MAX_NOT_ALIVE_TIME
-                        ):
-
-                            # await w.update(status=WorkerStatusEnum.leave.value)
-                            device_level = await UserDeviceLevel.objects.filter(
-                                user=w.worker.username
-                            ).first()
-                            if device_level is not None:
-                                superior = device_level.superior
-                                publish(
-                                    f"foxlink/users/{superior.username}/worker-unusual-offline",
-                                    {
-                                        "worker_id": w.worker.username,
-                                        "worker_name": w.worker.full_name,
-                                    },
-                                    qos=2,
-                                    retain=True,
-                                )
-                    else:
-                        await w.update(check_alive_time=datetime.utcnow())
-                except:
-                    continue
+    try:
+        await sync_presence()
 
+        if presence_map.is_ready():
+            connected_clients = {
+                w.worker.username for w in alive_worker_status
+                if presence_map.is_connected(w.worker.username)
+            }
+        else:
+            connected_clients = set(await emqx_client.list_connected_clients())
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Error getting mqtt client status: {repr(e)}")
+        return
 
+    now = datetime.utcnow()
+    online_status_ids = []
+    offline_workers: Dict[str, User] = {}
+
+    for w in alive_worker_status:
+        if w.worker.username in connected_clients:
+            online_status_ids.append(w.id)
+        # if the woeker is still not connected to the broker
+        elif now - w.check_alive_time > timedelta(minutes=MAX_NOT_ALIVE_TIME):
+            offline_workers[w.worker.username] = w.worker
+
+    if len(online_status_ids) != 0:
+        await WorkerStatus.objects.filter(id__in=online_status_ids).update(
+            check_alive_time=now, updated_date=now
+        )
+
+    if len(offline_workers) == 0:
+        return
+
+    device_levels = (
+        await UserDeviceLevel.objects.select_related("superior")
+        .filter(user__in=list(offline_workers.keys()), superior__isnull=False)
+        .order_by("id")
+        .all()
+    )
+
+    superiors: Dict[str, str] = {}
+    for dl in device_levels:
+        superiors.setdefault(dl.user.username, dl.superior.username)
+
+    for username, superior in superiors.items():
+        publish(
+            f"foxlink/users/{superior}/worker-unusual-offline",
+            {
+                "worker_id": username,
+                "worker_name": offline_workers[username].full_name,
+            },
+            qos=2,
+            retain=True,
+        )
+
+
+@show_duration
 @database.transaction()
 async def overtime_workers_routine():
     """檢查是否有員工超時，如果超時則發送通知"""
@@ -224,6 +257,11 @@ async def auto_close_missions():
 @show_duration
 async def track_worker_status_routine():
     """追蹤員工狀態，視任務狀態而定"""
+    async def update_status(s: WorkerStatus, status: WorkerStatusEnum):
+        # 狀態沒有改變時不寫入，也就不會發出變更通知
+        if s.status != status.value:
+            await s.update(status=status.value)
+
     async def check_routine(s: WorkerStatus):
         working_mission = await get_user_working_mission(s.worker.username)
 
@@ -240,19 +278,19 @@ async def track_worker_status_routine():
         # 返回消防站任務提示
         if working_mission.device.is_rescue:
             if not is_accepted:
-                await s.update(status=WorkerStatusEnum.notice.value)
+                await update_status(s, WorkerStatusEnum.notice)
             else:
-                await s.update(status=WorkerStatusEnum.moving.value)
+                await update_status(s, WorkerStatusEnum.moving)
             return
 
         if working_mission.repair_start_date is not None and working_mission.repair_end_date is None:
-            await s.update(status=WorkerStatusEnum.working.value)
+            await update_status(s, WorkerStatusEnum.working)
             return
 
         if is_accepted:
-            await s.update(status=WorkerStatusEnum.moving.value)
+            await update_status(s, WorkerStatusEnum.moving)
         else:
-            await s.update(status=WorkerStatusEnum.notice.value)
+            await update_status(s, WorkerStatusEnum.notice)
 
 
     worker_status = (
@@ -269,7 +307,7 @@ async def track_worker_status_routine():
     )
 
     promises = [check_routine(s) for s in worker_status]
-    await asyncio.gather(*promises)
+    await gather_with_limit(*promises, database=database)
         
 @show_duration
 async def worker_monitor_routine():
@@ -678,10 +716,13 @@ class FoxlinkBackground:
     def __init__(self):
         for host in FOXLINK_DB_HOSTS:
             self._dbs += [
-                Database(
-                    f"mysql+aiomysql://{FOXLINK_DB_USER}:{FOXLINK_DB_PWD}@{host}",
-                    min_size=5,
-                    max_size=20,
+                instrument_database(
+                    Database(
+                        f"mysql+aiomysql://{FOXLINK_DB_USER}:{FOXLINK_DB_PWD}@{host}",
+                        min_size=FOXLINK_DB_POOL_MIN_SIZE,
+                        max_size=FOXLINK_DB_POOL_MAX_SIZE,
+                    ),
+                    host,
                 )
             ]
         self._ticker = Ticker(self.fetch_events_from_foxlink, 10)
@@ -876,7 +917,10 @@ async def main_routine():
 
     foxlink_daemon = FoxlinkBackground()
 
-    connect_mqtt(MQTT_BROKER, MQTT_PORT, str(uuid.uuid4()))
+    if DAEMON_METRICS_PORT > 0:
+        start_http_server(DAEMON_METRICS_PORT)
+
+    connect_mqtt(MQTT_BROKER, MQTT_PORT, str(uuid.uuid4()), track_presence=True)
     await database.connect()
     if not DISABLE_FOXLINK_DISPATCH:
         await foxlink_daemon.connect()
@@ -892,13 +936,14 @@ async def main_routine():
             await overtime_workers_routine()
             await track_worker_status_routine()
             await check_mission_duration_routine()
-            #await check_alive_worker_routine()
+            await check_alive_worker_routine()
 
             if not DISABLE_FOXLINK_DISPATCH:
                 await dispatch_routine()
 
             end = time.perf_counter()
 
+            ROUTINE_DURATION.labels("main_routine").observe(end - start)
             logger.warning("[main_routine] took %.2f seconds", end - start)
                 
             await asyncio.sleep(1) # idle duration between two loops
@@ -910,7 +955,9 @@ async def main_routine():
     if not DISABLE_FOXLINK_DISPATCH:
         await foxlink_daemon.close()
     await database.disconnect()
+    await flush_mqtt()
     disconnect_mqtt()
+    await emqx_client.close()
     
 
 if __name__ == "__main__":
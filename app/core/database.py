@@ -1,7 +1,16 @@
 from datetime import date, timedelta, datetime
 from typing import Optional, List, ForwardRef
 from enum import Enum
-from ormar import property_field, pre_update
+from ormar import (
+    post_delete,
+    post_relation_add,
+    post_relation_remove,
+    post_save,
+    post_update,
+    property_field,
+    pre_save,
+    pre_update,
+)
 from pydantic import Json
 from sqlalchemy import MetaData, create_engine
 from sqlalchemy.sql import func
@@ -15,12 +24,34 @@ from app.env import (
     DATABASE_USER,
     DATABASE_PASSWORD,
     DATABASE_NAME,
+    DATABASE_POOL_MAX_SIZE,
+    DATABASE_POOL_MIN_SIZE,
+    DATABASE_READ_MAX_STALENESS,
+    DATABASE_READ_POOL_MAX_SIZE,
+    DATABASE_READ_URI,
     PY_ENV,
+    TIMEZONE_OFFSET,
 )
+from app.core.replica import ReplicaRouter, mysql_replica_lag, route_reads
+from app.utils.metrics import instrument_database
 
 DATABASE_URI = f"mysql+aiomysql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
 
-database = databases.Database(DATABASE_URI, max_size=7)
+# 唯讀的 API（`use_read_replica`：統計、日誌、列表等）經由 `route_reads` 使用另一個連線池，不會佔用背景服務寫入所需的連線；設定 DATABASE_READ_URI 時連到 read replica
+read_database = instrument_database(
+    databases.Database(DATABASE_READ_URI or DATABASE_URI, min_size=1, max_size=DATABASE_READ_POOL_MAX_SIZE), "read"
+)
+database = route_reads(
+    instrument_database(
+        databases.Database(DATABASE_URI, min_size=DATABASE_POOL_MIN_SIZE, max_size=DATABASE_POOL_MAX_SIZE), "main"
+    ),
+    # 沒有設定 DATABASE_READ_URI 時讀取池連到同一台資料庫，不需要檢查複寫延遲
+    ReplicaRouter(
+        read_database,
+        DATABASE_READ_MAX_STALENESS,
+        lag=mysql_replica_lag if DATABASE_READ_URI else None,
+    ),
+)
 metadata = MetaData()
 
 MissionRef = ForwardRef("Mission")
@@ -129,7 +160,10 @@ class UserDeviceLevel(ormar.Model):
 
 class MissionEvent(ormar.Model):
     class Meta(MainMeta):
-        constraints = [ormar.UniqueColumns("event_id", "table_name", "mission")]
+        constraints = [
+            ormar.UniqueColumns("event_id", "table_name", "mission"),
+            ormar.IndexColumns("shift_type", "shift_date", name="ix_missionevents_shift_type_shift_date"),
+        ]
 
     id: int = ormar.Integer(primary_key=True)
     mission: MissionRef = ormar.ForeignKey(MissionRef, index=True, ondelete="CASCADE")  # type: ignore
@@ -140,11 +174,18 @@ class MissionEvent(ormar.Model):
     done_verified: bool = ormar.Boolean(default=False)
     event_start_date: Optional[datetime] = ormar.DateTime(nullable=True)
     event_end_date: Optional[datetime] = ormar.DateTime(nullable=True)
+    # 依 event_start_date 計算的班別，於新增時寫入
+    shift_type: Optional[int] = ormar.SmallInteger(nullable=True, choices=list(ShiftType))
+    shift_date: Optional[date] = ormar.Date(nullable=True)
 
 
 class Mission(ormar.Model):
     class Meta(MainMeta):
-        pass
+        constraints = [
+            ormar.IndexColumns("shift_type", "shift_date", name="ix_missions_shift_type_shift_date"),
+            # /missions 依 (created_date, id) 由新到舊分頁
+            ormar.IndexColumns("created_date", "id", name="ix_missions_created_date_id"),
+        ]
 
     id: int = ormar.Integer(primary_key=True, index=True)
     device: Device = ormar.ForeignKey(Device, ondelete="CASCADE")
@@ -157,6 +198,9 @@ class Mission(ormar.Model):
     is_cancel: bool = ormar.Boolean(default=False)
     is_emergency: bool = ormar.Boolean(default=False)
     is_autocanceled: bool = ormar.Boolean(default=False, nullable=False)
+    # 依 created_date 計算的班別，於新增時寫入
+    shift_type: Optional[int] = ormar.SmallInteger(nullable=True, choices=list(ShiftType))
+    shift_date: Optional[date] = ormar.Date(nullable=True)
     created_date: datetime = ormar.DateTime(server_default=func.now(), timezone=True)
     updated_date: datetime = ormar.DateTime(server_default=func.now(), timezone=True)
 
@@ -233,7 +277,7 @@ class LogValue(ormar.Model):
 
 class AuditLogHeader(ormar.Model):
     class Meta(MainMeta):
-        pass
+        constraints = [ormar.IndexColumns("shift_type", "shift_date", name="ix_auditlogheaders_shift_type_shift_date")]
 
     id: int = ormar.Integer(primary_key=True, index=True)
     action: str = ormar.String(
@@ -244,6 +288,9 @@ class AuditLogHeader(ormar.Model):
     user: Optional[User] = ormar.ForeignKey(User, nullable=True, ondelete="SET NULL")
     created_date: datetime = ormar.DateTime(server_default=func.now(), timezone=True)
     description: Optional[str] = ormar.String(max_length=256, nullable=True)
+    # 依 created_date 計算的班別，於新增時寫入
+    shift_type: Optional[int] = ormar.SmallInteger(nullable=True, choices=list(ShiftType))
+    shift_date: Optional[date] = ormar.Date(nullable=True)
 
 
 LogValue.update_forward_refs()
@@ -287,6 +334,140 @@ class WhitelistDevice(ormar.Model):
     created_date: datetime = ormar.DateTime(server_default=func.now(), timezone=True)
     updated_date: datetime = ormar.DateTime(server_default=func.now(), timezone=True)
 
+
+class WorkerDailyStat(ormar.Model):
+    """員工每日（當地日期）的接受/拒絕任務次數與上下班時間，於寫入 AuditLogHeader 時同步更新。"""
+
+    class Meta(MainMeta):
+        tablename = "worker_daily_stats"
+        constraints = [ormar.UniqueColumns("user", "day", name="uc_worker_daily_stats_user_day")]
+
+    id: int = ormar.Integer(primary_key=True)
+    user: User = ormar.ForeignKey(User, ondelete="CASCADE", nullable=False)
+    day: date = ormar.Date()
+    accepted_count: int = ormar.Integer(default=0)
+    rejected_count: int = ormar.Integer(default=0)
+    login_count: int = ormar.Integer(default=0)
+    first_login_date: Optional[datetime] = ormar.DateTime(nullable=True, timezone=True)
+    last_logout_date: Optional[datetime] = ormar.DateTime(nullable=True, timezone=True)
+    last_logout_reason: Optional[str] = ormar.String(max_length=256, nullable=True)
+
+
 @pre_update([Device, FactoryMap, Mission, UserDeviceLevel, WorkerStatus, WhitelistDevice])
 async def before_update(sender, instance, **kwargs):
     instance.updated_date = datetime.utcnow()
+
+
+@post_save([Mission, MissionEvent, WorkerStatus])
+@post_update([Mission, MissionEvent, WorkerStatus])
+@post_delete([Mission])
+@post_relation_add([Mission])
+@post_relation_remove([Mission])
+async def notify_workshop_stream(sender, instance, **kwargs):
+    """任務、任務事件、員工狀態改變時發出變更通知，讓 API 推送給訂閱該車間的客戶端。"""
+    # imported here to avoid circular import
+    from app.mqtt.changes import notify_mission_changed, notify_worker_changed
+
+    if sender is Mission:
+        notify_mission_changed(instance.id)
+    elif sender is MissionEvent:
+        if instance.mission is not None:
+            notify_mission_changed(instance.mission.pk)
+    elif instance.worker is not None:
+        notify_worker_changed(instance.worker.pk)
+
+
+@pre_save([Mission, MissionEvent, AuditLogHeader])
+async def fill_shift_bucket(sender, instance, **kwargs):
+    """新增資料時寫入所屬班別（shift_type, shift_date），讓依班別篩選的統計可以走索引。"""
+    # imported here to avoid circular import
+    from app.utils.utils import get_shift_date_by_datetime, get_shift_type_by_datetime
+
+    if sender is MissionEvent:
+        # event_start_date is stored in local time
+        if instance.event_start_date is None:
+            return
+        dt = instance.event_start_date - timedelta(hours=TIMEZONE_OFFSET)
+    else:
+        dt = instance.created_date if instance.created_date is not None else datetime.utcnow()
+
+    instance.shift_type = get_shift_type_by_datetime(dt).value
+    instance.shift_date = get_shift_date_by_datetime(dt)
+
+
+# 同一天重複寫入時累加次數，並保留最早的登入與最晚的登出時間；last_logout_reason 須在 last_logout_date 之前更新
+# 使用 MySQL 8.0.19 起支援的 row alias（new），VALUES() 在 8.0.20 之後已棄用
+WORKER_DAILY_STAT_UPSERT = """
+INSERT INTO worker_daily_stats
+    (user, day, accepted_count, rejected_count, login_count, first_login_date, last_logout_date, last_logout_reason)
+VALUES
+    (:user, :day, :accepted_count, :rejected_count, :login_count, :first_login_date, :last_logout_date, :last_logout_reason)
+AS new
+ON DUPLICATE KEY UPDATE
+    accepted_count = accepted_count + new.accepted_count,
+    rejected_count = rejected_count + new.rejected_count,
+    login_count = login_count + new.login_count,
+    first_login_date = IF(first_login_date IS NULL OR new.first_login_date < first_login_date, new.first_login_date, first_login_date),
+    last_logout_reason = IF(last_logout_date IS NULL OR new.last_logout_date >= last_logout_date, new.last_logout_reason, last_logout_reason),
+    last_logout_date = IF(last_logout_date IS NULL OR new.last_logout_date >= last_logout_date, new.last_logout_date, last_logout_date)
+"""
+
+
+def worker_daily_stat_values(action: str, username: str, created_date: datetime, description: Optional[str]) -> Optional[dict]:
+    """將一筆 AuditLogHeader 轉換為 `WORKER_DAILY_STAT_UPSERT` 的參數，不影響每日統計的紀錄回傳 None。
+
+    Args:
+    - action: AuditLogHeader 的 action
+    - username: AuditLogHeader 的 user
+    - created_date: AuditLogHeader 的建立時間 (UTC)
+    - description: AuditLogHeader 的 description，登出時為登出原因
+    """
+    # imported here to avoid circular import
+    from app.utils.utils import get_local_date_by_datetime
+
+    if action not in (
+        AuditActionEnum.MISSION_ACCEPTED.value,
+        AuditActionEnum.MISSION_REJECTED.value,
+        AuditActionEnum.USER_LOGIN.value,
+        AuditActionEnum.USER_LOGOUT.value,
+    ):
+        return None
+
+    is_logout = action == AuditActionEnum.USER_LOGOUT.value
+
+    return {
+        "user": username,
+        "day": get_local_date_by_datetime(created_date),
+        "accepted_count": int(action == AuditActionEnum.MISSION_ACCEPTED.value),
+        "rejected_count": int(action == AuditActionEnum.MISSION_REJECTED.value),
+        "login_count": int(action == AuditActionEnum.USER_LOGIN.value),
+        "first_login_date": created_date if action == AuditActionEnum.USER_LOGIN.value else None,
+        "last_logout_date": created_date if is_logout else None,
+        "last_logout_reason": description if is_logout else None,
+    }
+
+
+@post_save(AuditLogHeader)
+async def count_worker_daily_stat(sender, instance, **kwargs):
+    """新增登入、登出、接受/拒絕任務的紀錄時更新 worker_daily_stats，讓 /users/info、/users/worker-attendance 只需查詢索引。"""
+    if instance.user is None:
+        return
+
+    values = worker_daily_stat_values(
+        instance.action,
+        instance.user.pk,
+        instance.created_date if instance.created_date is not None else datetime.utcnow(),
+        instance.description,
+    )
+
+    if values is None:
+        return
+
+    # 同一任務重複接受/拒絕只計算一次
+    if values["accepted_count"] or values["rejected_count"]:
+        if await AuditLogHeader.objects.filter(
+            action=instance.action, user=instance.user.pk, record_pk=instance.record_pk, id__lt=instance.id
+        ).exists():
+            return
+
+    await database.execute(WORKER_DAILY_STAT_UPSERT, values)
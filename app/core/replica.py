@@ -0,0 +1,233 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+from databases import Database
+from pymysql.err import ProgrammingError
+from app.core.transaction import TransactionCallbacks
+from app.my_log_conf import LOGGER_NAME
+from app.utils.metrics import DB_REPLICA_READS
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# 目前的請求是否為唯讀、可以改由 read replica 回應
+prefer_replica: ContextVar[bool] = ContextVar("prefer_replica", default=False)
+
+ReplicaLag = Callable[[Database], Awaitable[Optional[float]]]
+
+
+# replica 不支援 `SHOW REPLICA STATUS`（MySQL 8.0.22 以前）時改用舊的語法
+_legacy_replica_status = False
+
+
+async def mysql_replica_lag(replica: Database) -> Optional[float]:
+    """回傳 MySQL replica 落後 source 的秒數，若不是 replica 或複寫已中斷則回傳 None。
+
+    MySQL 8.0.22 起使用 `SHOW REPLICA STATUS` 與 `Seconds_Behind_Source`，較舊的版本改用 `SHOW SLAVE STATUS` 與 `Seconds_Behind_Master`。
+    """
+    global _legacy_replica_status
+
+    row = None
+    if not _legacy_replica_status:
+        try:
+            row = await replica.fetch_one("SHOW REPLICA STATUS")
+        except ProgrammingError:
+            _legacy_replica_status = True
+
+    if _legacy_replica_status:
+        row = await replica.fetch_one("SHOW SLAVE STATUS")
+
+    if row is None:
+        return None
+
+    status = row._mapping
+    lag = status["Seconds_Behind_Source"] if "Seconds_Behind_Source" in status else status["Seconds_Behind_Master"]
+    return None if lag is None else float(lag)
+
+
+class ReplicaRouter:
+    """決定唯讀查詢要送到 replica 還是 primary。
+
+    replica 落後超過 `max_staleness` 秒、無法取得連線，或無法查詢落後秒數時，改用 primary；
+    取得連線失敗後 `retry_after` 秒內不再嘗試 replica。
+    """
+
+    def __init__(
+        self,
+        replica: Database,
+        max_staleness: float,
+        lag: Optional[ReplicaLag] = None,
+        lag_check_interval: float = 2,
+        retry_after: float = 30,
+    ):
+        self.replica = replica
+        self.max_staleness = max_staleness
+        self.lag = lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_after = retry_after
+        self.staleness: Optional[float] = 0
+        self._checked_at = float("-inf")
+        self._retry_at = float("-inf")
+
+    async def is_usable(self) -> bool:
+        now = time.monotonic()
+
+        if now < self._retry_at:
+            return False
+
+        if self.lag is None:
+            return True
+
+        if now - self._checked_at >= self.lag_check_interval:
+            self._checked_at = now
+            try:
+                self.staleness = await self.lag(self.replica)
+            except Exception as e:
+                logger.warning(f"cannot check the lag of the read replica: {repr(e)}")
+                self.staleness = None
+
+        return self.staleness is not None and self.staleness <= self.max_staleness
+
+    def mark_failed(self):
+        self._retry_at = time.monotonic() + self.retry_after
+
+
+class RoutingTransaction:
+    """databases 在取得連線之前就會建立 transaction，因此等到 start 時才向實際取得的連線建立。
+
+    transaction 進行期間關閉 `prefer_replica`，transaction 的連線與區塊中的查詢都使用 primary；
+    區塊中以 `after_commit` 登記的函式在 commit 之後才執行。
+    """
+
+    def __init__(self, connection: "RoutingConnection"):
+        self._routing_connection = connection
+        self._transaction = None
+        self._callbacks: Optional[TransactionCallbacks] = None
+        self._prefer_replica = prefer_replica.get()
+        prefer_replica.set(False)
+
+    async def start(self, is_root: bool, extra_options: Dict[Any, Any]):
+        if self._routing_connection._on_replica:
+            # 只會發生在 `database.connection()` 區塊中已經取得 replica 連線後才開始 transaction
+            prefer_replica.set(self._prefer_replica)
+            raise RuntimeError("cannot start a transaction on the read replica connection")
+
+        self._transaction = self._routing_connection._connection.transaction()
+        self._callbacks = TransactionCallbacks()
+        try:
+            await self._transaction.start(is_root=is_root, extra_options=extra_options)
+        except Exception:
+            self._callbacks.rollback()
+            raise
+
+    async def commit(self):
+        assert self._callbacks is not None
+        try:
+            await self._transaction.commit()
+        except Exception:
+            self._callbacks.rollback()
+            raise
+        finally:
+            prefer_replica.set(self._prefer_replica)
+
+        self._callbacks.commit()
+
+    async def rollback(self):
+        assert self._callbacks is not None
+        try:
+            await self._transaction.rollback()
+        finally:
+            self._callbacks.rollback()
+            prefer_replica.set(self._prefer_replica)
+
+
+class RoutingConnection:
+    """在每次取得連線時，依 `prefer_replica` 與 replica 的狀態選擇 replica 或 primary 的連線。
+
+    transaction 一律使用 primary 的連線。
+    """
+
+    def __init__(self, primary_backend, router: ReplicaRouter):
+        self._primary_backend = primary_backend
+        self._router = router
+        self._connection = None
+        self._on_replica = False
+
+    def __getattr__(self, name: str) -> Any:
+        if self._connection is None:
+            raise AttributeError(name)
+        return getattr(self._connection, name)
+
+    def transaction(self) -> RoutingTransaction:
+        return RoutingTransaction(self)
+
+    async def acquire(self):
+        if prefer_replica.get() and await self._router.is_usable():
+            connection = self._router.replica._backend.connection()
+            try:
+                await connection.acquire()
+                self._connection = connection
+                self._on_replica = True
+                DB_REPLICA_READS.labels("replica").inc()
+                return
+            except Exception as e:
+                logger.warning(f"cannot connect to the read replica, falling back to primary: {repr(e)}")
+                self._router.mark_failed()
+
+        connection = self._primary_backend.connection()
+        await connection.acquire()
+        self._connection = connection
+        self._on_replica = False
+
+        if prefer_replica.get():
+            DB_REPLICA_READS.labels("primary").inc()
+
+    async def release(self):
+        connection, self._connection = self._connection, None
+        self._on_replica = False
+        await connection.release()
+
+
+class RoutingBackend:
+    def __init__(self, backend, router: ReplicaRouter):
+        self._backend = backend
+        self._router = router
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._backend, name)
+
+    def connection(self):
+        return RoutingConnection(self._backend, self._router)
+
+
+def route_reads(database: Database, router: ReplicaRouter) -> Database:
+    """讓資料庫在 `read_replica()` 區塊中（或使用 `use_read_replica` 的 API）改由 replica 執行查詢。
+
+    Args:
+    - database: primary 資料庫，ormar model 所使用的資料庫
+    - router: 判斷 replica 是否可用的 router
+    """
+    if not isinstance(database._backend, RoutingBackend):
+        database._backend = RoutingBackend(database._backend, router)  # type: ignore
+    return database
+
+
+@contextmanager
+def read_replica() -> Iterator[None]:
+    """區塊中的查詢都是唯讀的，可以容許 replica 最多 `DATABASE_READ_MAX_STALENESS` 秒的延遲。"""
+    token = prefer_replica.set(True)
+    try:
+        yield
+    finally:
+        prefer_replica.reset(token)
+
+
+async def use_read_replica():
+    """FastAPI dependency，用於唯讀且可容許些微延遲的 API（統計、日誌、列表等）。"""
+    prefer_replica.set(True)
+    try:
+        yield
+    finally:
+        # 回應送出後才會執行，可能不在同一個 context 中，因此不使用 reset(token)
+        prefer_replica.set(False)
@@ -0,0 +1,58 @@
+import logging
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+from app.my_log_conf import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# 目前 transaction 中登記、要在 commit 之後執行的函式，不在 transaction 中時為 None
+_after_commit: ContextVar[Optional[List[Callable[[], None]]]] = ContextVar("after_commit", default=None)
+
+
+def after_commit(callback: Callable[[], None]):
+    """在目前的 transaction commit 之後執行 callback，rollback 時不執行；不在 transaction 中時立即執行。
+
+    用於發出通知等，讓收到通知的一方不會讀到尚未 commit 的資料。
+    """
+    callbacks = _after_commit.get()
+
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+class TransactionCallbacks:
+    """一個 transaction（或巢狀的 savepoint）期間以 `after_commit` 登記的函式。
+
+    必須在 transaction 所在的 context 中建立與結束。
+    """
+
+    def __init__(self):
+        callbacks = _after_commit.get()
+        self.is_root = callbacks is None
+
+        if callbacks is None:
+            callbacks = []
+            _after_commit.set(callbacks)
+
+        self._callbacks = callbacks
+        self._start = len(callbacks)
+
+    def commit(self):
+        # a savepoint is released into the outer transaction, its callbacks wait for the outer commit
+        if not self.is_root:
+            return
+
+        _after_commit.set(None)
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"after commit callback failed: {repr(e)}")
+
+    def rollback(self):
+        if self.is_root:
+            _after_commit.set(None)
+        else:
+            del self._callbacks[self._start:]
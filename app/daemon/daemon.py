@@ -3,9 +3,13 @@ from typing import Dict, List
 from databases import Database
 from app.env import (
     FOXLINK_DB_HOSTS,
+    FOXLINK_DB_POOL_MAX_SIZE,
+    FOXLINK_DB_POOL_MIN_SIZE,
     FOXLINK_DB_USER,
     FOXLINK_DB_PWD,
 )
+from app.utils.metrics import instrument_database
+from app.utils.utils import gather_with_limit
 
 
 class FoxlinkDbPool:
@@ -14,7 +18,14 @@ class FoxlinkDbPool:
     def __init__(self):
         for host in FOXLINK_DB_HOSTS:
             self._dbs += [
-                Database(f"mysql://{FOXLINK_DB_USER}:{FOXLINK_DB_PWD}@{host}")
+                instrument_database(
+                    Database(
+                        f"mysql://{FOXLINK_DB_USER}:{FOXLINK_DB_PWD}@{host}",
+                        min_size=FOXLINK_DB_POOL_MIN_SIZE,
+                        max_size=FOXLINK_DB_POOL_MAX_SIZE,
+                    ),
+                    host,
+                )
             ]
 
     async def get_device_cname(self, workshop_name: str):
@@ -48,7 +59,7 @@ class FoxlinkDbPool:
                 {"project": p},
             )
 
-        resp = await asyncio.gather(*(worker(p[0]) for p in project_names))
+        resp = await gather_with_limit(*(worker(p[0]) for p in project_names), database=main_db)
 
         device_infos = {}
 
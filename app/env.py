@@ -41,21 +41,63 @@ DATABASE_PORT = get_env("DATABASE_PORT", int)
 DATABASE_USER = get_env("DATABASE_USER", str)
 DATABASE_PASSWORD = get_env("DATABASE_PASSWORD", str)
 DATABASE_NAME = get_env("DATABASE_NAME", str)
+# 主資料庫（寫入用）連線池的大小
+DATABASE_POOL_MIN_SIZE = get_env("DATABASE_POOL_MIN_SIZE", int, 1)
+DATABASE_POOL_MAX_SIZE = get_env("DATABASE_POOL_MAX_SIZE", int, 7)
+# 統計、日誌等讀取用資料庫的 URI（例如 read replica），未設定時連到主資料庫，但使用另一個連線池
+DATABASE_READ_URI = get_env("DATABASE_READ_URI", str, "")
+DATABASE_READ_POOL_MAX_SIZE = get_env("DATABASE_READ_POOL_MAX_SIZE", int, 5)
+# read replica 最多可落後 primary 幾秒，超過時唯讀 API 改回 primary 查詢
+DATABASE_READ_MAX_STALENESS = get_env("DATABASE_READ_MAX_STALENESS", float, 5.0)
+# 一次 fan-out（asyncio.gather）中同時查詢資料庫的協程數量上限，應小於連線池大小，讓其他工作仍有連線可用
+DATABASE_FANOUT_LIMIT = get_env("DATABASE_FANOUT_LIMIT", int, 4)
 PY_ENV = get_env("PY_ENV", str, "production")
 
 FOXLINK_DB_HOSTS = get_env("FOXLINK_DB_HOSTS", List[str])
 FOXLINK_DB_USER = get_env("FOXLINK_DB_USER", str)
 FOXLINK_DB_PWD = get_env("FOXLINK_DB_PWD", str)
 FOXLINK_DB_NAME = get_env("FOXLINK_DB_NAME", str, "aoi")
+# 每個正崴資料庫連線池的大小
+FOXLINK_DB_POOL_MIN_SIZE = get_env("FOXLINK_DB_POOL_MIN_SIZE", int, 5)
+FOXLINK_DB_POOL_MAX_SIZE = get_env("FOXLINK_DB_POOL_MAX_SIZE", int, 20)
 
 JWT_SECRET = get_env("JWT_SECRET", str, "secret")
+# 驗證 API 請求時，使用者資料的快取時間，設為 0 則每個請求都查詢資料庫
+AUTH_PRINCIPAL_CACHE_TTL = get_env("AUTH_PRINCIPAL_CACHE_TTL", int, 10)  # unit: seconds
+# 主管的各層下屬名單快取時間，匯入員工資料時會清除
+SUBORDINATES_CACHE_TTL = get_env("SUBORDINATES_CACHE_TTL", int, 300)  # unit: seconds
+# 車間員工技能總覽（/users/overview）的快取時間，匯入員工或機台資料、更新使用者時會清除
+USERS_OVERVIEW_CACHE_TTL = get_env("USERS_OVERVIEW_CACHE_TTL", int, 3600)  # unit: seconds
 
 # MQTT
 MQTT_BROKER = get_env("MQTT_BROKER", str)
 MQTT_PORT = get_env("MQTT_PORT", int, 1883)
+# 待發送 MQTT 訊息佇列的長度上限，已滿時新的訊息會被捨棄
+MQTT_PUBLISH_QUEUE_SIZE = get_env("MQTT_PUBLISH_QUEUE_SIZE", int, 1000)
+# 同時等待 broker 確認的 MQTT 訊息數量上限
+MQTT_MAX_INFLIGHT = get_env("MQTT_MAX_INFLIGHT", int, 20)
+
+# 背景服務提供 Prometheus metrics 的 port，設為 0 則不啟用
+DAEMON_METRICS_PORT = get_env("DAEMON_METRICS_PORT", int, 9464)
+# Prometheus 抓取 API 的 /metrics 時須帶上的 Bearer token，未設定則不提供 /metrics
+METRICS_TOKEN = get_env("METRICS_TOKEN", str, "")
+
+# 是否分析每個 API 請求與背景 routine 的 SQL 查詢（會增加負擔，僅供除錯使用）
+SQL_PROFILER = get_env("SQL_PROFILER", bool, False)
+# 保留最近幾筆 SQL 分析結果
+SQL_PROFILER_HISTORY = get_env("SQL_PROFILER_HISTORY", int, 100)
+# 同一個查詢在一次請求/routine 中執行幾次以上視為 N+1 查詢
+SQL_PROFILER_N_PLUS_ONE = get_env("SQL_PROFILER_N_PLUS_ONE", int, 10)
 # EMQX default admin account is (username: admin, password: public)
 EMQX_USERNAME = get_env("EMQX_USERNAME", str, "admin")
 EMQX_PASSWORD = get_env("EMQX_PASSWORD", str, "public")
+EMQX_API_PORT = get_env("EMQX_API_PORT", int, 18083)
+# 同時向 EMQX API 發出的請求數量上限
+EMQX_MAX_CONCURRENCY = get_env("EMQX_MAX_CONCURRENCY", int, 8)
+# 員工在線名單的快取時間
+PRESENCE_CACHE_TTL = get_env("PRESENCE_CACHE_TTL", int, 5)  # unit: seconds
+# 以 broker 連線/斷線事件追蹤員工在線狀態時，多久以 EMQX API 校正一次
+PRESENCE_RESYNC_INTERVAL = get_env("PRESENCE_RESYNC_INTERVAL", int, 300)  # unit: seconds
 
 # Factory related configs
 # Day shift: 07:40 ~ 19:40, Night shift: 19:40 ~ 07:40
@@ -81,6 +123,45 @@ WHITELIST_MINIMUM_OCCUR_COUNT = get_env("WHITELIST_MINIMUM_OCCUR_COUNT", int, 35
 # 取消自動派工
 DISABLE_FOXLINK_DISPATCH = get_env("DISABLE_FOXLINK_DISPATCH", bool, False)
 
+# 統計資料快取時間，設為 0 則停用快取
+STATISTICS_CACHE_TTL = get_env("STATISTICS_CACHE_TTL", int, 10)  # unit: seconds
+
+# 車間機台狀態快取時間，設為 0 則停用快取
+DEVICE_STATUS_CACHE_TTL = get_env("DEVICE_STATUS_CACHE_TTL", int, 3)  # unit: seconds
+
+# 繪製車間圖所使用的 thread 數量
+IMAGE_RENDER_WORKERS = get_env("IMAGE_RENDER_WORKERS", int, 2)
+
+# 計算、驗證密碼 bcrypt hash 所使用的 thread 數量
+PASSWORD_HASH_WORKERS = get_env("PASSWORD_HASH_WORKERS", int, 4)
+
+# 每個車間最多快取幾種不同尺寸（maxImgValue）的車間圖
+IMAGE_RENDER_VARIANTS = get_env("IMAGE_RENDER_VARIANTS", int, 4)
+
+# 產生機台 QRCode 所使用的 process 數量
+QRCODE_WORKERS = get_env("QRCODE_WORKERS", int, 2)
+
+# 每個 process 一次產生幾個機台的 QRCode
+QRCODE_CHUNK_SIZE = get_env("QRCODE_CHUNK_SIZE", int, 50)
+
+# 產生好的車間 QRCode zip 最多快取多少 bytes，超過時移除最久未使用的車間
+QRCODE_ZIP_CACHE_MAX_BYTES = get_env("QRCODE_ZIP_CACHE_MAX_BYTES", int, 64 * 1024 * 1024)
+
+# /missions 分頁時每頁最多回傳幾筆任務
+MISSIONS_PAGE_MAX_SIZE = get_env("MISSIONS_PAGE_MAX_SIZE", int, 500)
+
+# 車間即時推送：每個連線最多暫存幾則未送出的訊息，超過時要求客戶端重新同步
+WORKSHOP_STREAM_QUEUE_SIZE = get_env("WORKSHOP_STREAM_QUEUE_SIZE", int, 100)
+
+# 車間即時推送：合併多少秒內的變更後再一次查詢、推送
+WORKSHOP_STREAM_BATCH_INTERVAL = get_env("WORKSHOP_STREAM_BATCH_INTERVAL", float, 0.5)
+
+# 車間即時推送：沒有變更時每幾秒送出一次 keepalive
+WORKSHOP_STREAM_KEEPALIVE = get_env("WORKSHOP_STREAM_KEEPALIVE", int, 15)
+
+# 車間即時推送：連線用 token 的有效秒數
+WORKSHOP_STREAM_TOKEN_EXPIRE_SECONDS = get_env("WORKSHOP_STREAM_TOKEN_EXPIRE_SECONDS", int, 60)
+
 
 if os.environ.get("USE_ALEMBIC") is None:
     if PY_ENV not in ["production", "dev"]:
@@ -1,9 +1,11 @@
+import asyncio
 import logging
 from fastapi import FastAPI
 from app.env import MQTT_BROKER, MQTT_PORT, PY_ENV
 from logging.config import dictConfig
 from app.routes import (
     health,
+    metrics,
     migration,
     test,
     user,
@@ -14,11 +16,17 @@ from app.routes import (
     device,
     workshop,
 )
-from app.core.database import database
-from app.mqtt.main import connect_mqtt, disconnect_mqtt
+from app.core.database import database, read_database
+from app.mqtt.main import connect_mqtt, disconnect_mqtt, flush_mqtt
+from app.mqtt.changes import CACHE_INVALIDATION_TOPIC, CHANGES_TOPIC, cache_invalidation_handler
+from app.mqtt.emqx import emqx_client
 from app.my_log_conf import LOGGER_NAME, LogConfig
 from fastapi.middleware.cors import CORSMiddleware
 from app.foxlink_db import foxlink_db
+from app.utils.metrics import MetricsMiddleware
+from app.utils.profiler import ProfilerMiddleware
+from app.services.workshop import shutdown_qrcode_pool
+from app.services.workshop_stream import workshop_stream_hub
 import uuid
 
 
@@ -37,6 +45,9 @@ origins = [
     "http://ntust.foxlink.com.tw",
 ]
 
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -44,10 +55,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Adding routers
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(user.router)
 app.include_router(auth.router)
 app.include_router(mission.router)
@@ -62,14 +75,30 @@ if PY_ENV == 'dev':
 
 @app.on_event("startup")
 async def startup():
-    connect_mqtt(MQTT_BROKER, MQTT_PORT, str(uuid.uuid4()))
+    workshop_stream_hub.start()
+    connect_mqtt(
+        MQTT_BROKER,
+        MQTT_PORT,
+        str(uuid.uuid4()),
+        track_presence=True,
+        handlers={
+            CHANGES_TOPIC: workshop_stream_hub.handle_change,
+            CACHE_INVALIDATION_TOPIC: cache_invalidation_handler(asyncio.get_running_loop()),
+        },
+    )
     await database.connect()
+    await read_database.connect()
     await foxlink_db.connect()
     logger.info("Foxlink API Server startup complete.")
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await workshop_stream_hub.stop()
     await foxlink_db.close()
+    await read_database.disconnect()
     await database.disconnect()
+    await flush_mqtt()
     disconnect_mqtt()
+    await emqx_client.close()
+    shutdown_qrcode_pool()
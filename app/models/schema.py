@@ -159,6 +159,7 @@ class WorkerStatusDto(BaseModel):
     total_dispatches: int
     mission_duration: Optional[float]
     repair_duration: Optional[float]
+    is_online: Optional[bool]
 
 
 class ImportDevicesOut(BaseModel):
@@ -280,4 +281,8 @@ class WhitelistRecommendDevice(BaseModel):
 
 class DeviceDispatchableWorker(BaseModel):
     username: str
-    full_name: str
\ No newline at end of file
+    full_name: str
+
+class WorkshopStreamToken(BaseModel):
+    token: str
+    expires_in: int
\ No newline at end of file
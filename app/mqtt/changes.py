@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, TypeVar, Union
+import orjson
+from app.core.transaction import after_commit
+from app.my_log_conf import LOGGER_NAME
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(LOGGER_NAME)
+
+V = TypeVar("V")
+
+# API 與背景服務修改任務、員工狀態時發出的變更通知，由 API 轉為車間即時推送（`app.services.workshop_stream`）
+CHANGES_TOPIC = "foxlink/backend/changes"
+
+# 清除快取的通知：每個 API process 各有一份快取，修改資料的 process 需要通知其他 process 一起清除
+CACHE_INVALIDATION_TOPIC = "foxlink/backend/cache-invalidations"
+
+# 可以跨 process 清除的快取（名稱 → 快取）
+shared_caches: Dict[str, TTLCache] = {}
+
+
+def notify(topic: str, payload: Dict[str, Any]):
+    # imported here to avoid circular import
+    from app.mqtt.main import publish
+
+    try:
+        publish(topic, payload, qos=1)
+    except Exception as e:
+        logger.debug(f"cannot publish to {topic}: {repr(e)}")
+
+
+def notify_change(kind: str, key: Union[int, str]):
+    """發出變更通知，只用於即時推送，發送失敗（例如尚未連線到 MQTT broker）不影響資料寫入。
+
+    在 transaction 中時等到 commit 之後才發出，收到通知的 API 才會讀到變更後的資料。
+
+    Args:
+    - kind: 變更的種類，`mission` 或 `worker`
+    - key: 任務 id 或員工 username
+    """
+    after_commit(lambda: notify(CHANGES_TOPIC, {"kind": kind, "key": key}))
+
+
+def notify_mission_changed(mission_id: int):
+    notify_change("mission", mission_id)
+
+
+def notify_worker_changed(username: str):
+    notify_change("worker", username)
+
+
+def share_cache(name: str, cache: TTLCache[V]) -> TTLCache[V]:
+    """讓快取可以用 `invalidate_shared_cache` 在所有 API process 中清除。"""
+    shared_caches[name] = cache
+    return cache
+
+
+def invalidate_shared_cache(name: str, key: Optional[Union[int, str]] = None):
+    """清除這個 process 的快取，並通知其他 API process 清除。
+
+    Args:
+    - name: `share_cache` 時的名稱
+    - key: 要清除的 key，None 代表清除全部
+    """
+    shared_caches[name].invalidate(key)
+    notify(CACHE_INVALIDATION_TOPIC, {"name": name, "key": key})
+
+
+def cache_invalidation_handler(loop: asyncio.AbstractEventLoop) -> Callable[[bytes], None]:
+    """產生處理清除快取通知的 MQTT handler（在 paho 的 thread 中呼叫），快取會在 loop 中清除。"""
+
+    def handle(payload: bytes):
+        try:
+            message = orjson.loads(payload)
+            cache = shared_caches[message["name"]]
+        except Exception:
+            logger.warning(f"invalid cache invalidation: {payload!r}")
+            return
+
+        loop.call_soon_threadsafe(cache.invalidate, message.get("key"))
+
+    return handle
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import aiohttp
+from typing import Any, Dict, List, Optional, Tuple
+from app.env import (
+    EMQX_API_PORT,
+    EMQX_MAX_CONCURRENCY,
+    EMQX_PASSWORD,
+    EMQX_USERNAME,
+    MQTT_BROKER,
+    PRESENCE_CACHE_TTL,
+)
+from app.my_log_conf import LOGGER_NAME
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(LOGGER_NAME)
+
+ClientInfo = Dict[str, Any]
+
+
+class EmqxClient:
+    """EMQX HTTP API client，共用同一個連線池，並限制同時發出的請求數量。
+
+    `list_connected_clients` 會一次取得所有在線的 client，結果會快取 `presence_ttl` 秒，
+    讓同一段時間內的在線檢查共用同一份結果。
+
+    Args:
+    - base_url: EMQX dashboard/API 的位址，例如 http://127.0.0.1:18083
+    - username: EMQX API 帳號
+    - password: EMQX API 密碼
+    - max_concurrency: 最多同時發出的請求數量
+    - presence_ttl: 在線名單快取的秒數
+    - page_size: 每次分頁取得的 client 數量
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        max_concurrency: int = 8,
+        presence_ttl: float = 5,
+        page_size: int = 500,
+        timeout: float = 5,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.auth = aiohttp.BasicAuth(login=username, password=password)
+        self.max_concurrency = max_concurrency
+        self.page_size = page_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.presence_cache: TTLCache[Dict[str, ClientInfo]] = TTLCache(presence_ttl, maxsize=1)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # the session must be created inside a running event loop, so create it on first use.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=self.auth,
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        session = self.session
+        assert self._semaphore is not None
+
+        async with self._semaphore:
+            async with session.get(f"{self.base_url}{path}", params=params) as resp:
+                resp.raise_for_status()
+                return await resp.json()
+
+    async def get_client(self, client_id: str) -> Optional[ClientInfo]:
+        """取得單一 client 的連線資訊，沒有連線紀錄則回傳 None。"""
+        content = await self.get(f"/api/v4/clients/{client_id}")
+
+        if len(content["data"]) == 0:
+            return None
+
+        return content["data"][0]
+
+    async def fetch_connected_clients(self) -> Dict[str, ClientInfo]:
+        """分頁取得所有在線的 client，第一頁之後的分頁會同時發出。"""
+        first_page = await self.get("/api/v4/clients", {"_page": 1, "_limit": self.page_size})
+        pages: List[Dict[str, Any]] = [first_page]
+
+        count = first_page.get("meta", {}).get("count", len(first_page["data"]))
+        page_count = -(-count // self.page_size)
+
+        if page_count > 1:
+            pages += await asyncio.gather(
+                *[
+                    self.get("/api/v4/clients", {"_page": p, "_limit": self.page_size})
+                    for p in range(2, page_count + 1)
+                ]
+            )
+
+        return {
+            c["clientid"]: c
+            for page in pages
+            for c in page["data"]
+            if c.get("connected", True)
+        }
+
+    async def list_connected_clients(self) -> Dict[str, ClientInfo]:
+        """取得所有在線的 client（以 client ID 為 key），結果會被短暫快取。"""
+        return await self.presence_cache.get_or_set("clients", self.fetch_connected_clients)
+
+    async def check_connected(self, client_id: str) -> Tuple[bool, Optional[str]]:
+        """檢查 client 是否在線，有快取的在線名單時直接使用，否則查詢單一 client。
+
+        Returned:
+            - connected: bool - True if connected, False otherwise
+            - ip_address: str - if user is connected, this field represents the IP address of the client
+        """
+        clients = self.presence_cache.get("clients")
+
+        if clients is not None:
+            c = clients.get(client_id)
+        else:
+            c = await self.get_client(client_id)
+
+        if c is None or not c.get("connected", False):
+            return False, None
+
+        return True, c.get("ip_address")
+
+
+emqx_client = EmqxClient(
+    f"http://{MQTT_BROKER}:{EMQX_API_PORT}",
+    EMQX_USERNAME,
+    EMQX_PASSWORD,
+    max_concurrency=EMQX_MAX_CONCURRENCY,
+    presence_ttl=PRESENCE_CACHE_TTL,
+)
@@ -1,47 +1,117 @@
-import datetime
+import asyncio
+from typing import Callable, Dict, Optional
 from paho.mqtt import client
-import json
 import logging
 from app.my_log_conf import LOGGER_NAME
+from app.env import MQTT_MAX_INFLIGHT, MQTT_PUBLISH_QUEUE_SIZE
+from app.mqtt.presence import CONNECTED_TOPIC, DISCONNECTED_TOPIC, presence_map, sync_presence
+from app.mqtt.publisher import MqttPublisher, encode_payload
 
 logger = logging.getLogger(LOGGER_NAME)
-mqtt_client: client.Client
+mqtt_client: Optional[client.Client] = None
+publisher = MqttPublisher(max_queue=MQTT_PUBLISH_QUEUE_SIZE, max_inflight=MQTT_MAX_INFLIGHT)
 
 
-def connect_mqtt(broker: str, port: int, client_id: str):
+def connect_mqtt(
+    broker: str,
+    port: int,
+    client_id: str,
+    track_presence: bool = False,
+    handlers: Optional[Dict[str, Callable[[bytes], None]]] = None,
+):
     """連線到MQTT broker
 
     Args:
     - broker: MQTT broker URI
     - port: MQTT broker port
     - client_id: MQTT client ID
+    - track_presence: 是否訂閱 broker 的連線/斷線事件，用來維護員工的在線狀態（`presence_map`）
+    - handlers: 要訂閱的 topic 與收到訊息時的處理函式（在 paho 的 thread 中呼叫）
     """
+    handlers = handlers or {}
+    presence_mid = None
+
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
     def on_connect(c, user_data, flags, rc):
+        nonlocal presence_mid
         if rc == 0:
             logger.info("Connected to MQTT broker")
+            if track_presence:
+                # events might be missed while disconnected, so the presence map has to be resynced.
+                presence_map.reset()
+                _, presence_mid = c.subscribe([(CONNECTED_TOPIC, 0), (DISCONNECTED_TOPIC, 0)])
+            if len(handlers) > 0:
+                c.subscribe([(topic, 1) for topic in handlers])
         else:
             logger.error("Failed to connect to MQTT, returnee code: ", rc)
 
+    def on_subscribe(c, user_data, mid, granted_qos):
+        if mid != presence_mid:
+            return
+
+        # 128 means the broker rejected the subscription, e.g. $SYS topics are denied by ACL
+        if all(q != 128 for q in granted_qos):
+            presence_map.enabled = True
+            # clients connected before the subscription send no events, fetch the list of them right away
+            if loop is not None:
+                asyncio.run_coroutine_threadsafe(seed_presence(), loop)
+        else:
+            logger.warning("Subscribing to client events is denied, worker presence falls back to EMQX API")
+
+    def on_message(c, user_data, msg):
+        handler = handlers.get(msg.topic)
+
+        if handler is not None:
+            handler(msg.payload)
+        else:
+            presence_map.handle_event(msg.topic, msg.payload)
+
     global mqtt_client
     mqtt_client = client.Client(client_id)
     mqtt_client.on_connect = on_connect
+    if track_presence or len(handlers) > 0:
+        mqtt_client.on_subscribe = on_subscribe
+        mqtt_client.on_message = on_message
     mqtt_client.connect(broker, port=port)
     mqtt_client.loop_start()
 
+    if loop is None:
+        # not in an event loop, messages are published by paho directly
+        return
+
+    publisher.start(mqtt_client)
+
+
+async def seed_presence():
+    """訂閱連線事件後取得在線名單，EMQX API 無法使用時只記錄警告，之後查詢在線狀態時會再嘗試。"""
+    try:
+        await sync_presence()
+    except Exception as e:
+        logger.warning(f"cannot fetch connected clients from EMQX: {repr(e)}")
+
 
 def disconnect_mqtt():
     """關閉MQTT連線"""
+    publisher.stop()
     if mqtt_client is not None:
         mqtt_client.disconnect()
 
-def default(o):
-    if isinstance(o, (datetime.date, datetime.datetime)):
-        return o.isoformat()
+
+async def flush_mqtt(timeout: float = 5) -> bool:
+    """等待尚未送出的訊息送出，通常在關閉連線前呼叫"""
+    return await publisher.flush(timeout)
 
 
 def publish(topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
     """發送訊息到MQTT broker
 
+    在 event loop 中連線時，訊息會排入 `publisher` 的佇列依序發送；
+    回傳 False 代表訊息被捨棄（佇列已滿）或發送失敗。
+
     Args:
     - topic: 訊息主題
     - payload: 訊息內容
@@ -51,7 +121,9 @@ def publish(topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
     if mqtt_client is None:
         raise Exception("MQTT client is not initialized")
 
-    json_str = json.dumps(payload, default=default)
-    result = mqtt_client.publish(topic, payload=json_str, qos=qos, retain=retain)
+    if publisher.running:
+        return publisher.submit(topic, payload, qos=qos, retain=retain)
+
+    result = mqtt_client.publish(topic, payload=encode_payload(payload), qos=qos, retain=retain)
     # if result[0] is 0, then publish successfully
     return result[0] == 0
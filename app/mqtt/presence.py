@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+from app.env import PRESENCE_RESYNC_INTERVAL
+from app.mqtt.emqx import EmqxClient, emqx_client
+
+# EMQX publishes these system events whenever a client connects/disconnects.
+CONNECTED_TOPIC = "$SYS/brokers/+/clients/+/connected"
+DISCONNECTED_TOPIC = "$SYS/brokers/+/clients/+/disconnected"
+
+
+class Presence(NamedTuple):
+    connected: bool
+    last_seen: datetime
+    ip_address: Optional[str] = None
+
+
+class PresenceMap:
+    """由 broker 的連線/斷線事件維護的員工在線狀態（username → 是否在線、最後出現時間）。
+
+    事件由 paho 的 thread 寫入，讀取則在 event loop 中，所以所有存取都會加鎖。
+    在收到第一份完整的在線名單（`seed`）之前，沒有事件的員工視為狀態未知。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._presence: Dict[str, Presence] = {}
+        self._seeded_at: Optional[float] = None
+        self.enabled = False
+
+    @property
+    def seeded_at(self) -> Optional[float]:
+        return self._seeded_at
+
+    def is_ready(self) -> bool:
+        """是否可以只依靠事件判斷在線狀態。"""
+        return self.enabled and self._seeded_at is not None
+
+    def handle_event(self, topic: str, payload: bytes):
+        """處理 `$SYS/brokers/{node}/clients/{clientid}/(dis)connected` 事件。"""
+        levels = topic.split("/")
+        if len(levels) != 6 or levels[0] != "$SYS" or levels[3] != "clients":
+            return
+
+        try:
+            content: Dict[str, Any] = json.loads(payload)
+        except ValueError:
+            content = {}
+
+        username = content.get("username") or levels[4]
+        connected = levels[5] == "connected"
+
+        if "ts" in content:
+            last_seen = datetime.utcfromtimestamp(content["ts"] / 1000)
+        else:
+            last_seen = datetime.utcnow()
+
+        with self._lock:
+            current = self._presence.get(username)
+            # events may arrive out of order, ignore the ones older than what we have
+            if current is not None and current.last_seen > last_seen:
+                return
+
+            self._presence[username] = Presence(
+                connected, last_seen, content.get("ipaddress") if connected else None
+            )
+
+    def seed(self, clients: Mapping[str, Mapping[str, Any]], fetched_at: datetime):
+        """以 EMQX API 取得的在線名單校正狀態，名單中沒有的員工視為離線。
+
+        Args:
+        - clients: 在線的 client（以 username 為 key）
+        - fetched_at: 開始取得名單的時間，比這個時間新的事件會被保留
+        """
+        with self._lock:
+            for username in set(self._presence) | set(clients):
+                current = self._presence.get(username)
+
+                if current is not None and current.last_seen >= fetched_at:
+                    continue
+
+                if username in clients:
+                    self._presence[username] = Presence(
+                        True, fetched_at, clients[username].get("ip_address")
+                    )
+                elif current is not None and current.connected:
+                    self._presence[username] = Presence(False, current.last_seen)
+
+            self._seeded_at = time.monotonic()
+
+    def reset(self):
+        """與 broker 重新連線時呼叫，斷線期間可能漏掉事件，需要重新取得在線名單。"""
+        with self._lock:
+            self.enabled = False
+            self._seeded_at = None
+
+    def get(self, username: str) -> Optional[Presence]:
+        with self._lock:
+            return self._presence.get(username)
+
+    def is_connected(self, username: str) -> Optional[bool]:
+        """回傳員工是否在線，狀態未知時回傳 None。"""
+        p = self.get(username)
+
+        if p is not None:
+            return p.connected
+
+        return False if self.is_ready() else None
+
+    def clear(self):
+        with self._lock:
+            self._presence.clear()
+            self._seeded_at = None
+            self.enabled = False
+
+
+presence_map = PresenceMap()
+
+_syncing: Optional["asyncio.Future[None]"] = None
+
+
+async def fetch_and_seed(emqx: EmqxClient):
+    fetched_at = datetime.utcnow()
+    clients = await emqx.fetch_connected_clients()
+    presence_map.seed(
+        {c.get("username") or client_id: c for client_id, c in clients.items()}, fetched_at
+    )
+
+
+async def sync_presence(emqx: EmqxClient = emqx_client):
+    """在尚未取得在線名單，或距離上次校正超過 `PRESENCE_RESYNC_INTERVAL` 秒時，重新取得在線名單。
+
+    同時呼叫時只會發出一次請求。
+    """
+    global _syncing
+
+    if not presence_map.enabled:
+        return
+
+    seeded_at = presence_map.seeded_at
+    if seeded_at is not None and time.monotonic() - seeded_at < PRESENCE_RESYNC_INTERVAL:
+        return
+
+    if _syncing is None or _syncing.done():
+        _syncing = asyncio.ensure_future(fetch_and_seed(emqx))
+
+    await asyncio.shield(_syncing)
@@ -0,0 +1,240 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import orjson
+from paho.mqtt import client
+from pydantic import BaseModel
+from app.my_log_conf import LOGGER_NAME
+from app.utils.metrics import MQTT_MESSAGES, MQTT_PUBLISH_LATENCY
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def default(o):
+    if isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
+    if isinstance(o, BaseModel):
+        return o.dict()
+    raise TypeError
+
+
+def encode_payload(payload: Any) -> bytes:
+    """以 orjson 將訊息內容編碼為 JSON。"""
+    return orjson.dumps(payload, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def percentile(sorted_values, p: float) -> Optional[float]:
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+class PendingMessage:
+    __slots__ = ("topic", "payload", "qos", "retain", "enqueued_at")
+
+    def __init__(self, topic: str, payload: bytes, qos: int, retain: bool):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.enqueued_at = time.perf_counter()
+
+
+class MqttPublisher:
+    """在 event loop 中依序發送 MQTT 訊息的 publisher。
+
+    - 待發送的訊息放在有上限的佇列中，佇列已滿時新的訊息會被捨棄
+    - 同一個 topic 的 retained 訊息若還沒送出，只會保留最新的一則
+    - 同時等待 broker 確認（in-flight）的訊息數量不會超過 `max_inflight`，斷線時釋放所有名額
+    - 記錄每則訊息從排入佇列到 broker 確認收到的時間
+
+    Args:
+    - max_queue: 佇列中最多的訊息數量
+    - max_inflight: 最多同時等待 broker 確認的訊息數量
+    """
+
+    def __init__(self, max_queue: int = 1000, max_inflight: int = 20):
+        self.max_queue = max_queue
+        self.max_inflight = max_inflight
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.latencies: Deque[float] = deque(maxlen=1024)
+        self._queue: Deque[PendingMessage] = deque()
+        self._retained: Dict[str, PendingMessage] = {}
+        self._inflight: Dict[int, PendingMessage] = {}
+        self._client: Optional[client.Client] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._not_empty: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._window: Optional[asyncio.Semaphore] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, mqtt_client: client.Client):
+        """開始在目前的 event loop 中發送訊息，必須在 event loop 中呼叫。"""
+        self._client = mqtt_client
+        self._client.max_inflight_messages_set(self.max_inflight)
+        self._client.on_publish = self._on_publish
+        self._client.on_disconnect = self._on_disconnect
+        self._loop = asyncio.get_running_loop()
+        self._not_empty = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._window = asyncio.Semaphore(self.max_inflight)
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def flush(self, timeout: float = 5) -> bool:
+        """等待佇列中與 in-flight 的訊息都送出，逾時則回傳 False。"""
+        if not self.running:
+            return len(self._queue) == 0
+        assert self._idle is not None
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def submit(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> bool:
+        """將訊息排入佇列，佇列已滿時回傳 False。"""
+        assert self._not_empty is not None and self._idle is not None
+        data = encode_payload(payload)
+
+        pending = self._retained.get(topic) if retain else None
+        if pending is not None:
+            # the older retained message is not sent yet, only the latest one matters.
+            pending.payload = data
+            pending.qos = max(pending.qos, qos)
+            self.coalesced += 1
+            MQTT_MESSAGES.labels("coalesced").inc()
+            return True
+
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            MQTT_MESSAGES.labels("dropped").inc()
+            logger.warning(f"MQTT publish queue is full, dropping message to {topic}")
+            return False
+
+        msg = PendingMessage(topic, data, qos, retain)
+        self._queue.append(msg)
+        if retain:
+            self._retained[topic] = msg
+
+        self._idle.clear()
+        self._not_empty.set()
+        return True
+
+    async def _run(self):
+        assert self._client is not None and self._window is not None
+        assert self._not_empty is not None and self._idle is not None
+
+        while True:
+            # the permit is returned here unless the message is waiting for the broker's ack
+            holds_permit = False
+            try:
+                if len(self._queue) == 0:
+                    self._not_empty.clear()
+                    self._update_idle()
+                    await self._not_empty.wait()
+                    continue
+
+                await self._window.acquire()
+                holds_permit = True
+                msg = self._queue.popleft()
+                if self._retained.get(msg.topic) is msg:
+                    del self._retained[msg.topic]
+
+                info = self._client.publish(msg.topic, payload=msg.payload, qos=msg.qos, retain=msg.retain)
+                self.published += 1
+                MQTT_MESSAGES.labels("published").inc()
+
+                # QoS > 0 messages are kept by paho and resent after reconnecting
+                if info.rc != client.MQTT_ERR_SUCCESS and msg.qos == 0:
+                    self.failed += 1
+                    MQTT_MESSAGES.labels("failed").inc()
+                    continue
+
+                self._inflight[info.mid] = msg
+                holds_permit = False
+            except Exception as e:
+                # e.g. paho rejects the topic or the payload, skip the message and keep the publisher running
+                self.failed += 1
+                MQTT_MESSAGES.labels("failed").inc()
+                logger.error(f"Failed to publish MQTT message: {repr(e)}")
+            finally:
+                if holds_permit:
+                    self._window.release()
+
+    def _on_publish(self, c, user_data, mid: int):
+        # called from paho's network thread
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._on_delivered, mid)
+
+    def _on_disconnect(self, c, user_data, rc: int):
+        # called from paho's network thread
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._reset_inflight)
+
+    def _reset_inflight(self):
+        """斷線後不一定會收到 in-flight 訊息的確認，釋放它們的名額，避免之後的訊息一直等不到名額。
+
+        paho 會在重新連線後重送 QoS > 0 的訊息，只是不再記錄它們的延遲。
+        """
+        if len(self._inflight) == 0:
+            return
+
+        assert self._window is not None
+        logger.warning(f"MQTT disconnected with {len(self._inflight)} messages waiting for acknowledgement")
+
+        for _ in range(len(self._inflight)):
+            self._window.release()
+        self._inflight.clear()
+        self._update_idle()
+
+    def _on_delivered(self, mid: int):
+        msg = self._inflight.pop(mid, None)
+        if msg is None:
+            return
+
+        assert self._window is not None
+        latency = time.perf_counter() - msg.enqueued_at
+        self.latencies.append(latency)
+        self.delivered += 1
+        MQTT_PUBLISH_LATENCY.observe(latency)
+        MQTT_MESSAGES.labels("delivered").inc()
+        self._window.release()
+        self._update_idle()
+
+    def _update_idle(self):
+        assert self._idle is not None
+        if len(self._queue) == 0 and len(self._inflight) == 0:
+            self._idle.set()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "queued": len(self._queue),
+            "inflight": len(self._inflight),
+            "published": self.published,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "latency_p99": percentile(latencies, 0.99),
+        }
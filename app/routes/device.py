@@ -2,6 +2,7 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, Form, HTTPException
 from app.models.schema import CategoryPriorityOut, DeviceDispatchableWorker, DeviceOut, WhitelistRecommendDevice
 from app.services.auth import get_manager_active_user, get_current_active_user
+from app.core.replica import use_read_replica
 from app.core.database import CategoryPRI, Device, ShiftType, User, FactoryMap, UserDeviceLevel, UserLevel, WhitelistDevice
 from app.services.device import add_worker_to_device_whitelist, get_workers_from_whitelist_devices, show_recommend_whitelist_devices
 
@@ -66,7 +67,7 @@ async def get_whitelist_devices(workshop_name: str):
             resp[w.device.id] = usernames
     return resp
 
-@router.get("/whitelist/recommend", tags=['whitelist device'], response_model=WhitelistRecommendDevice)
+@router.get("/whitelist/recommend", tags=['whitelist device'], response_model=WhitelistRecommendDevice, dependencies=[Depends(use_read_replica)])
 async def get_recommend_day_and_night_whitelist_devices(workshop_name: str):
     day_data, night_data = await show_recommend_whitelist_devices(workshop_name)
     return {
@@ -4,11 +4,12 @@ import datetime
 from typing import List
 from pydantic import BaseModel
 from app.core.database import AuditActionEnum, AuditLogHeader, LogValue, User
+from app.core.replica import use_read_replica
 from typing import Optional
 
 from app.services.auth import get_manager_active_user
 
-router = APIRouter(prefix="/logs")
+router = APIRouter(prefix="/logs", dependencies=[Depends(use_read_replica)])
 
 
 class LogValueOut(BaseModel):
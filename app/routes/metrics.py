@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.core.database import User
+from app.services.auth import get_admin_active_user, verify_metrics_token
+from app.utils.profiler import recent_profiles
+
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    tags=["metrics"],
+    response_class=Response,
+    description="Prometheus metrics of this API process, requires `Authorization: Bearer <METRICS_TOKEN>`",
+    dependencies=[Depends(verify_metrics_token)],
+)
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get(
+    "/debug/sql-profiles",
+    tags=["metrics"],
+    description="Get SQL profiles of recent requests and daemon routines, requires SQL_PROFILER=1",
+)
+async def get_sql_profiles(
+    limit: int = 20,
+    n_plus_one_only: bool = False,
+    user: User = Depends(get_admin_active_user),
+):
+    profiles = list(reversed(recent_profiles))
+
+    if n_plus_one_only:
+        profiles = [p for p in profiles if len(p.suspected_n_plus_one()) != 0]
+
+    return [p.report() for p in profiles[:limit]]
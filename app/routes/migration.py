@@ -7,6 +7,7 @@ from app.services.migration import (
 )
 from fastapi import APIRouter, Depends, File, Response, UploadFile, Form
 from app.core.database import AuditActionEnum, User, AuditLogHeader
+from app.mqtt.changes import invalidate_shared_cache
 from fastapi.exceptions import HTTPException
 from typing import List
 
@@ -24,6 +25,7 @@ async def import_devices_from_excel(
 
     try:
         device_ids, params = await import_devices(file)
+        invalidate_shared_cache("users_overview")
         await AuditLogHeader.objects.create(
             table_name="devices",
             action=AuditActionEnum.DATA_IMPORT_SUCCEEDED.value,
@@ -95,6 +97,10 @@ async def import_factory_worker_infos_from_excel(
 
     try:
         params = await import_factory_worker_infos(workshop_name, file)
+        # 匯入的 transaction 已經 commit，清除被更新、刪除的員工資料與重建的下屬關係
+        invalidate_shared_cache("principals")
+        invalidate_shared_cache("subordinates")
+        invalidate_shared_cache("users_overview")
         await AuditLogHeader.objects.create(
             table_name="users",
             action=AuditActionEnum.DATA_IMPORT_SUCCEEDED.value,
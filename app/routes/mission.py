@@ -1,18 +1,20 @@
 import datetime
-from typing import List, Optional
-from fastapi import APIRouter, Depends
+from typing import Any, Dict, List, Optional, Set
+from fastapi import APIRouter, Depends, Query
 from app.core.database import (
     AuditActionEnum,
     AuditLogHeader,
     User,
-    Mission,
     UserLevel,
     database,
 )
+from app.core.replica import use_read_replica
+from app.env import MISSIONS_PAGE_MAX_SIZE
 from app.services.mission import (
     accept_mission,
     cancel_mission_by_id,
     get_mission_by_id,
+    get_missions_page,
     request_assistance,
     update_mission_by_id,
     start_mission_by_id,
@@ -29,11 +31,33 @@ from app.models.schema import MissionUpdate, MissionDto
 from fastapi.exceptions import HTTPException
 
 from app.services.user import is_user_working_on_mission
+from app.utils.response import ORJSONResponse
 
 router = APIRouter(prefix="/missions")
 
 
-@router.get("/", response_model=List[MissionDto], tags=["missions"])
+def mission_list_response(missions: List[Dict[str, Any]], next_cursor: Optional[str]) -> ORJSONResponse:
+    """直接以 orjson 輸出 MissionDto 格式的 dict，下一頁的 cursor 放在 X-Next-Cursor header。"""
+    return ORJSONResponse(
+        missions, headers={"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    )
+
+
+def parse_mission_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """將 `fields` query（以逗號分隔的 MissionDto 欄位，例如 mission_id,device,is_started）轉為欄位集合。"""
+    if fields is None:
+        return None
+
+    selected = {f.strip() for f in fields.split(",") if f.strip() != ""}
+    unknown = selected - set(MissionDto.__fields__)
+
+    if len(unknown) > 0:
+        raise HTTPException(400, f"unknown fields: {', '.join(sorted(unknown))}")
+
+    return selected
+
+
+@router.get("/", response_model=List[MissionDto], tags=["missions"], dependencies=[Depends(use_read_replica)])
 async def get_missions_by_query(
     user: User = Depends(get_manager_active_user),
     worker: Optional[str] = None,
@@ -46,46 +70,29 @@ async def get_missions_by_query(
     is_rescue: Optional[bool] = None,
     start_date: Optional[datetime.datetime] = None,
     end_date: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MISSIONS_PAGE_MAX_SIZE),
+    fields: Optional[str] = None,
 ):
-    params = {
-        "created_date__gte": start_date,
-        "created_date__lte": end_date,
-        "assignees__username": worker,
-        "is_cancel": is_cancel,
-        "is_emergency": is_emergency,
-        "device__is_rescue": is_rescue,
-        "device__workshop__name": workshop_name,
-        "repair_start_date__isnull": not is_started if is_started is not None else None,
-        "repair_end_date__isnull": not is_closed if is_closed is not None else None,
-    }
-
-    params = {k: v for k, v in params.items() if v is not None}
-
-    missions = (
-        await Mission.objects.select_related(
-            ["device", "assignees", "missionevents", "device__workshop"]
-        )
-        .exclude_fields(
-            [
-                "device__workshop__map",
-                "device__workshop__related_devices",
-                "device__workshop__image",
-            ]
-        )
-        .filter(**params)  # type: ignore
-        .order_by("-created_date")
-        .all()
+    selected_fields = parse_mission_fields(fields)
+
+    missions, next_cursor = await get_missions_page(
+        worker=worker,
+        workshop_name=workshop_name,
+        is_assigned=is_assigned,
+        is_started=is_started,
+        is_closed=is_closed,
+        is_cancel=is_cancel,
+        is_emergency=is_emergency,
+        is_rescue=is_rescue,
+        start_date=start_date,
+        end_date=end_date,
+        cursor=cursor,
+        limit=limit,
+        fields=selected_fields,
     )
 
-    if is_assigned is not None:
-        if is_assigned:
-            missions = [mission for mission in missions if len(mission.assignees) > 0]
-        else:
-            missions = [mission for mission in missions if len(mission.assignees) == 0]
-
-    mission_list = [MissionDto.from_mission(x) for x in missions]
-
-    return mission_list
+    return mission_list_response(missions, next_cursor)
 
 
 @router.get("/self", response_model=List[MissionDto], tags=["missions"])
@@ -99,41 +106,28 @@ async def get_self_mission(
     is_rescue: Optional[bool] = None,
     start_date: Optional[datetime.datetime] = None,
     end_date: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MISSIONS_PAGE_MAX_SIZE),
+    fields: Optional[str] = None,
 ):
-    params = {
-        "created_date__gte": start_date,
-        "created_date__lte": end_date,
-        "is_cancel": is_cancel,
-        "is_emergency": is_emergency,
-        "device__is_rescue": is_rescue,
-        "repair_start_date__isnull": not is_started if is_started is not None else None,
-        "repair_end_date__isnull": not is_closed if is_closed is not None else None,
-    }
-    params = {k: v for k, v in params.items() if v is not None}
-
-    missions = (
-        await Mission.objects.select_related(
-            ["device", "assignees", "missionevents", "device__workshop"]
-        )
-        .exclude_fields(
-            [
-                "device__workshop__map",
-                "device__workshop__related_devices",
-                "device__workshop__image",
-            ]
-        )
-        .filter(assignees__username=user.username, **params)  # type: ignore
-        .order_by("-created_date")
-        .all()
+    selected_fields = parse_mission_fields(fields)
+
+    missions, next_cursor = await get_missions_page(
+        worker=user.username,
+        is_assigned=is_assigned,
+        is_started=is_started,
+        is_closed=is_closed,
+        is_cancel=is_cancel,
+        is_emergency=is_emergency,
+        is_rescue=is_rescue,
+        start_date=start_date,
+        end_date=end_date,
+        cursor=cursor,
+        limit=limit,
+        fields=selected_fields,
     )
 
-    if is_assigned is not None:
-        if is_assigned:
-            missions = [mission for mission in missions if len(mission.assignees) > 0]
-        else:
-            missions = [mission for mission in missions if len(mission.assignees) == 0]
-
-    return [MissionDto.from_mission(x) for x in missions]
+    return mission_list_response(missions, next_cursor)
 
 
 @router.get("/{mission_id}", response_model=MissionDto, tags=["missions"])
@@ -1,10 +1,10 @@
 import datetime, logging
 from typing import List, Any, Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from app.core.database import FactoryMap, Mission, ShiftType, WorkerStatus, UserLevel, WorkerStatusEnum
-import asyncio
-from app.env import LOGGER_NAME
+from app.core.database import FactoryMap, Mission, ShiftType, database
+from app.core.replica import use_read_replica
+from app.env import LOGGER_NAME, STATISTICS_CACHE_TTL
 from app.models.schema import MissionDto, WorkerMissionStats, WorkerStatusDto
 
 from app.services.statistics import (
@@ -19,10 +19,12 @@ from app.services.statistics import (
     get_emergency_missions,
 )
 
-from app.services.user import get_worker_status
+from app.services.user import get_workshop_worker_status
+from app.utils.cache import TTLCache
+from app.utils.utils import gather_with_limit
 
 logger = logging.getLogger(LOGGER_NAME)
-router = APIRouter(prefix="/stats")
+router = APIRouter(prefix="/stats", dependencies=[Depends(use_read_replica)])
 
 
 class DeviceStats(BaseModel):
@@ -42,31 +44,36 @@ class Stats(BaseModel):
     current_emergency_mission: List[MissionDto]
 
 
-@router.get("/", response_model=Stats, tags=["statistics"])
-async def get_overall_statistics(workshop_name: str, start_date: datetime.datetime, end_date: datetime.datetime, is_night_shift: Optional[bool] = None):
-    """
-    Parameters:
-        start_date - Should be UTC timezone.
-        end_date - Should be UTC timezone.
-    """
+statistics_cache: TTLCache[Stats] = TTLCache(STATISTICS_CACHE_TTL)
 
-    if start_date > end_date:
-        raise HTTPException(400, "start_date should be less than end_date")
 
-    if not await FactoryMap.objects.filter(name=workshop_name).exists():
-        raise HTTPException(404, "workshop_name is not existed")
+async def compute_overall_statistics(workshop_name: str, start_date: datetime.datetime, end_date: datetime.datetime, shift: Optional[ShiftType]) -> Stats:
+    workshop = await FactoryMap.objects.filter(name=workshop_name).exclude_fields(['map', 'image', 'related_devices']).get_or_none()
 
-    shift = ShiftType.day if is_night_shift == False else (ShiftType.night if is_night_shift == True else None)
+    if workshop is None:
+        raise HTTPException(404, "workshop_name is not existed")
 
-    workshop_id = (await FactoryMap.objects.filter(name=workshop_name).exclude_fields(['map', 'image', 'related_devices']).get()).id
-        
-    top_crashed_devices = await get_top_most_crashed_devices(workshop_id, start_date, end_date, shift, 10)
-    top_abnormal_devices = await get_top_abnormal_devices(workshop_id, start_date, end_date, shift, 10)
-    top_abnormal_missions = await get_top_abnormal_missions(workshop_id, start_date, end_date, shift, 10)
-    login_users_percentage = await get_login_users_percentage_by_recent_24_hours(workshop_id, start_date, end_date, shift)
-    top_mission_accept_employees = await get_top_most_accept_mission_employees(workshop_id, start_date, end_date, shift, 10)
-    top_mission_reject_employees = await get_top_most_reject_mission_employees(workshop_id, start_date, end_date, shift, 3)
-    emergency_missions = await get_emergency_missions(workshop_id)
+    workshop_id = workshop.id
+
+    # 各項統計互不相依，各自使用一條連線同時查詢（最多 DATABASE_FANOUT_LIMIT 條）
+    (
+        top_crashed_devices,
+        top_abnormal_devices,
+        top_abnormal_missions,
+        login_users_percentage,
+        top_mission_accept_employees,
+        top_mission_reject_employees,
+        emergency_missions,
+    ) = await gather_with_limit(
+        get_top_most_crashed_devices(workshop_id, start_date, end_date, shift, 10),
+        get_top_abnormal_devices(workshop_id, start_date, end_date, shift, 10),
+        get_top_abnormal_missions(workshop_id, start_date, end_date, shift, 10),
+        get_login_users_percentage_by_recent_24_hours(workshop_id, start_date, end_date, shift),
+        get_top_most_accept_mission_employees(workshop_id, start_date, end_date, shift, 10),
+        get_top_most_reject_mission_employees(workshop_id, start_date, end_date, shift, 3),
+        get_emergency_missions(workshop_id),
+        database=database,
+    )
 
     return Stats(
         devices_stats=DeviceStats(
@@ -81,17 +88,32 @@ async def get_overall_statistics(workshop_name: str, start_date: datetime.dateti
     )
 
 
-@router.get("/{workshop_name}/worker-status", response_model=List[WorkerStatusDto], tags=["statistics"])
-async def get_all_worker_status(workshop_name: str):
-    states = (
-        await WorkerStatus.objects.select_related(["worker", "worker__location"])
-        .exclude_fields(['worker__location__related_devices', 'worker__location__image', 'worker__location__map'])
-        .filter(worker__level=UserLevel.maintainer.value, worker__location__name=workshop_name)
-        .all()
+@router.get("/", response_model=Stats, tags=["statistics"])
+async def get_overall_statistics(workshop_name: str, start_date: datetime.datetime, end_date: datetime.datetime, is_night_shift: Optional[bool] = None):
+    """
+    Parameters:
+        start_date - Should be UTC timezone.
+        end_date - Should be UTC timezone.
+
+    Results are cached for `STATISTICS_CACHE_TTL` seconds, and concurrent requests with the same parameters share one computation.
+    """
+
+    if start_date > end_date:
+        raise HTTPException(400, "start_date should be less than end_date")
+
+    shift = ShiftType.day if is_night_shift == False else (ShiftType.night if is_night_shift == True else None)
+
+    return await statistics_cache.get_or_set(
+        (workshop_name, start_date, end_date, shift),
+        lambda: compute_overall_statistics(workshop_name, start_date, end_date, shift),
     )
 
-    resp: List[WorkerStatusDto] = []
 
-    promises = [get_worker_status(s.worker.username) for s in states]
-    resp = await asyncio.gather(*promises)
-    return resp
+@router.get("/cache", tags=["statistics"], description="Get hit/miss counters of the statistics cache")
+async def get_statistics_cache_stats():
+    return statistics_cache.stats()
+
+
+@router.get("/{workshop_name}/worker-status", response_model=List[WorkerStatusDto], tags=["statistics"])
+async def get_all_worker_status(workshop_name: str):
+    return await get_workshop_worker_status(workshop_name)
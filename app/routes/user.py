@@ -13,6 +13,8 @@ from app.core.database import (
     AuditLogHeader,
     database,
 )
+from app.core.replica import use_read_replica
+from app.mqtt.changes import notify_worker_changed
 from app.services.user import (
     get_user_all_level_subordinates_by_username,
     get_user_first_login_time_today,
@@ -126,12 +128,12 @@ async def get_user_attendances(user: User = Depends(get_current_active_user)):
 async def change_password(
     dto: UserChangePassword, user: User = Depends(get_current_active_user)
 ):
-    if not verify_password(dto.old_password, user.password_hash):
+    if not await verify_password(dto.old_password, user.password_hash):
         raise HTTPException(status_code=401, detail="The old password is not matched")
 
     await update_user(
         user.username,
-        password_hash=get_password_hash(dto.new_password),
+        password_hash=await get_password_hash(dto.new_password),
         is_changepwd=True,
     )
 
@@ -145,6 +147,7 @@ async def get_off_work(
         await WorkerStatus.objects.filter(worker=user.username).update(
             status=WorkerStatusEnum.leave.value
         )
+        notify_worker_changed(user.username)
 
     await AuditLogHeader.objects.create(
         user=user,
@@ -182,6 +185,6 @@ async def get_user_subordinates(user: User = Depends(get_manager_active_user)):
     return await get_user_all_level_subordinates_by_username(user.username)
 
 
-@router.get("/overview", tags=["users"], response_model=DayAndNightUserOverview)
+@router.get("/overview", tags=["users"], response_model=DayAndNightUserOverview, dependencies=[Depends(use_read_replica)])
 async def get_all_users_overview(workshop_name: str, user: User = Depends(get_manager_active_user)):
     return await get_users_overview(workshop_name)
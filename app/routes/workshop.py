@@ -1,12 +1,25 @@
-import cv2
-import numpy as np
+from datetime import datetime
 from typing import List, Mapping, Optional
-from fastapi import APIRouter, Depends, HTTPException, Response, File, UploadFile
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, File, UploadFile
+from fastapi.responses import StreamingResponse
 from ormar import NoMatch
 from app.core.database import FactoryMap, User, database
-from app.models.schema import DeviceStatus, DeviceStatusEnum
-from app.services.auth import get_current_active_user, get_manager_active_user
+from app.env import WORKSHOP_STREAM_TOKEN_EXPIRE_SECONDS
+from app.models.schema import DeviceStatus, WorkshopStreamToken
+from app.services.auth import (
+    create_workshop_stream_token,
+    get_current_active_user,
+    get_manager_active_user,
+    get_workshop_stream_user,
+)
 from app.services.workshop import create_workshop_device_qrcode, get_all_devices_status
+from app.services.workshop_stream import workshop_stream_hub
+from app.services.workshop_image import (
+    generate_image_etag,
+    has_workshop_image,
+    is_etag_matched,
+    render_workshop_image,
+)
 from urllib.parse import quote
 
 
@@ -46,10 +59,10 @@ async def get_workshop_list(user: User = Depends(get_manager_active_user)):
 async def get_workshop_device_qrcode(
     workshop_name: str, user: User = Depends(get_manager_active_user)
 ):
-    zip_bytes = await create_workshop_device_qrcode(workshop_name)
+    zip_stream = await create_workshop_device_qrcode(workshop_name)
 
-    return Response(
-        zip_bytes,
+    return StreamingResponse(
+        zip_stream,
         media_type="application/x-zip-compressed",
         headers={
             "Content-Disposition": "attachment; filename*=utf-8''{}.zip".format(
@@ -73,7 +86,9 @@ async def upload_workshop_image(
     raw_image = await image.read()
 
     try:
-        await FactoryMap.objects.filter(name=workshop_name).update(image=raw_image)
+        await FactoryMap.objects.filter(name=workshop_name).update(
+            image=raw_image, updated_date=datetime.utcnow()
+        )
     except NoMatch:
         raise HTTPException(status_code=404, detail="the workshop is not found")
     except Exception as e:
@@ -91,6 +106,7 @@ async def upload_workshop_image(
             "content": {"image/png": {}},
             "description": "Return workshop's image in png format.",
         },
+        304: {"description": "the image is not modified since the given ETag"},
         404: {"description": "workshop is not found",},
     },
 )
@@ -98,98 +114,46 @@ async def get_workshop_image(
     workshop_name: str, user: User = Depends(get_current_active_user),
     max_img_value: Optional[int] = None,
     navigate_device_id: Optional[str] = None,
-    navigate_worker_id: Optional[str] = None
+    navigate_worker_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
 ):
-    # teddy-dev
     w = (
         await FactoryMap.objects.filter(name=workshop_name)
-        .exclude_fields(["map", "related_devices"])
+        .fields(["id", "name", "updated_date"])
         .get_or_none()
     )
 
     if w is None:
         raise HTTPException(404, "the workshop is not found")
 
-    if w.image is None:
+    # 尚未上傳車間圖時不能以 304 回應
+    if not await has_workshop_image(w):
         raise HTTPException(404, "the workshop image is not yet uploaded")
 
-    # process
-    """
-    Define color
-    """
-    WORKING = (0, 255, 0)  # green 0
-    REPAIRING = (0, 140, 255)  # orange 1
-    HALT = (0, 0, 255)  # red 2
-    POINT_SCALE = 120
-    
     if navigate_worker_id or navigate_device_id:
-        all_devices_status = await get_all_devices_status(workshop_name, is_rescue=True) + await get_all_devices_status(workshop_name, is_rescue=False)
+        all_devices_status = await get_all_devices_status(workshop_name, is_rescue=None)
     else:
         all_devices_status = await get_all_devices_status(workshop_name, False)
 
-    img_buffer_numpy = np.frombuffer(w.image, dtype=np.uint8)
-    img = cv2.imdecode(img_buffer_numpy, 1)
-    height, width, _ = img.shape
-
-    if navigate_device_id or navigate_worker_id:
-        for i, obj in enumerate(all_devices_status):
-            if obj.device_id == navigate_device_id:
-                color = (0, 0, 255)
-                if obj.x_axis >= width or obj.y_axis >= height:
-                    raise HTTPException(404, "(x, y) is out of range")
-                else:
-                    cv2.circle(
-                        img,
-                        (int(obj.x_axis), int(obj.y_axis)),
-                        int(height / POINT_SCALE),
-                        color,
-                        -1,
-                    )
-            if obj.device_id == navigate_worker_id:
-                color = (255, 0, 0)
-                if obj.x_axis >= width or obj.y_axis >= height:
-                    raise HTTPException(404, "(x, y) is out of range")
-                else:
-                    cv2.circle(
-                        img,
-                        (int(obj.x_axis), int(obj.y_axis)),
-                        int(height / POINT_SCALE),
-                        color,
-                        -1,
-                    )
-    else:
-        for i, obj in enumerate(all_devices_status):
-            if obj.x_axis >= width or obj.y_axis >= height:
-                raise HTTPException(404, "(x, y) is out of range")
-            color = (255, 255, 255)
-            if obj.status == DeviceStatusEnum.working:
-                color = WORKING
-            elif obj.status == DeviceStatusEnum.repairing:
-                color = REPAIRING
-            else:
-                color = HALT
-
-            cv2.circle(
-                img,
-                (int(obj.x_axis), int(obj.y_axis)),
-                int(height / POINT_SCALE),
-                color,
-                -1,
-            )
-    
-    if max_img_value:
-        bigger_side = max(height, width)
-        if max_img_value == 0 or max_img_value > bigger_side:
-            raise HTTPException(404, "maxImgValue too large or equal to zero")
-
-        scale_rate = max_img_value / bigger_side
-        n_h, n_w = int(height * scale_rate), int(width * scale_rate)
-        img = cv2.resize(img, (n_w, n_h), interpolation = cv2.INTER_AREA)
+    etag = generate_image_etag(
+        w, all_devices_status, max_img_value, navigate_device_id, navigate_worker_id
+    )
 
-    _, im_buf_arr = cv2.imencode(".png", img)
+    if is_etag_matched(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
 
-    return Response(im_buf_arr.tobytes(), media_type="image/png")
+    png = await render_workshop_image(
+        w,
+        all_devices_status,
+        etag,
+        max_img_value=max_img_value,
+        navigate_device_id=navigate_device_id,
+        navigate_worker_id=navigate_worker_id,
+    )
 
+    return Response(
+        png, media_type="image/png", headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
 
 @router.get(
@@ -229,3 +193,49 @@ async def get_all_devices_status_in_workshop(
 ):
     return await get_all_devices_status(workshop_name)
 
+
+@router.post(
+    "/{workshop_name}/stream/token",
+    tags=["workshop"],
+    response_model=WorkshopStreamToken,
+    description="Issue a short-lived token for `GET /workshop/{workshop_name}/stream`. The token expires in `expires_in` seconds and is only valid for this workshop.",
+    responses={404: {"description": "workshop is not found"}},
+)
+async def get_workshop_stream_token(
+    workshop_name: str, user: User = Depends(get_manager_active_user)
+):
+    w = await FactoryMap.objects.filter(name=workshop_name).fields(["id"]).get_or_none()
+
+    if w is None:
+        raise HTTPException(404, "the workshop is not found")
+
+    return WorkshopStreamToken(
+        token=create_workshop_stream_token(user.username, workshop_name),
+        expires_in=WORKSHOP_STREAM_TOKEN_EXPIRE_SECONDS,
+    )
+
+
+@router.get(
+    "/{workshop_name}/stream",
+    tags=["workshop"],
+    description="Server-Sent Events of the workshop: a `snapshot` of devices, workers and open missions, then `mission`, `mission_removed`, `worker_status` and `device_status` updates. Reconnect when `resync` is received. Browsers' `EventSource` cannot send the `Authorization` header, so authenticate with `?token=` from `POST /workshop/{workshop_name}/stream/token`; fetch a new token before reconnecting, since the token is only checked when connecting and expires shortly.",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        404: {"description": "workshop is not found"},
+    },
+)
+async def stream_workshop_changes(
+    workshop_name: str, user: User = Depends(get_workshop_stream_user)
+):
+    w = await FactoryMap.objects.filter(name=workshop_name).fields(["id"]).get_or_none()
+
+    if w is None:
+        raise HTTPException(404, "the workshop is not found")
+
+    return StreamingResponse(
+        workshop_stream_hub.stream(workshop_name),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
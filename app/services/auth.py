@@ -5,23 +5,22 @@ from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
 from jose import jwt
-from .user import get_user_by_username, pwd_context
-from fastapi import Depends, HTTPException, status
+from .user import get_user_by_username, get_user_principal, verify_password
+from fastapi import Depends, Header, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 import os
-from app.env import JWT_SECRET
+import secrets
+from app.env import JWT_SECRET, METRICS_TOKEN, WORKSHOP_STREAM_TOKEN_EXPIRE_SECONDS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+WORKSHOP_STREAM_SCOPE = "workshop-stream"
+
 
 class TokenData(BaseModel):
     username: Optional[str] = None
 
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
-
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -33,17 +32,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def create_workshop_stream_token(username: str, workshop_name: str):
+    """產生只能用來連線該車間 `/workshop/{workshop_name}/stream` 的短效 token。
+
+    瀏覽器的 EventSource 無法帶 Authorization header，token 只能放在網址中，
+    因此不使用一般的 access token，以免效期長的 token 留在網址與 log 裡。
+    """
+    return create_access_token(
+        data={"sub": username, "scope": f"{WORKSHOP_STREAM_SCOPE}:{workshop_name}"},
+        expires_delta=timedelta(seconds=WORKSHOP_STREAM_TOKEN_EXPIRE_SECONDS),
+    )
+
+
 async def authenticate_user(username: str, password: str):
     user = await get_user_by_username(username)
 
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    if not await verify_password(password, user.password_hash):
         return False
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_user_by_token(token: str, scope: Optional[str] = None):
+    """驗證 token 並取得使用者，token 的 scope 必須與 `scope` 相同。
+
+    Args:
+    - token: JWT token
+    - scope: 一般的 access token 沒有 scope，車間推送用的 token 則為 `workshop-stream:{workshop_name}`
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,7 +71,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
         username: str = payload.get("sub")
 
-        if username is None:
+        if username is None or payload.get("scope") != scope:
             raise credentials_exception
     except ExpiredSignatureError:
         raise HTTPException(
@@ -65,13 +82,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except:
         raise credentials_exception
 
-    user = await get_user_by_username(username)
+    user = await get_user_principal(username)
 
     if user is None:
         raise credentials_exception
     return user
 
 
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await get_user_by_token(token)
+
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(
@@ -97,3 +118,21 @@ async def get_manager_active_user(
             detail="You're not manager or admin!",
         )
     return manager_user
+
+
+async def verify_metrics_token(authorization: Optional[str] = Header(None)):
+    """驗證 Prometheus 抓取 /metrics 時帶的 `METRICS_TOKEN`，未設定 `METRICS_TOKEN` 時不提供 /metrics。"""
+    if METRICS_TOKEN == "":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    if authorization is None or not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def get_workshop_stream_user(workshop_name: str, token: str = Query(...)):
+    user = await get_user_by_token(token, f"{WORKSHOP_STREAM_SCOPE}:{workshop_name}")
+    return await get_manager_active_user(await get_current_active_user(user))
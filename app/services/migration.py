@@ -1,6 +1,6 @@
 from datetime import datetime
 import math
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from app.core.database import (
     User,
     Device,
@@ -172,12 +172,29 @@ async def calcuate_factory_layout_matrix(
         matrix.append(native_arr)
 
     await FactoryMap.objects.filter(name=workshop_name).update(
-        related_devices=data["result"].columns.values.tolist(), map=matrix
+        related_devices=data["result"].columns.values.tolist(),
+        map=matrix,
+        updated_date=datetime.utcnow(),
     )
 
     return data["parameter"]
 
 
+# 匯入的新員工的預設密碼
+DEFAULT_PASSWORD = "foxlink"
+_default_password_hash: Optional[str] = None
+
+
+async def get_default_password_hash() -> str:
+    """預設密碼的 hash 只計算一次，所有匯入的新員工共用，不必為每個人各算一次 bcrypt。"""
+    global _default_password_hash
+
+    if _default_password_hash is None:
+        _default_password_hash = await get_password_hash(DEFAULT_PASSWORD)
+
+    return _default_password_hash
+
+
 @database.transaction()
 async def import_factory_worker_infos(
     workshop_name: str, excel_file: UploadFile
@@ -229,7 +246,7 @@ async def import_factory_worker_infos(
             worker = User(
                 username=str(row["worker_id"]),
                 full_name=row["worker_name"],
-                password_hash=get_password_hash("foxlink"),
+                password_hash=await get_default_password_hash(),
                 location=workshop_id_mapping[row["workshop"]],
                 is_active=True,
                 expertises=[],
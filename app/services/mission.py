@@ -1,5 +1,8 @@
+import base64
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+from sqlalchemy import bindparam, text
 from app.core.database import (
     Mission,
     User,
@@ -13,6 +16,7 @@ from app.core.database import (
 )
 from fastapi.exceptions import HTTPException
 from app.models.schema import MissionEventOut, MissionUpdate
+from app.mqtt.changes import notify_worker_changed
 from app.mqtt.main import publish
 import logging
 from app.services.user import get_user_by_username, is_user_working_on_mission, move_user_to_position
@@ -65,6 +69,227 @@ async def get_missions_by_username(username: str):
     return missions
 
 
+MISSION_ROWS_QUERY = """
+SELECT
+    m.id, m.name, m.description, m.repair_start_date, m.repair_end_date, m.is_cancel, m.is_emergency,
+    m.created_date, m.updated_date, d.id AS device_id, d.device_name, d.device_cname, d.project, d.process, d.line,
+    f.name AS workshop
+FROM missions m
+INNER JOIN devices d ON d.id = m.device
+LEFT JOIN factorymaps f ON f.id = d.workshop
+WHERE m.id IN :mission_ids;
+"""
+
+
+def mission_dto_dict(
+    row: Mapping, assignees: List[Dict[str, Any]], events: List[Dict[str, Any]], fields: Optional[Set[str]] = None
+) -> Dict[str, Any]:
+    """
+    由 `MISSION_ROWS_QUERY` 的查詢結果組成與 `MissionDto` 相同格式的 dict，不建立 ormar model 與 pydantic model。
+
+    Args:
+    - row: `MISSION_ROWS_QUERY` 查詢結果的一列
+    - assignees: 任務的負責人（username, full_name）
+    - events: 任務的事件，格式同 MissionEventOut
+    - fields: 需要的欄位，None 則全部
+    """
+    item = {
+        "mission_id": row["id"],
+        "device": {
+            "device_id": row["device_id"],
+            "device_name": row["device_name"],
+            "device_cname": row["device_cname"],
+            "workshop": row["workshop"],
+            "project": row["project"],
+            "process": row["process"],
+            "line": row["line"],
+        },
+        "name": row["name"],
+        "description": row["description"],
+        "assignees": assignees,
+        "events": events,
+        "is_started": row["repair_start_date"] is not None,
+        "is_closed": row["repair_end_date"] is not None,
+        # raw query 回傳的 BOOLEAN 欄位為 0/1
+        "is_cancel": bool(row["is_cancel"]),
+        "is_emergency": bool(row["is_emergency"]),
+        "created_date": row["created_date"],
+        "updated_date": row["updated_date"],
+    }
+
+    if fields is None:
+        return item
+
+    return {k: v for k, v in item.items() if k in fields}
+
+
+async def get_mission_dicts(mission_ids: List[int], fields: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """
+    依 mission_ids 的順序取得 MissionDto 格式的 dict，用於大量列出任務。
+
+    任務、負責人、事件各一次查詢，避免 assignees、missionevents 兩個一對多 join 造成的資料列膨脹。
+
+    Args:
+    - mission_ids: 任務 id，不存在的任務會被略過
+    - fields: 需要的 MissionDto 欄位，None 則全部；不需要 assignees、events 時不會查詢
+    """
+    if len(mission_ids) == 0:
+        return []
+
+    rows = await database.fetch_all(
+        text(MISSION_ROWS_QUERY).bindparams(bindparam("mission_ids", mission_ids, expanding=True))
+    )
+    row_by_id = {row["id"]: row for row in rows}
+
+    assignees: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    if fields is None or "assignees" in fields:
+        assignee_rows = await database.fetch_all(
+            text(
+                """
+                SELECT mu.mission, u.username, u.full_name FROM missions_users mu
+                INNER JOIN users u ON u.username = mu.user
+                WHERE mu.mission IN :mission_ids
+                ORDER BY mu.id;
+                """
+            ).bindparams(bindparam("mission_ids", mission_ids, expanding=True))
+        )
+        for row in assignee_rows:
+            assignees[row["mission"]].append({"username": row["username"], "full_name": row["full_name"]})
+
+    events: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    if fields is None or "events" in fields:
+        event_rows = await database.fetch_all(
+            text(
+                """
+                SELECT mission, category, message, done_verified, event_start_date, event_end_date FROM missionevents
+                WHERE mission IN :mission_ids
+                ORDER BY id;
+                """
+            ).bindparams(bindparam("mission_ids", mission_ids, expanding=True))
+        )
+        for row in event_rows:
+            events[row["mission"]].append(
+                {
+                    "category": row["category"],
+                    "message": row["message"],
+                    "done_verified": bool(row["done_verified"]),
+                    "event_start_date": row["event_start_date"],
+                    "event_end_date": row["event_end_date"],
+                }
+            )
+
+    return [
+        mission_dto_dict(row_by_id[id], assignees[id], events[id], fields)
+        for id in mission_ids
+        if id in row_by_id
+    ]
+
+
+def encode_mission_cursor(created_date: datetime, mission_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_date.isoformat()},{mission_id}".encode()).decode()
+
+
+def decode_mission_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_date, mission_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(",")
+        return datetime.fromisoformat(created_date), int(mission_id)
+    except Exception:
+        raise HTTPException(400, "invalid cursor")
+
+
+async def get_missions_page(
+    worker: Optional[str] = None,
+    workshop_name: Optional[str] = None,
+    is_assigned: Optional[bool] = None,
+    is_started: Optional[bool] = None,
+    is_closed: Optional[bool] = None,
+    is_cancel: Optional[bool] = None,
+    is_emergency: Optional[bool] = None,
+    is_rescue: Optional[bool] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[Set[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    依條件列出任務（由新到舊），回傳 MissionDto 格式的 dict 與下一頁的 cursor（沒有下一頁時為 None）。
+
+    先以 SQL 篩選、分頁取得任務 id，再由 `get_mission_dicts` 載入任務內容。
+
+    Args:
+    - worker: 只列出指派給此員工的任務
+    - is_assigned: 是否已指派給任何員工
+    - cursor: 上一頁回傳的 cursor
+    - limit: 每頁筆數，None 則不分頁
+    - fields: 需要的 MissionDto 欄位，None 則全部；不需要 assignees、events 時不會查詢
+    """
+    conditions: List[str] = []
+    values: Dict[str, object] = {}
+
+    if start_date is not None:
+        conditions.append("m.created_date >= :start_date")
+        values["start_date"] = start_date
+
+    if end_date is not None:
+        conditions.append("m.created_date <= :end_date")
+        values["end_date"] = end_date
+
+    if is_cancel is not None:
+        conditions.append("m.is_cancel = :is_cancel")
+        values["is_cancel"] = is_cancel
+
+    if is_emergency is not None:
+        conditions.append("m.is_emergency = :is_emergency")
+        values["is_emergency"] = is_emergency
+
+    if is_rescue is not None:
+        conditions.append("d.is_rescue = :is_rescue")
+        values["is_rescue"] = is_rescue
+
+    if workshop_name is not None:
+        conditions.append("d.workshop = (SELECT id FROM factorymaps WHERE name = :workshop_name)")
+        values["workshop_name"] = workshop_name
+
+    if is_started is not None:
+        conditions.append(f"m.repair_start_date IS {'NOT ' if is_started else ''}NULL")
+
+    if is_closed is not None:
+        conditions.append(f"m.repair_end_date IS {'NOT ' if is_closed else ''}NULL")
+
+    if worker is not None:
+        conditions.append("EXISTS (SELECT 1 FROM missions_users mu WHERE mu.mission = m.id AND mu.user = :worker)")
+        values["worker"] = worker
+
+    if is_assigned is not None:
+        conditions.append(f"{'' if is_assigned else 'NOT '}EXISTS (SELECT 1 FROM missions_users mu WHERE mu.mission = m.id)")
+
+    if cursor is not None:
+        cursor_date, cursor_id = decode_mission_cursor(cursor)
+        conditions.append("(m.created_date < :cursor_date OR (m.created_date = :cursor_date AND m.id < :cursor_id))")
+        values["cursor_date"] = cursor_date
+        values["cursor_id"] = cursor_id
+
+    query = "SELECT m.id, m.created_date FROM missions m INNER JOIN devices d ON d.id = m.device"
+    if len(conditions) > 0:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY m.created_date DESC, m.id DESC"
+
+    if limit is not None:
+        # 多取一筆以判斷是否還有下一頁
+        query += " LIMIT :limit"
+        values["limit"] = limit + 1
+
+    rows = await database.fetch_all(query, values)
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_mission_cursor(rows[-1]["created_date"], rows[-1]["id"])
+
+    return await get_mission_dicts([row["id"] for row in rows], fields), next_cursor
+
+
 @database.transaction()
 async def update_mission_by_id(id: int, dto: MissionUpdate):
     mission = await get_mission_by_id(id)
@@ -309,6 +534,7 @@ async def finish_mission_by_id(mission_id: int, worker: User):
                 status=WorkerStatusEnum.idle.value,
                 last_event_end_date=now_time
             )
+            notify_worker_changed(w.username)
 
         # record this operation
         for w in mission.assignees:
@@ -348,6 +574,7 @@ async def cancel_mission_by_id(mission_id: int):
         await WorkerStatus.objects.filter(worker=m).update(
             last_event_end_date=datetime.utcnow()
         )
+        notify_worker_changed(m.username)
 
 
 async def assign_mission(mission_id: int, username: str):
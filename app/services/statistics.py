@@ -1,11 +1,14 @@
 import logging
-from typing import List, Optional
+import pytz
+from typing import Any, Dict, List, Optional, Tuple
 from pydantic import BaseModel
-from app.core.database import Mission, ShiftType, UserLevel, database, User
+from app.core.database import ShiftType, UserLevel, database, User
 from datetime import datetime, timedelta
 from app.env import TIMEZONE_OFFSET
-from app.models.schema import MissionDto, WorkerMissionStats, WorkerStatusDto
+from app.models.schema import WorkerMissionStats, WorkerStatusDto
 from app.my_log_conf import LOGGER_NAME
+from app.services.mission import get_mission_dicts
+from app.utils.utils import get_shift_date_by_datetime
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -45,17 +48,42 @@ class AbnormalMissionInfo(BaseModel):
     duration: int
     created_date: datetime
 
-UTC_NIGHT_SHIFT_FILTER = "AND (TIME(m.created_date) BETWEEN '12:00' AND '23:40') # 夜班 in UTC"
-UTC_DAY_SHIFT_FILTER = "AND ((TIME(m.created_date) BETWEEN '23:40' AND '23:59') OR (TIME(m.created_date) BETWEEN '00:00' AND '12:00')) # 白班 in UTC"
+def get_shift_filter(shift: Optional[ShiftType], start_date: datetime, end_date: datetime, table: str) -> Tuple[str, Dict[str, Any]]:
+    """產生依班別篩選的 SQL 條件與其參數。
 
-LOCAL_NIGHT_SHIFT_FILTER = "AND ((TIME(event_start_date) BETWEEN '20:00' AND '23:59') OR (TIME(event_start_date) BETWEEN '00:00' AND '07:40'))"
-LOCAL_DAY_SHIFT_FILTER = "AND (TIME(event_start_date) BETWEEN '07:40' AND '20:00')"
+    `shift_type`, `shift_date` 欄位於新增資料時寫入，且與 `(shift_type, shift_date)` 建立索引，
+    因此篩選可以走 range scan，而不是對每列計算 `TIME(created_date)`。
+
+    Args:
+    - shift: 班別，None 代表不篩選
+    - start_date: 查詢起始時間 (UTC)
+    - end_date: 查詢結束時間 (UTC)
+    - table: 資料表名稱或別名
+    """
+    if shift is None:
+        return "", {}
+
+    start_date, end_date = [
+        d.astimezone(pytz.utc).replace(tzinfo=None) if d.tzinfo is not None else d
+        for d in (start_date, end_date)
+    ]
+
+    return (
+        f"AND {table}.shift_type = :shift_type AND ({table}.shift_date BETWEEN :start_shift_date AND :end_shift_date)",
+        {
+            "shift_type": shift.value,
+            "start_shift_date": get_shift_date_by_datetime(start_date),
+            "end_shift_date": get_shift_date_by_datetime(end_date),
+        },
+    )
 
 
 async def get_top_most_crashed_devices(workshop_id: int, start_date: datetime, end_date: datetime, shift: Optional[ShiftType], limit = 10):
     """
     取得當月最常故障的設備，不依照 Category 分類，排序則由次數由高排到低。
     """
+    shift_filter, shift_params = get_shift_filter(shift, start_date, end_date, "m")
+
     query = await database.fetch_all(
         f"""
         SELECT m.device as device_id, d.device_cname, count(*) AS count FROM missions m
@@ -64,12 +92,12 @@ async def get_top_most_crashed_devices(workshop_id: int, start_date: datetime, e
             (m.created_date BETWEEN :start_date AND :end_date)
             AND d.workshop = :workshop_id
             AND d.is_rescue = FALSE
-            {UTC_NIGHT_SHIFT_FILTER if shift == ShiftType.night else (UTC_DAY_SHIFT_FILTER if shift == ShiftType.day else "" )}
+            {shift_filter}
         GROUP BY m.device
         ORDER BY count DESC
         LIMIT :limit;
         """,
-        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, "limit": limit},
+        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, "limit": limit, **shift_params},
     )
 
     return query
@@ -79,6 +107,7 @@ async def get_top_abnormal_missions(workshop_id: int, start_date: datetime, end_
     """統計當月異常任務，根據處理時間由高排序到低。"""
     china_tz_start_date = start_date + timedelta(hours=TIMEZONE_OFFSET)
     china_tz_end_date = end_date + timedelta(hours=TIMEZONE_OFFSET)
+    shift_filter, shift_params = get_shift_filter(shift, start_date, end_date, "missionevents")
 
     abnormal_missions = await database.fetch_all(
         f"""
@@ -92,79 +121,103 @@ async def get_top_abnormal_missions(workshop_id: int, start_date: datetime, end_
                 AND d.is_rescue = FALSE
                 AND (event_start_date BETWEEN :start_date AND :end_date)
                 AND d.workshop = :workshop_id
-                {LOCAL_NIGHT_SHIFT_FILTER if shift == ShiftType.night else (LOCAL_DAY_SHIFT_FILTER if shift == ShiftType.day else "" )}
+                {shift_filter}
         ) t1
         GROUP BY (t1.mission_id)
         ORDER BY duration DESC
         LIMIT :limit;
         """,
-        {"workshop_id": workshop_id, "start_date": china_tz_start_date, "end_date": china_tz_end_date, "limit": limit},
+        {"workshop_id": workshop_id, "start_date": china_tz_start_date, "end_date": china_tz_end_date, "limit": limit, **shift_params},
     )
 
     return abnormal_missions  # type: ignore
 
 
-async def get_top_abnormal_devices(workshop_id: int, start_date: datetime, end_date: datetime, shift: Optional[ShiftType], limit = 10):
-    """根據歷史並依照設備的 Category 統計設備異常情形，並將員工對此異常情形由處理時間由低排序到高，取前三名。"""
+async def get_top_abnormal_devices(workshop_id: int, start_date: datetime, end_date: datetime, shift: Optional[ShiftType], limit = 10) -> List[AbnormalDeviceInfo]:
+    """根據歷史並依照設備的 Category 統計設備異常情形，並將員工對此異常情形由處理時間由低排序到高，取前三名。
+
+    異常設備與其前三名員工以單一查詢取得（`ROW_NUMBER() OVER (PARTITION BY device, category ...)`），
+    避免對每台設備再各發一次查詢。
+    """
     china_tz_start_date = start_date + timedelta(hours=TIMEZONE_OFFSET)
     china_tz_end_date = end_date + timedelta(hours=TIMEZONE_OFFSET)
+    shift_filter, shift_params = get_shift_filter(shift, start_date, end_date, "missionevents")
 
-    abnormal_devices: List[AbnormalDeviceInfo] = await database.fetch_all(
+    rows = await database.fetch_all(
         f"""
-        SELECT device as device_id, d.device_cname,  max(message) as message, max(category) as category, max(TIMESTAMPDIFF(SECOND, event_start_date, event_end_date)) as duration
-        FROM missionevents
-        INNER JOIN missions m ON m.id = mission
-        INNER JOIN devices d ON d.id = m.device 
-        WHERE 
-            event_start_date IS NOT NULL
-            AND event_end_date IS NOT NULL
-            AND (event_start_date BETWEEN :start_date AND :end_date)
-            AND d.workshop = :workshop_id
-            {LOCAL_NIGHT_SHIFT_FILTER if shift == ShiftType.night else (LOCAL_DAY_SHIFT_FILTER if shift == ShiftType.day else "" )}
-        GROUP BY device
-        ORDER BY duration DESC
-        LIMIT :limit;
-        """,
-        {"workshop_id": workshop_id, "start_date": china_tz_start_date, "end_date": china_tz_end_date, "limit": limit},
-    )  # type: ignore
-
-    abnormal_devices = [AbnormalDeviceInfo(**m) for m in abnormal_devices]  # type: ignore
-
-    for m in abnormal_devices:
-        # fetch top 3 assignees that deal with device out-of-order issue most quickly
-        top_assignees_in_mission = await database.fetch_all(
-            """
-            SELECT t1.username, t1.full_name, min(t1.duration) as duration FROM (
-                SELECT u.username, u.full_name, TIMESTAMPDIFF(SECOND, me.event_start_date, me.event_end_date) as duration
-                FROM missionevents me
-                LEFT OUTER JOIN missions_users mu ON mu.mission = me.mission
-                INNER JOIN missions m ON m.id = me.mission
-                INNER JOIN users u ON u.username = mu.user
-                WHERE device = :device_id AND category = :category AND event_end_date IS NOT NULL
-                ORDER BY duration ASC
-            ) t1
-            GROUP BY t1.username
-            ORDER BY duration
-            LIMIT 3;
-            """,
-            {"device_id": m.device_id, "category": m.category},
+        WITH abnormal_devices AS (
+            SELECT device as device_id, d.device_cname,  max(message) as message, max(category) as category, max(TIMESTAMPDIFF(SECOND, event_start_date, event_end_date)) as duration
+            FROM missionevents
+            INNER JOIN missions m ON m.id = mission
+            INNER JOIN devices d ON d.id = m.device 
+            WHERE 
+                event_start_date IS NOT NULL
+                AND event_end_date IS NOT NULL
+                AND (event_start_date BETWEEN :start_date AND :end_date)
+                AND d.workshop = :workshop_id
+                {shift_filter}
+            GROUP BY device
+            ORDER BY duration DESC
+            LIMIT :limit
+        ),
+        assignee_durations AS (
+            SELECT m.device as device_id, me.category, u.username, u.full_name, min(TIMESTAMPDIFF(SECOND, me.event_start_date, me.event_end_date)) as duration
+            FROM missionevents me
+            INNER JOIN missions m ON m.id = me.mission
+            INNER JOIN abnormal_devices ad ON ad.device_id = m.device AND ad.category = me.category
+            INNER JOIN missions_users mu ON mu.mission = me.mission
+            INNER JOIN users u ON u.username = mu.user
+            WHERE me.event_end_date IS NOT NULL
+            GROUP BY m.device, me.category, u.username, u.full_name
+        ),
+        top_assignees AS (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY device_id, category ORDER BY duration, username) as assignee_rank
+            FROM assignee_durations
         )
+        SELECT ad.device_id, ad.device_cname, ad.message, ad.category, ad.duration,
+            ta.username, ta.full_name, ta.duration as assignee_duration
+        FROM abnormal_devices ad
+        LEFT OUTER JOIN top_assignees ta ON ta.device_id = ad.device_id AND ta.category = ad.category AND ta.assignee_rank <= 3
+        ORDER BY ad.duration DESC, ad.device_id, ta.assignee_rank;
+        """,
+        {"workshop_id": workshop_id, "start_date": china_tz_start_date, "end_date": china_tz_end_date, "limit": limit, **shift_params},
+    )
+
+    return group_abnormal_device_rows(rows)
+
 
-        m.top_great_assignees = [
-            UserInfoWithDuration(
-                username=x["username"], full_name=x["full_name"], duration=x["duration"]
+def group_abnormal_device_rows(rows) -> List[AbnormalDeviceInfo]:
+    """將 `get_top_abnormal_devices` 查詢的扁平結果（每台設備 0~3 列員工）組合回 `AbnormalDeviceInfo` 列表，並保留原本排序。"""
+    abnormal_devices: Dict[str, AbnormalDeviceInfo] = {}
+
+    for row in rows:
+        device = abnormal_devices.get(row["device_id"])
+
+        if device is None:
+            device = AbnormalDeviceInfo(
+                device_id=row["device_id"],
+                device_cname=row["device_cname"],
+                message=row["message"],
+                category=row["category"],
+                duration=row["duration"],
+                top_great_assignees=[],
+            )
+            abnormal_devices[row["device_id"]] = device
+
+        if row["username"] is not None:
+            device.top_great_assignees.append(  # type: ignore
+                UserInfoWithDuration(
+                    username=row["username"], full_name=row["full_name"], duration=row["assignee_duration"]
+                )
             )
-            for x in top_assignees_in_mission
-        ]
 
-    return abnormal_devices
+    return list(abnormal_devices.values())
 
 
 async def get_top_most_accept_mission_employees(workshop_id: int, start_date: datetime, end_date: datetime, shift: Optional[ShiftType], limit: int) -> List[WorkerMissionStats]:
     """取得當月最常接受任務的員工"""
 
-    utc_night_filter = UTC_NIGHT_SHIFT_FILTER.replace("m.created_date", "created_date")
-    utc_day_filter = UTC_DAY_SHIFT_FILTER.replace("m.created_date", "created_date")
+    shift_filter, shift_params = get_shift_filter(shift, start_date, end_date, "auditlogheaders")
 
     query = await database.fetch_all(
         f"""
@@ -175,12 +228,12 @@ async def get_top_most_accept_mission_employees(workshop_id: int, start_date: da
             action='MISSION_ACCEPTED'
             AND (created_date BETWEEN :start_date AND :end_date)
             AND u.location = :workshop_id
-            {utc_night_filter if shift == ShiftType.night else (utc_day_filter if shift == ShiftType.day else "" )}
+            {shift_filter}
         GROUP BY u.username
         ORDER BY count DESC
         LIMIT :limit;
         """,
-        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, "limit": limit},
+        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, "limit": limit, **shift_params},
     )
 
     return [WorkerMissionStats(**m) for m in query]
@@ -188,8 +241,7 @@ async def get_top_most_accept_mission_employees(workshop_id: int, start_date: da
 
 async def get_top_most_reject_mission_employees(workshop_id: int, start_date: datetime, end_date: datetime, shift: Optional[ShiftType], limit: int) -> List[WorkerMissionStats]:
     """取得當月最常拒絕任務的員工"""
-    utc_night_filter = UTC_NIGHT_SHIFT_FILTER.replace("m.created_date", "created_date")
-    utc_day_filter = UTC_DAY_SHIFT_FILTER.replace("m.created_date", "created_date")
+    shift_filter, shift_params = get_shift_filter(shift, start_date, end_date, "auditlogheaders")
 
     query = await database.fetch_all(
         f"""
@@ -200,12 +252,12 @@ async def get_top_most_reject_mission_employees(workshop_id: int, start_date: da
             action='MISSION_REJECTED'
             AND (created_date BETWEEN :start_date AND :end_date)
             AND u.location = :workshop_id
-            {utc_night_filter if shift == ShiftType.night else (utc_day_filter if shift == ShiftType.day else "" )}
+            {shift_filter}
         GROUP BY u.username
         ORDER BY count DESC
         LIMIT :limit;
         """,
-        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, "limit": limit},
+        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, "limit": limit, **shift_params},
     )
 
     return [WorkerMissionStats(**m) for m in query]
@@ -220,8 +272,7 @@ async def get_login_users_percentage_by_recent_24_hours(workshop_id: int, start_
     if total_user_count == 0:
         return 0.0
 
-    utc_night_filter = UTC_NIGHT_SHIFT_FILTER.replace("m.created_date", "created_date")
-    utc_day_filter = UTC_DAY_SHIFT_FILTER.replace("m.created_date", "created_date")
+    shift_filter, shift_params = get_shift_filter(shift, start_date, end_date, "a")
 
     result = await database.fetch_all(
         f"""
@@ -231,25 +282,25 @@ async def get_login_users_percentage_by_recent_24_hours(workshop_id: int, start_
             action='USER_LOGIN'
             AND u.level = 1
             AND (created_date BETWEEN :start_date AND :end_date)
-            {utc_night_filter if shift == ShiftType.night else (utc_day_filter if shift == ShiftType.day else "" )}
+            {shift_filter}
             AND u.location = :workshop_id;
         """,
-        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date},
+        {"workshop_id": workshop_id, "start_date": start_date, "end_date": end_date, **shift_params},
     )
 
     return round(result[0][0] / total_user_count, 3)
 
 
-async def get_emergency_missions(workshop_id: int) -> List[MissionDto]:
-    """取得當下緊急任務列表"""
-    missions = (
-        await Mission.objects.filter(
-            is_emergency=True, repair_end_date__isnull=True, is_cancel=False, device__workshop__id=workshop_id
-        )
-        .select_related(["assignees", "device", "device__workshop"])
-        .exclude_fields(["device__workshop__map", "device__workshop__related_devices", "device__workshop__image"])
-        .order_by(["created_date"])
-        .all()
+async def get_emergency_missions(workshop_id: int) -> List[Dict[str, Any]]:
+    """取得當下緊急任務列表（MissionDto 格式的 dict）"""
+    rows = await database.fetch_all(
+        """
+        SELECT m.id FROM missions m
+        INNER JOIN devices d ON d.id = m.device
+        WHERE m.is_emergency = TRUE AND m.repair_end_date IS NULL AND m.is_cancel = FALSE AND d.workshop = :workshop_id
+        ORDER BY m.created_date;
+        """,
+        {"workshop_id": workshop_id},
     )
 
-    return [MissionDto.from_mission(m) for m in missions]
+    return await get_mission_dicts([row["id"] for row in rows])
@@ -1,10 +1,17 @@
 import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
-import aiohttp
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 from fastapi.exceptions import HTTPException
 from ormar import NoMatch, or_, and_
-from app.env import EMQX_PASSWORD, EMQX_USERNAME, MQTT_BROKER, TIMEZONE_OFFSET, WEEK_START
+from app.env import (
+    AUTH_PRINCIPAL_CACHE_TTL,
+    PASSWORD_HASH_WORKERS,
+    SUBORDINATES_CACHE_TTL,
+    TIMEZONE_OFFSET,
+    USERS_OVERVIEW_CACHE_TTL,
+)
 from app.models.schema import (
     DayAndNightUserOverview,
     DeviceExp,
@@ -15,6 +22,7 @@ from app.models.schema import (
     WorkerSummary,
 )
 from passlib.context import CryptContext
+from sqlalchemy import bindparam, text
 from app.core.database import (
     AuditActionEnum,
     AuditLogHeader,
@@ -31,13 +39,29 @@ from app.core.database import (
 )
 from app.models.schema import MissionDto
 from app.services.device import get_device_by_id
-from app.utils.utils import get_current_shift_time_interval
+from app.mqtt.changes import invalidate_shared_cache, share_cache
+from app.mqtt.emqx import emqx_client
+from app.mqtt.presence import presence_map, sync_presence
+from app.my_log_conf import LOGGER_NAME
+from app.utils.cache import TTLCache
+from app.utils.utils import get_current_shift_time_interval, get_local_date_by_datetime, get_week_start_date
+
+logger = logging.getLogger(LOGGER_NAME)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt 每次需要 100~300 ms 的 CPU，放到 thread pool 中執行（執行時會釋放 GIL），不阻塞 event loop
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify, plain_password, hashed_password)
 
 
 async def get_users() -> List[User]:
@@ -45,7 +69,7 @@ async def get_users() -> List[User]:
 
 
 async def create_user(dto: UserCreate) -> User:
-    pw_hash = get_password_hash(dto.password)
+    pw_hash = await get_password_hash(dto.password)
     new_dto = dto.dict()
     del new_dto["password"]
     new_dto["password_hash"] = pw_hash
@@ -63,6 +87,35 @@ async def get_user_by_username(username: str) -> Optional[User]:
     return user
 
 
+# 驗證 API 請求用的使用者資料（username → users 的欄位），更新、刪除使用者或匯入員工資料時以 `invalidate_shared_cache` 清除所有 API process 的快取
+principal_cache: TTLCache[Optional[Dict[str, Any]]] = share_cache(
+    "principals", TTLCache(AUTH_PRINCIPAL_CACHE_TTL, maxsize=4096)
+)
+
+
+async def get_user_principal(username: str) -> Optional[User]:
+    """取得驗證 API 請求的使用者，在 `AUTH_PRINCIPAL_CACHE_TTL` 秒內不會重複查詢資料庫。
+
+    快取中只保存欄位值，每次都建立新的 User，請求之間不會共用同一個 ormar model。
+
+    Args:
+    - username: 使用者名稱
+    """
+
+    async def load_principal() -> Optional[Dict[str, Any]]:
+        user = await get_user_by_username(username)
+
+        if user is None:
+            return None
+
+        principal = user.dict(exclude=User.extract_related_names() - {"location"})
+        principal["location"] = user.location.id if user.location is not None else None
+        return principal
+
+    principal = await principal_cache.get_or_set(username, load_principal)
+    return User(**principal) if principal is not None else None
+
+
 async def update_user(username: str, **kwargs):
     user = await get_user_by_username(username)
 
@@ -75,18 +128,23 @@ async def update_user(username: str, **kwargs):
         filtered = {k: v for k, v in kwargs.items() if v is not None}
 
         if filtered.get("password") is not None:
-            filtered["password_hash"] = get_password_hash(filtered["password"])
+            filtered["password_hash"] = await get_password_hash(filtered["password"])
             del filtered["password"]
 
         await user.update(None, **filtered)
     except Exception as e:
         raise HTTPException(status_code=400, detail="cannot update user:" + repr(e))
+    finally:
+        invalidate_shared_cache("principals", username)
+        invalidate_shared_cache("users_overview")
 
     return user
 
 
 async def delete_user_by_username(username: str):
     affected_row = await User.objects.delete(username=username)
+    invalidate_shared_cache("principals", username)
+    invalidate_shared_cache("users_overview")
 
     if affected_row != 1:
         raise HTTPException(status_code=404, detail="user by this id is not found")
@@ -132,40 +190,44 @@ async def get_worker_mission_history(username: str) -> List[MissionDto]:
 
     return [MissionDto.from_mission(x) for x in missions]
 
-async def get_subordinates_list_by_username(username: str):
-    the_user = await User.objects.filter(username=username).get_or_none()
+# 主管的各層下屬（username → 下屬的 username），下屬關係只在匯入員工資料時改變，改變時以 `invalidate_shared_cache` 清除所有 API process 的快取
+subordinates_cache: TTLCache[List[str]] = share_cache(
+    "subordinates", TTLCache(SUBORDINATES_CACHE_TTL, maxsize=512)
+)
 
-    if the_user is None:
-        raise HTTPException(404, "the user with this id is not found")
 
-    async def get_subsordinates_list(username: str) -> List[str]:
-        result = await database.fetch_all("""
-        SELECT DISTINCT user FROM userdevicelevels u 
-        WHERE u.superior = :superior
-        """, {'superior': username})
+async def get_subordinates_list_by_username(username: str) -> List[str]:
+    """以一個 recursive CTE 取得員工所有層級的下屬，結果快取 `SUBORDINATES_CACHE_TTL` 秒。"""
+
+    async def load_subordinates() -> List[str]:
+        the_user = await User.objects.filter(username=username).get_or_none()
+
+        if the_user is None:
+            raise HTTPException(404, "the user with this id is not found")
+
+        # UNION (DISTINCT) 會去除重複的人，即使下屬關係有循環也會結束
+        result = await database.fetch_all(
+            """
+            WITH RECURSIVE subordinates (username) AS (
+                SELECT DISTINCT u.user FROM userdevicelevels u
+                WHERE u.superior = :superior
+                UNION
+                SELECT u.user FROM userdevicelevels u
+                INNER JOIN subordinates s ON u.superior = s.username
+            )
+            SELECT username FROM subordinates WHERE username != :superior;
+            """,
+            {'superior': username},
+        )
 
         return [row[0] for row in result]
 
-    all_subsordinates = await get_subsordinates_list(username)
-
-    while True:
-        temp = []
-        for name in all_subsordinates:
-            t2 = await get_subsordinates_list(name)
-
-            for x in t2:
-                if x not in temp and x not in all_subsordinates:
-                    temp.append(x)
-        if len(temp) == 0:
-            break
-        all_subsordinates.extend(temp)
-    return all_subsordinates
-        
+    return list(await subordinates_cache.get_or_set(username, load_subordinates))
+
+
 async def get_user_all_level_subordinates_by_username(username: str):
     subsordinates = await get_subordinates_list_by_username(username)
-    promises = [get_worker_status(name) for name in subsordinates]
-    result = await asyncio.gather(*promises)
-    return [x for x in result if x is not None]
+    return await get_worker_status_bulk(subsordinates)
 
 
 async def move_user_to_position(username: str, device_id: str):
@@ -270,55 +332,75 @@ async def is_user_working_on_mission(username: str) -> bool:
     return False
 
 
-async def get_users_overview(workshop_name: str) -> DayAndNightUserOverview:
-    users = await User.objects.select_related("location").filter(location__name=workshop_name).all()
+# 車間的員工技能總覽（workshop_name → 總覽），只在匯入員工或機台資料、更新使用者時改變，改變時以 `invalidate_shared_cache` 清除所有 API process 的快取
+users_overview_cache: TTLCache[DayAndNightUserOverview] = share_cache(
+    "users_overview", TTLCache(USERS_OVERVIEW_CACHE_TTL)
+)
+
 
-    day_overview: List[UserOverviewOut] = []
-    night_overview: List[UserOverviewOut] = []
-    shift_types = [0, 1]
+def group_users_overview(rows: List[Mapping[str, Any]]) -> DayAndNightUserOverview:
+    """將依 (shift, username, userdevicelevels.id) 排序的資料，依班別與員工分組成總覽。
 
-    for s in shift_types:
-        for u in users:
+    Args:
+    - rows: 每一列為一筆 userdevicelevels 與其員工、主管、機台的資料
+    """
+    overviews: Dict[Tuple[int, str], UserOverviewOut] = {}
+
+    for row in rows:
+        overview = overviews.get((row["shift"], row["username"]))
+
+        if overview is None:
             overview = UserOverviewOut(
-                username=u.username,
-                full_name=u.full_name,
-                level=u.level,
-                shift=s,
+                username=row["username"],
+                full_name=row["full_name"],
+                workshop=row["workshop"],
+                level=row["level"],
+                shift=row["shift"],
                 experiences=[],
             )
-
-            if u.location is not None:
-                overview.workshop = u.location.name
-
-            device_levels = (
-                await UserDeviceLevel.objects.select_related(["superior", "device"])
-                .filter(user=u, shift=s)
-                .all()
+            overviews[(row["shift"], row["username"])] = overview
+
+        # 以第一筆有主管的技能資料作為員工的主管
+        if overview.superior is None and row["superior"] is not None:
+            overview.superior = row["superior"]
+
+        overview.experiences.append(
+            DeviceExp(
+                project=row["project"],
+                process=row["process"],
+                device_name=row["device_name"],
+                line=row["line"],
+                exp=row["exp"],
             )
+        )
+
+    return DayAndNightUserOverview(
+        day_shift=[o for (shift, _), o in overviews.items() if shift == ShiftType.day.value],
+        night_shift=[o for (shift, _), o in overviews.items() if shift == ShiftType.night.value],
+    )
 
-            if len(device_levels) == 0:
-                continue
-
-            for dl in device_levels:
-                if overview.superior is None and dl.superior is not None:
-                    overview.superior = dl.superior.full_name
-
-                overview.experiences.append(
-                    DeviceExp(
-                        project=dl.device.project,
-                        process=dl.device.process,
-                        device_name=dl.device.device_name,
-                        line=dl.device.line,
-                        exp=dl.level,
-                    )
-                )
 
-            if s == 0:
-                day_overview.append(overview)
-            else:
-                night_overview.append(overview)
+async def get_users_overview(workshop_name: str) -> DayAndNightUserOverview:
+    """車間所有員工在各班別的機台技能，以一個查詢取得，結果快取 `USERS_OVERVIEW_CACHE_TTL` 秒。"""
+
+    async def load_overview() -> DayAndNightUserOverview:
+        rows = await database.fetch_all(
+            """
+            SELECT u.username, u.full_name, u.level, f.name AS workshop, udl.shift, udl.level AS exp,
+                s.full_name AS superior, d.project, d.process, d.device_name, d.line
+            FROM users u
+            INNER JOIN factorymaps f ON f.id = u.location
+            INNER JOIN userdevicelevels udl ON udl.user = u.username
+            INNER JOIN devices d ON d.id = udl.device
+            LEFT JOIN users s ON s.username = udl.superior
+            WHERE f.name = :workshop_name
+            ORDER BY udl.shift, u.username, udl.id;
+            """,
+            {"workshop_name": workshop_name},
+        )
+        return group_users_overview(rows)
 
-    return DayAndNightUserOverview(day_shift=day_overview, night_shift=night_overview)
+    return await users_overview_cache.get_or_set(workshop_name, load_overview)
 
 
 async def get_user_summary(username: str) -> Optional[WorkerSummary]:
@@ -332,96 +414,65 @@ async def get_user_summary(username: str) -> Optional[WorkerSummary]:
     if worker.level != UserLevel.maintainer.value:
         return None
 
-    total_accepted_count_this_month = await database.fetch_all(
-        f"""
-        SELECT COUNT(DISTINCT record_pk)
-        FROM auditlogheaders
-        WHERE `action` = '{AuditActionEnum.MISSION_ACCEPTED.value}'
-        AND user='{username}'
-        AND MONTH(`created_date` + HOUR({TIMEZONE_OFFSET})) = MONTH(UTC_TIMESTAMP() + HOUR({TIMEZONE_OFFSET}))
-        """,
-    )
-
-    total_accepted_count_this_week = await database.fetch_all(
-        f"""
-        SELECT COUNT(DISTINCT record_pk) FROM auditlogheaders
-        WHERE `action` = '{AuditActionEnum.MISSION_ACCEPTED.value}'
-        AND user='{username}'
-        AND YEARWEEK(`created_date` + HOUR({TIMEZONE_OFFSET}), {WEEK_START}) = YEARWEEK(UTC_TIMESTAMP() + HOUR({TIMEZONE_OFFSET}), {WEEK_START})
-        """,
-    )
-
-    total_rejected_count_this_month = await database.fetch_all(
-        f"""
-        SELECT COUNT(DISTINCT record_pk)
-        FROM auditlogheaders
-        WHERE `action` = '{AuditActionEnum.MISSION_REJECTED.value}'
-        AND user='{username}'
-        AND MONTH(`created_date` + HOUR({TIMEZONE_OFFSET})) = MONTH(UTC_TIMESTAMP() + HOUR({TIMEZONE_OFFSET}))
-        """,
-    )
-
-    total_rejected_count_this_week = await database.fetch_all(
-        f"""
-        SELECT COUNT(DISTINCT record_pk) FROM auditlogheaders
-        WHERE `action` = '{AuditActionEnum.MISSION_REJECTED.value}'
-        AND user='{username}'
-        AND YEARWEEK(`created_date` + HOUR({TIMEZONE_OFFSET}), {WEEK_START}) = YEARWEEK(UTC_TIMESTAMP() + HOUR({TIMEZONE_OFFSET}), {WEEK_START})
+    today = get_local_date_by_datetime(datetime.utcnow())
+    month_start = today.replace(day=1)
+    week_start = get_week_start_date(today)
+
+    row = await database.fetch_one(
+        """
+        SELECT
+            COALESCE(SUM(CASE WHEN day >= :month_start THEN accepted_count END), 0) AS accepted_this_month,
+            COALESCE(SUM(CASE WHEN day >= :week_start THEN accepted_count END), 0) AS accepted_this_week,
+            COALESCE(SUM(CASE WHEN day >= :month_start THEN rejected_count END), 0) AS rejected_this_month,
+            COALESCE(SUM(CASE WHEN day >= :week_start THEN rejected_count END), 0) AS rejected_this_week
+        FROM worker_daily_stats
+        WHERE user = :username AND day BETWEEN :range_start AND :today
         """,
+        {
+            "username": username,
+            "month_start": month_start,
+            "week_start": week_start,
+            # 每週第一天可能在上個月
+            "range_start": min(month_start, week_start),
+            "today": today,
+        },
     )
 
     return WorkerSummary(
-        total_accepted_count_this_month=total_accepted_count_this_month[0][0],
-        total_accepted_count_this_week=total_accepted_count_this_week[0][0],
-        total_rejected_count_this_month=total_rejected_count_this_month[0][0],
-        total_rejected_count_this_week=total_rejected_count_this_week[0][0],
+        total_accepted_count_this_month=row["accepted_this_month"],
+        total_accepted_count_this_week=row["accepted_this_week"],
+        total_rejected_count_this_month=row["rejected_this_month"],
+        total_rejected_count_this_week=row["rejected_this_week"],
     )
 
 
 async def get_worker_attendances(username: str) -> List[WorkerAttendance]:
-    if not await User.objects.filter(username=username).exists():
-        return []
-
-    worker_attendances: List[WorkerAttendance] = []
-
-    user_login_days_this_month = await database.fetch_all(
-        f"""
-        SELECT DATE(ADDTIME(loginrecord.created_date, '{TIMEZONE_OFFSET}:00')) `day`, ADDTIME(loginrecord.created_date, '{TIMEZONE_OFFSET}:00') as `time`, loginrecord.description
-        FROM auditlogheaders loginrecord,
-        (
-            SELECT action, MIN(created_date) min_login_date , DAY(ADDTIME(created_date, '{TIMEZONE_OFFSET}:00'))
-            FROM auditlogheaders
-            WHERE `action` = '{AuditActionEnum.USER_LOGIN.value}' AND user='{username}'
-            GROUP BY DAY(ADDTIME(created_date, '{TIMEZONE_OFFSET}:00'))
-        ) min_login
-        WHERE loginrecord.`action` = '{AuditActionEnum.USER_LOGIN.value}' AND loginrecord.created_date = min_login.min_login_date;
-        """,
-    )
-
-    user_logout_days_this_month = await database.fetch_all(
-        f"""
-        SELECT DATE(ADDTIME(logoutrecord.created_date, '{TIMEZONE_OFFSET}:00')) `day`, ADDTIME(logoutrecord.created_date, '{TIMEZONE_OFFSET}:00') as `time`, logoutrecord.description
-        FROM auditlogheaders logoutrecord,
-        (
-            SELECT action, MAX(created_date) max_logout_date , DAY(ADDTIME(created_date, '{TIMEZONE_OFFSET}:00'))
-            FROM auditlogheaders
-            WHERE `action` = '{AuditActionEnum.USER_LOGOUT.value}' AND user='{username}'
-            GROUP BY DAY(ADDTIME(created_date, '{TIMEZONE_OFFSET}:00'))
-        ) max_logout
-        WHERE logoutrecord.`action` = '{AuditActionEnum.USER_LOGOUT.value}' AND logoutrecord.created_date = max_logout.max_logout_date;
+    """取得員工本月每天最早的登入時間與最晚的登出時間（當地時間）。"""
+    today = get_local_date_by_datetime(datetime.utcnow())
+
+    rows = await database.fetch_all(
+        """
+        SELECT day, first_login_date, last_logout_date, last_logout_reason
+        FROM worker_daily_stats
+        WHERE user = :username AND day BETWEEN :month_start AND :today AND first_login_date IS NOT NULL
+        ORDER BY day
         """,
+        {"username": username, "month_start": today.replace(day=1), "today": today},
     )
 
-    for login_record in user_login_days_this_month:
-        a = WorkerAttendance(date=login_record[0], login_datetime=login_record[1])
-        for logout_record in user_logout_days_this_month:
-            if login_record[0] == logout_record[0]:
-                a.logout_datetime = logout_record[1]
-                a.logout_reason = logout_record[2]
-                break
-        worker_attendances.append(a)
-
-    return worker_attendances
+    return [
+        WorkerAttendance(
+            date=row["day"],
+            login_datetime=row["first_login_date"] + timedelta(hours=TIMEZONE_OFFSET),
+            logout_datetime=(
+                row["last_logout_date"] + timedelta(hours=TIMEZONE_OFFSET)
+                if row["last_logout_date"] is not None
+                else None
+            ),
+            logout_reason=row["last_logout_reason"],
+        )
+        for row in rows
+    ]
 
 
 async def check_user_connected(username: str) -> Tuple[bool, Optional[str]]:
@@ -432,23 +483,16 @@ async def check_user_connected(username: str) -> Tuple[bool, Optional[str]]:
         - connected: bool - True if connected, False otherwise
         - ip_address: str - if user is connected, this field represents the IP address of the client
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"http://{MQTT_BROKER}:18083/api/v4/clients/{username}",
-            auth=aiohttp.BasicAuth(login=EMQX_USERNAME, password=EMQX_PASSWORD),
-        ) as resp:
-            if resp.status != 200:
-                return False, None
-
-            try:
-                content = await resp.json()
+    try:
+        await sync_presence()
 
-                if len(content["data"]) == 0:
-                    return False, None
+        if presence_map.is_ready():
+            p = presence_map.get(username)
+            return (True, p.ip_address) if p is not None and p.connected else (False, None)
 
-                return content["data"][0]["connected"], content["data"][0]["ip_address"]
-            except:
-                return False, None
+        return await emqx_client.check_connected(username)
+    except:
+        return False, None
 
 async def get_user_shift_type(username: str) -> ShiftType:
     """取得員工的班別"""
@@ -473,47 +517,148 @@ async def is_worker_in_device_whitelist(username: str, device_id: str) -> bool:
     return await WhitelistDevice.objects.select_related(['workers']).filter(workers__username=username, device=device_id).exists()
 
 async def get_worker_status(username: str) -> Optional[WorkerStatusDto]:
-    s = (
-        await WorkerStatus.objects.filter(worker=username)
-        .select_related(["worker", 'at_device'])
-        .get_or_none()
+    result = await get_worker_status_bulk([username])
+    return result[0] if len(result) != 0 else None
+
+
+# 這些狀態的員工身上有進行中的任務，需要回傳任務與維修的經過時間
+MISSION_STATUSES = [WorkerStatusEnum.working.value, WorkerStatusEnum.moving.value, WorkerStatusEnum.notice.value]
+
+
+def build_worker_status_dto(
+    status: Mapping[str, Any], total_dispatches: int, mission: Optional[Mapping[str, Any]], now: datetime
+) -> WorkerStatusDto:
+    """由 `get_worker_status_bulk` 查詢到的資料建立 WorkerStatusDto。
+
+    Args:
+    - status: worker_status 與 users、devices join 的資料
+    - total_dispatches: 員工本班開始的任務數
+    - mission: 員工最新一個尚未完成的任務，沒有則為 None
+    - now: 目前時間（UTC），用來計算任務經過時間
+    """
+    item = WorkerStatusDto(
+        worker_id=status["worker"],
+        worker_name=status["full_name"],
+        status=status["status"],
+        last_event_end_date=status["last_event_end_date"],
+        total_dispatches=total_dispatches,
+        is_online=presence_map.is_connected(status["worker"]),
+        at_device=status["at_device"],
+        at_device_cname=status["device_cname"],
     )
 
-    if s is None:
-        return None
+    if status["status"] in MISSION_STATUSES and mission is not None:
+        item.mission_duration = (now - mission["created_date"]).total_seconds()
 
-    shift_start, shift_end = get_current_shift_time_interval()
+        if mission["repair_start_date"] is not None and not mission["is_rescue"]:
+            item.repair_duration = (now - mission["repair_start_date"]).total_seconds()
 
-    total_start_count = await database.fetch_val(
-        f"""
-        SELECT COUNT(DISTINCT mu.mission) FROM missions_users mu 
-        INNER JOIN missions m ON m.id = mu.mission
-        INNER JOIN auditlogheaders a ON a.record_pk = m.id 
-        WHERE mu.user = :username AND a.action = 'MISSION_STARTED' AND (a.created_date BETWEEN :shift_start AND :shift_end);
-        """,
-        {'username': username, 'shift_start': shift_start, 'shift_end': shift_end},
+        if status["status"] == WorkerStatusEnum.moving.value:
+            item.at_device = mission["device"]
+            item.at_device_cname = mission["device_cname"]
+
+    return item
+
+
+# get_worker_status_bulk / get_workshop_worker_status 共用的狀態查詢，依條件加上 WHERE
+WORKER_STATUS_QUERY = """
+    SELECT ws.worker, u.full_name, ws.status, ws.last_event_end_date, ws.at_device, d.device_cname
+    FROM worker_status ws
+    INNER JOIN users u ON u.username = ws.worker
+    LEFT JOIN devices d ON d.id = ws.at_device
+"""
+
+
+async def get_worker_status_bulk(usernames: List[str]) -> List[WorkerStatusDto]:
+    """取得多位員工的狀態，不論人數都只需要 3 個查詢：狀態、本班開始的任務數與進行中的任務。
+
+    依 usernames 的順序回傳，沒有狀態資料的員工會被略過。
+
+    Args:
+    - usernames: 員工的 username
+    """
+    if len(usernames) == 0:
+        return []
+
+    statuses = await database.fetch_all(
+        text(WORKER_STATUS_QUERY + "WHERE ws.worker IN :usernames;").bindparams(
+            bindparam("usernames", usernames, expanding=True)
+        )
     )
+    status_by_worker = {s["worker"]: s for s in statuses}
 
-    item = WorkerStatusDto(
-        worker_id=username,
-        worker_name=s.worker.full_name,
-        status=s.status,
-        last_event_end_date=s.last_event_end_date,
-        total_dispatches=total_start_count,
+    return await build_worker_status_dtos([status_by_worker[u] for u in usernames if u in status_by_worker])
+
+
+async def get_workshop_worker_status(workshop_name: str) -> List[WorkerStatusDto]:
+    """取得車間所有維修人員的狀態，與 `get_worker_status_bulk` 相同只需要 3 個查詢。
+
+    Args:
+    - workshop_name: 車間名稱
+    """
+    statuses = await database.fetch_all(
+        WORKER_STATUS_QUERY
+        + """
+        INNER JOIN factorymaps f ON f.id = u.location
+        WHERE f.name = :workshop_name AND u.level = :level;
+        """,
+        {"workshop_name": workshop_name, "level": UserLevel.maintainer.value},
     )
 
-    item.at_device = s.at_device.id if s.at_device is not None else None
-    item.at_device_cname = s.at_device.device_cname if s.at_device is not None else None
+    return await build_worker_status_dtos(statuses)
+
+
+async def build_worker_status_dtos(statuses: List[Mapping[str, Any]]) -> List[WorkerStatusDto]:
+    """為查詢到的員工狀態補上本班開始的任務數與進行中的任務（各一個查詢），依 statuses 的順序回傳。"""
+    if len(statuses) == 0:
+        return []
+
+    usernames = [s["worker"] for s in statuses]
+    shift_start, shift_end = get_current_shift_time_interval()
 
-    mission = await get_user_working_mission(username)
-    if s.status in [WorkerStatusEnum.working.value, WorkerStatusEnum.moving.value, WorkerStatusEnum.notice.value] and mission is not None:
-        item.mission_duration = mission.mission_duration.total_seconds() # type: ignore
+    dispatch_counts = await database.fetch_all(
+        text(
+            """
+            SELECT mu.user, COUNT(DISTINCT mu.mission) FROM missions_users mu
+            INNER JOIN missions m ON m.id = mu.mission
+            INNER JOIN auditlogheaders a ON a.record_pk = m.id
+            WHERE mu.user IN :usernames AND a.action = 'MISSION_STARTED' AND (a.created_date BETWEEN :shift_start AND :shift_end)
+            GROUP BY mu.user;
+            """
+        ).bindparams(
+            bindparam("usernames", usernames, expanding=True), shift_start=shift_start, shift_end=shift_end
+        )
+    )
+    total_dispatches: Dict[str, int] = {row[0]: row[1] for row in dispatch_counts}
+
+    # 只有正在處理任務的員工需要查詢任務，同一人有多個未完成的任務時取最新的（id 最大）
+    missions: Dict[str, Mapping[str, Any]] = {}
+    busy_workers = [s["worker"] for s in statuses if s["status"] in MISSION_STATUSES]
+
+    if len(busy_workers) != 0:
+        rows = await database.fetch_all(
+            text(
+                """
+                SELECT mu.user, m.created_date, m.repair_start_date, m.device, d.device_cname, d.is_rescue
+                FROM missions m
+                INNER JOIN missions_users mu ON mu.mission = m.id
+                INNER JOIN devices d ON d.id = m.device
+                WHERE mu.user IN :usernames AND m.is_cancel = FALSE AND m.repair_end_date IS NULL
+                ORDER BY m.id;
+                """
+            ).bindparams(bindparam("usernames", busy_workers, expanding=True))
+        )
+        missions = {row["user"]: row for row in rows}
 
-        if mission.repair_duration is not None and not mission.device.is_rescue:
-            item.repair_duration = mission.repair_duration.total_seconds()
+    try:
+        # 與 broker 重新連線後，已在線的員工不會再發出連線事件，需要先取得在線名單才知道 is_online
+        await sync_presence()
+    except Exception as e:
+        logger.warning(f"cannot fetch connected clients from EMQX: {repr(e)}")
 
-        if s.status == WorkerStatusEnum.moving.value:
-            item.at_device = mission.device.id
-            item.at_device_cname = mission.device.device_cname
+    now = datetime.utcnow()
 
-    return item
\ No newline at end of file
+    return [
+        build_worker_status_dto(s, total_dispatches.get(s["worker"], 0), missions.get(s["worker"]), now)
+        for s in statuses
+    ]
\ No newline at end of file
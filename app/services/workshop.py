@@ -1,14 +1,24 @@
+import asyncio
 import io
+import multiprocessing
 import qrcode
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
 from qrcode.constants import ERROR_CORRECT_M
 from fastapi.exceptions import HTTPException
-from app.core.database import Device, FactoryMap, Mission, WorkerStatus, WorkerStatusEnum
+from app.core.database import FactoryMap, WorkerStatusEnum, database
+from app.env import DEVICE_STATUS_CACHE_TTL, QRCODE_CHUNK_SIZE, QRCODE_WORKERS, QRCODE_ZIP_CACHE_MAX_BYTES
 from zipfile import ZipFile
 from PIL import ImageDraw, ImageFont
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from app.models.schema import DeviceStatus, DeviceStatusEnum
+from app.utils.cache import TTLCache
 
-font = ImageFont.truetype("./data/NotoSansTC-Regular.otf", 14)
+@lru_cache(maxsize=None)
+def get_qrcode_font() -> ImageFont.FreeTypeFont:
+    """QR code 標籤的字型，第一次產生 QR code 時才載入。"""
+    return ImageFont.truetype("./data/NotoSansTC-Regular.otf", 14)
 
 
 async def get_factory_map_by_id(factory_map_id: int):
@@ -29,102 +39,273 @@ async def get_factory_map_by_name(factory_map_name: str):
     return await FactoryMap.objects.filter(name=factory_map_name).get_or_none()
 
 
-async def get_all_devices_status(workshop_name: str, is_rescue=False):
-    """取得車間下所有機台狀態。
+device_status_cache: TTLCache[List[Tuple[bool, DeviceStatus]]] = TTLCache(DEVICE_STATUS_CACHE_TTL)
+
+
+def resolve_device_status(mission_id: Optional[int], assignee: Optional[str], worker_status: Optional[str]) -> DeviceStatusEnum:
+    """依機台最新的未完成任務判斷機台狀態。
 
     Args:
-    - workshop_name: 車間名稱
-    - is_rescue: 是否過濾救援站
+    - mission_id: 機台最新一筆未完成任務 ID，沒有則為 None
+    - assignee: 該任務的第一位負責員工
+    - worker_status: 該員工目前的狀態
     """
+    if mission_id is None:
+        return DeviceStatusEnum.working
+
+    if assignee is None:
+        return DeviceStatusEnum.halt
+
+    if worker_status is None or worker_status == WorkerStatusEnum.leave.value:
+        return DeviceStatusEnum.halt
 
-    workshop = await get_factory_map_by_name(workshop_name)
+    return DeviceStatusEnum.repairing
+
+
+async def fetch_all_devices_status(workshop_name: str) -> List[Tuple[bool, DeviceStatus]]:
+    """以單一查詢取得車間下所有機台（含救援站）的狀態，回傳 (is_rescue, DeviceStatus) 列表。"""
+    workshop = await FactoryMap.objects.filter(name=workshop_name).fields(["id", "name"]).get_or_none()
     if workshop is None:
         raise HTTPException(404, "workshop is not found")
 
-    device_status_arr: List[DeviceStatus] = []
-    devices = await Device.objects.filter(workshop=workshop, is_rescue=is_rescue).all()
+    rows = await database.fetch_all(
+        """
+        WITH open_missions AS (
+            SELECT m.id, m.device, ROW_NUMBER() OVER (PARTITION BY m.device ORDER BY m.created_date DESC, m.id DESC) as mission_rank
+            FROM missions m
+            INNER JOIN devices d ON d.id = m.device
+            WHERE d.workshop = :workshop_id AND m.is_cancel = FALSE AND m.repair_end_date IS NULL
+        ),
+        first_assignees AS (
+            SELECT mu.mission, mu.user, ROW_NUMBER() OVER (PARTITION BY mu.mission ORDER BY mu.id) as assignee_rank
+            FROM missions_users mu
+            INNER JOIN open_missions om ON om.id = mu.mission AND om.mission_rank = 1
+        )
+        SELECT d.id as device_id, d.x_axis, d.y_axis, d.is_rescue, om.id as mission_id, fa.user as assignee, ws.status as worker_status
+        FROM devices d
+        LEFT OUTER JOIN open_missions om ON om.device = d.id AND om.mission_rank = 1
+        LEFT OUTER JOIN first_assignees fa ON fa.mission = om.id AND fa.assignee_rank = 1
+        LEFT OUTER JOIN worker_status ws ON ws.worker = fa.user
+        WHERE d.workshop = :workshop_id
+        ORDER BY d.id;
+        """,
+        {"workshop_id": workshop.id},
+    )
 
-    for d in devices:
-        related_missions = (
-            await Mission.objects.filter(
-                device=d, is_cancel=False, repair_end_date__isnull=True
-            )
-            .select_related(["assignees"])
-            .order_by("-created_date")
-            .all()
+    return [
+        (
+            bool(row["is_rescue"]),
+            DeviceStatus(
+                device_id=row["device_id"],
+                x_axis=row["x_axis"],
+                y_axis=row["y_axis"],
+                status=resolve_device_status(row["mission_id"], row["assignee"], row["worker_status"]),
+            ),
         )
+        for row in rows
+    ]
+
+
+async def get_all_devices_status(workshop_name: str, is_rescue: Optional[bool] = False) -> List[DeviceStatus]:
+    """取得車間下所有機台狀態。結果會依車間快取 `DEVICE_STATUS_CACHE_TTL` 秒。
+
+    Args:
+    - workshop_name: 車間名稱
+    - is_rescue: 是否過濾救援站，None 代表回傳全部機台
+    """
+
+    all_devices_status = await device_status_cache.get_or_set(
+        workshop_name, lambda: fetch_all_devices_status(workshop_name)
+    )
+
+    return [s for rescue, s in all_devices_status if is_rescue is None or rescue == is_rescue]
+
 
-        device_status = DeviceStatus(
-            device_id=d.id,
-            x_axis=d.x_axis,
-            y_axis=d.y_axis,
-            status=DeviceStatusEnum.working,
+# 車間 id -> (車間的 updated_date, zip)，依最近使用的順序排列
+qrcode_zip_cache: Dict[int, Tuple[datetime, bytes]] = {}
+
+qrcode_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_qrcode_pool() -> ProcessPoolExecutor:
+    """取得產生 QRCode 用的 process pool，第一次使用時才建立。
+
+    建立時 API process 已經有其他 thread（MQTT、車間圖的 thread pool），
+    fork 會把其他 thread 持有中的 lock 一併複製到子 process 而可能 deadlock，因此改用 spawn。
+    """
+    global qrcode_pool
+
+    if qrcode_pool is None:
+        qrcode_pool = ProcessPoolExecutor(
+            max_workers=QRCODE_WORKERS, mp_context=multiprocessing.get_context("spawn")
         )
 
-        if len(related_missions) == 0:
-            device_status.status = DeviceStatusEnum.working
+    return qrcode_pool
+
+
+def shutdown_qrcode_pool():
+    global qrcode_pool
+
+    if qrcode_pool is not None:
+        qrcode_pool.shutdown(wait=False)
+        qrcode_pool = None
+
+
+def get_cached_qrcode_zip(workshop_id: int, updated_date: datetime) -> Optional[bytes]:
+    cached = qrcode_zip_cache.pop(workshop_id, None)
+
+    if cached is None or cached[0] != updated_date:
+        return None
+
+    # move to the end as the most recently used
+    qrcode_zip_cache[workshop_id] = cached
+    return cached[1]
+
+
+def cache_qrcode_zip(workshop_id: int, updated_date: datetime, data: bytes):
+    """快取車間的 QRCode zip，總大小超過 `QRCODE_ZIP_CACHE_MAX_BYTES` 時移除最久未使用的車間。
+
+    Args:
+    - workshop_id: 車間 ID
+    - updated_date: 產生 zip 時車間的 updated_date，車間更新後快取即失效
+    - data: zip 的內容
+    """
+    qrcode_zip_cache.pop(workshop_id, None)
+
+    if len(data) > QRCODE_ZIP_CACHE_MAX_BYTES:
+        return
+
+    qrcode_zip_cache[workshop_id] = (updated_date, data)
+    total = sum(len(d) for _, d in qrcode_zip_cache.values())
+
+    while total > QRCODE_ZIP_CACHE_MAX_BYTES:
+        _, evicted = qrcode_zip_cache.pop(next(iter(qrcode_zip_cache)))
+        total -= len(evicted)
+
+
+def render_device_qrcodes(device_ids: List[str]) -> List[Tuple[str, bytes]]:
+    """產生一批機台的 QRCode 照片（PNG），在 process pool 中執行。
+
+    Args:
+    - device_ids: 機台 ID
+    """
+    result: List[Tuple[str, bytes]] = []
+
+    for device_id in device_ids:
+        # we don't need to create rescue station qrcode.
+        # if "rescue" in device_id:
+        #     continue
+
+        split_text = device_id.split("@")
+
+        qr = qrcode.QRCode(
+            version=2, error_correction=ERROR_CORRECT_M, box_size=10, border=6,
+        )
+        qr.add_data(device_id)
+        qr.make(fit=True)
+        img = qr.make_image()
+
+        # add device_id at top-left corner
+        if split_text[0] == "rescue":
+            ImageDraw.Draw(img).text(
+                (10, 0),
+                f"車間：{split_text[1]}\n救援站編號：{split_text[2]}",
+                fill=0,
+                font=get_qrcode_font(),
+            )
         else:
-            m = related_missions[0]
-            if len(m.assignees) > 0:
-                worker_status = await WorkerStatus.objects.filter(worker=m.assignees[0].username).get_or_none()
+            ImageDraw.Draw(img).text(
+                (10, 0),
+                f"Project: {split_text[0]} Line: {split_text[1]}\nDevice Name: {split_text[2]}",
+                fill=0,
+                font=get_qrcode_font(),
+            )
+
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format=img.format)
+        result.append((device_id, img_bytes.getvalue()))
 
-                if worker_status is None or worker_status.status == WorkerStatusEnum.leave.value:
-                    device_status.status = DeviceStatusEnum.halt
-                else:
-                    device_status.status = DeviceStatusEnum.repairing
-            else:
-                device_status.status = DeviceStatusEnum.halt
+    return result
 
-        device_status_arr.append(device_status)
 
-    return device_status_arr
+class ZipStreamBuffer(io.RawIOBase):
+    """讓 ZipFile 寫入的不可 seek 緩衝區，寫入的資料可以分段取出並串流回傳。"""
 
+    def __init__(self):
+        self.chunks: List[bytes] = []
 
-async def create_workshop_device_qrcode(workshop_name: str):
-    """取得車間之所有機台 QRCode 照片。
+    def writable(self):
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def stream_qrcode_zip(workshop: FactoryMap) -> AsyncIterator[bytes]:
+    """將車間機台分批交給 process pool 平行產生 QRCode，並依序寫入 zip 串流回傳。
+
+    完整產生後，zip 會以車間的 `updated_date` 快取起來。
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_qrcode_pool()
+    device_ids: List[str] = workshop.related_devices
+
+    futures = [
+        loop.run_in_executor(pool, render_device_qrcodes, device_ids[i : i + QRCODE_CHUNK_SIZE])
+        for i in range(0, len(device_ids), QRCODE_CHUNK_SIZE)
+    ]
+
+    buffer = ZipStreamBuffer()
+    parts: List[bytes] = []
+
+    try:
+        with ZipFile(buffer, "w") as zip_file:
+            for future in futures:
+                for device_id, png in await future:
+                    zip_file.writestr(f"{device_id}.png", png)
+
+                data = buffer.drain()
+                parts.append(data)
+                yield data
+
+        data = buffer.drain()
+        parts.append(data)
+        yield data
+    finally:
+        for future in futures:
+            future.cancel()
+
+    cache_qrcode_zip(workshop.id, workshop.updated_date, b"".join(parts))
+
+
+async def iterate_bytes(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def create_workshop_device_qrcode(workshop_name: str) -> AsyncIterator[bytes]:
+    """取得車間之所有機台 QRCode 照片，以 zip 串流的方式回傳。
 
     Args:
     - workshop_name: 車間名稱
     """
-    workshop = await get_factory_map_by_name(workshop_name)
+    workshop = (
+        await FactoryMap.objects.filter(name=workshop_name)
+        .fields(["id", "name", "related_devices", "updated_date"])
+        .get_or_none()
+    )
 
     if workshop is None:
         raise HTTPException(404, "workshop is not found")
 
-    zip_io = io.BytesIO()
-    with ZipFile(zip_io, "w") as zip_file:
-        for device_id in workshop.related_devices:
-            # we don't need to create rescue station qrcode.
-            # if "rescue" in device_id:
-            #     continue
+    cached = get_cached_qrcode_zip(workshop.id, workshop.updated_date)
 
-            split_text = device_id.split("@")
+    if cached is not None:
+        return iterate_bytes(cached)
 
-            qr = qrcode.QRCode(
-                version=2, error_correction=ERROR_CORRECT_M, box_size=10, border=6,
-            )
-            qr.add_data(device_id)
-            qr.make(fit=True)
-            img = qr.make_image()
-
-            # add device_id at top-left corner
-            if split_text[0] == "rescue":
-                ImageDraw.Draw(img).text(
-                    (10, 0),
-                    f"車間：{split_text[1]}\n救援站編號：{split_text[2]}",
-                    fill=0,
-                    font=font,
-                )
-            else:
-                ImageDraw.Draw(img).text(
-                    (10, 0),
-                    f"Project: {split_text[0]} Line: {split_text[1]}\nDevice Name: {split_text[2]}",
-                    fill=0,
-                    font=font,
-                )
-
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format=img.format)
-            zip_file.writestr(f"{device_id}.png", img_bytes.getvalue())
-
-    return zip_io.getvalue()
+    return stream_qrcode_zip(workshop)
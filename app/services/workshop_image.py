@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from fastapi.exceptions import HTTPException
+from app.core.database import FactoryMap
+from app.env import IMAGE_RENDER_VARIANTS, IMAGE_RENDER_WORKERS
+from app.models.schema import DeviceStatus, DeviceStatusEnum
+
+# colors are in BGR
+WORKING = (0, 255, 0)  # green 0
+REPAIRING = (0, 140, 255)  # orange 1
+HALT = (0, 0, 255)  # red 2
+NAVIGATE_DEVICE = (0, 0, 255)
+NAVIGATE_WORKER = (255, 0, 0)
+POINT_SCALE = 120
+
+STATUS_COLORS = {
+    DeviceStatusEnum.working: WORKING,
+    DeviceStatusEnum.repairing: REPAIRING,
+    DeviceStatusEnum.halt: HALT,
+}
+
+Point = Tuple[int, int]
+Color = Tuple[int, int, int]
+Rect = Tuple[int, int, int, int]
+
+render_executor = ThreadPoolExecutor(max_workers=IMAGE_RENDER_WORKERS, thread_name_prefix="workshop-image")
+
+
+class ImageVariant:
+    """車間圖某一尺寸的版本：縮放後的底圖，以及畫上機台狀態的畫布。
+
+    畫布會保留上一次畫上的機台狀態，之後只重畫狀態或位置有變動的機台。
+    """
+
+    def __init__(self, base: np.ndarray, scale: float, radius: int):
+        self.base = base
+        self.canvas = base.copy()
+        self.scale = scale
+        self.radius = radius
+        self.drawn: Dict[str, Tuple[Point, Color]] = {}
+        self.etag: Optional[str] = None
+        self.png: Optional[bytes] = None
+
+    def center(self, s: DeviceStatus) -> Point:
+        return int(s.x_axis * self.scale), int(s.y_axis * self.scale)
+
+    def bounding_rect(self, center: Point) -> Rect:
+        x, y = center
+        r = self.radius + 1
+        return max(x - r, 0), max(y - r, 0), x + r + 1, y + r + 1
+
+    def draw_statuses(self, statuses: List[DeviceStatus]) -> int:
+        """將機台狀態畫到畫布上，回傳狀態有變動的機台數量。"""
+        wanted: Dict[str, Tuple[Point, Color]] = {
+            s.device_id: (self.center(s), STATUS_COLORS[s.status]) for s in statuses
+        }
+        changed = {k for k in set(wanted) | set(self.drawn) if wanted.get(k) != self.drawn.get(k)}
+
+        if len(changed) == 0:
+            return 0
+
+        # restore the base image under circles that are changed or removed
+        dirty_rects: List[Rect] = []
+        for device_id in changed:
+            if device_id in self.drawn:
+                x0, y0, x1, y1 = self.bounding_rect(self.drawn[device_id][0])
+                self.canvas[y0:y1, x0:x1] = self.base[y0:y1, x0:x1]
+                dirty_rects.append((x0, y0, x1, y1))
+
+        # redraw in the original order, so circles overlapping a redrawn area stay on top as before
+        for device_id, (center, color) in wanted.items():
+            rect = self.bounding_rect(center)
+            if device_id in changed or any(is_overlapped(rect, d) for d in dirty_rects):
+                cv2.circle(self.canvas, center, self.radius, color, -1)
+                dirty_rects.append(rect)
+
+        self.drawn = wanted
+        self.png = None
+        return len(changed)
+
+
+class WorkshopImage:
+    """快取中的車間圖，對應到某個 `FactoryMap.updated_date`。"""
+
+    def __init__(self, updated_date: datetime, base: np.ndarray):
+        self.updated_date = updated_date
+        self.base = base
+        self.height, self.width = base.shape[:2]
+        self.radius = int(self.height / POINT_SCALE)
+        self.variants: "OrderedDict[Optional[int], ImageVariant]" = OrderedDict()
+        self.lock = asyncio.Lock()
+
+    def create_variant(self, max_img_value: Optional[int]) -> ImageVariant:
+        if max_img_value is None:
+            return ImageVariant(self.base, 1.0, self.radius)
+
+        scale = max_img_value / max(self.height, self.width)
+        n_h, n_w = int(self.height * scale), int(self.width * scale)
+        resized = cv2.resize(self.base, (n_w, n_h), interpolation=cv2.INTER_AREA)
+        return ImageVariant(resized, scale, max(int(round(self.radius * scale)), 1))
+
+    async def get_variant(self, max_img_value: Optional[int]) -> ImageVariant:
+        """取得指定尺寸的版本，只保留最近使用的 `IMAGE_RENDER_VARIANTS` 個尺寸；縮放與複製底圖在 thread pool 中執行。"""
+        variant = self.variants.get(max_img_value)
+
+        if variant is None:
+            loop = asyncio.get_running_loop()
+            variant = await loop.run_in_executor(render_executor, self.create_variant, max_img_value)
+            self.variants[max_img_value] = variant
+
+            while len(self.variants) > IMAGE_RENDER_VARIANTS:
+                self.variants.popitem(last=False)
+
+        self.variants.move_to_end(max_img_value)
+        return variant
+
+
+workshop_images: Dict[int, WorkshopImage] = {}
+
+
+def is_overlapped(a: Rect, b: Rect) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def encode_png(img: np.ndarray) -> bytes:
+    _, im_buf_arr = cv2.imencode(".png", img)
+    return im_buf_arr.tobytes()
+
+
+def decode_image(raw_image: bytes) -> np.ndarray:
+    img_buffer_numpy = np.frombuffer(raw_image, dtype=np.uint8)
+    return cv2.imdecode(img_buffer_numpy, 1)
+
+
+def generate_image_etag(
+    workshop: FactoryMap,
+    all_devices_status: List[DeviceStatus],
+    max_img_value: Optional[int],
+    navigate_device_id: Optional[str],
+    navigate_worker_id: Optional[str],
+) -> str:
+    """依車間圖版本、尺寸、導航目標與機台位置/狀態產生 ETag，內容相同時 ETag 也相同。"""
+    digest = hashlib.sha1()
+    digest.update(
+        repr(
+            (
+                workshop.id,
+                workshop.updated_date.isoformat() if workshop.updated_date is not None else None,
+                max_img_value,
+                navigate_device_id,
+                navigate_worker_id,
+            )
+        ).encode()
+    )
+
+    for s in all_devices_status:
+        digest.update(f"|{s.device_id},{s.x_axis},{s.y_axis},{s.status.value}".encode())
+
+    return f'"{digest.hexdigest()}"'
+
+
+def is_etag_matched(etag: str, if_none_match: Optional[str]) -> bool:
+    if if_none_match is None:
+        return False
+
+    candidates = [x.strip() for x in if_none_match.split(",")]
+    return "*" in candidates or etag in [x[2:] if x.startswith("W/") else x for x in candidates]
+
+
+async def has_workshop_image(workshop: FactoryMap) -> bool:
+    """車間圖是否已上傳，已快取目前版本時不需要查詢資料庫。"""
+    cached = workshop_images.get(workshop.id)
+
+    if cached is not None and cached.updated_date == workshop.updated_date:
+        return True
+
+    return await FactoryMap.objects.filter(id=workshop.id, image__isnull=False).exists()
+
+
+async def get_workshop_image_cache(workshop: FactoryMap) -> WorkshopImage:
+    """取得解碼後的車間底圖，只在 `updated_date` 改變時重新讀取與解碼。"""
+    cached = workshop_images.get(workshop.id)
+
+    if cached is not None and cached.updated_date == workshop.updated_date:
+        return cached
+
+    w = await FactoryMap.objects.filter(id=workshop.id).fields(["id", "image"]).get()
+
+    if w.image is None:
+        raise HTTPException(404, "the workshop image is not yet uploaded")
+
+    loop = asyncio.get_running_loop()
+    base = await loop.run_in_executor(render_executor, decode_image, w.image)
+
+    cached = WorkshopImage(workshop.updated_date, base)
+    workshop_images[workshop.id] = cached
+    return cached
+
+
+async def render_workshop_image(
+    workshop: FactoryMap,
+    all_devices_status: List[DeviceStatus],
+    etag: str,
+    max_img_value: Optional[int] = None,
+    navigate_device_id: Optional[str] = None,
+    navigate_worker_id: Optional[str] = None,
+) -> bytes:
+    """繪製車間狀態圖並編碼為 PNG，解碼、繪圖與編碼皆在 thread pool 中執行。
+
+    Args:
+    - workshop: 車間，至少需包含 id 與 updated_date
+    - all_devices_status: 機台狀態
+    - etag: 這張圖的 ETag，用於判斷快取的 PNG 是否可以沿用
+    - max_img_value: 圖片最長邊的長度
+    - navigate_device_id: 要導航的機台 ID
+    - navigate_worker_id: 員工所在的機台 ID
+    """
+    image = await get_workshop_image_cache(workshop)
+    is_navigating = bool(navigate_device_id or navigate_worker_id)
+
+    if max_img_value:
+        if max_img_value > max(image.height, image.width):
+            raise HTTPException(404, "maxImgValue too large or equal to zero")
+
+    for obj in all_devices_status:
+        if is_navigating and obj.device_id not in (navigate_device_id, navigate_worker_id):
+            continue
+
+        if obj.x_axis >= image.width or obj.y_axis >= image.height:
+            raise HTTPException(404, "(x, y) is out of range")
+
+    loop = asyncio.get_running_loop()
+
+    async with image.lock:
+        variant = await image.get_variant(max_img_value or None)
+
+        if is_navigating:
+            def render_navigation() -> bytes:
+                img = variant.base.copy()
+                for obj in all_devices_status:
+                    if obj.device_id == navigate_device_id:
+                        cv2.circle(img, variant.center(obj), variant.radius, NAVIGATE_DEVICE, -1)
+                    if obj.device_id == navigate_worker_id:
+                        cv2.circle(img, variant.center(obj), variant.radius, NAVIGATE_WORKER, -1)
+                return encode_png(img)
+
+            return await loop.run_in_executor(render_executor, render_navigation)
+
+        if variant.etag == etag and variant.png is not None:
+            return variant.png
+
+        def render_statuses() -> bytes:
+            variant.draw_statuses(all_devices_status)
+            if variant.png is None:
+                variant.png = encode_png(variant.canvas)
+            return variant.png
+
+        png = await loop.run_in_executor(render_executor, render_statuses)
+        variant.etag = etag
+        return png
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import orjson
+from sqlalchemy import bindparam, text
+from app.core.database import UserLevel, database
+from app.env import WORKSHOP_STREAM_BATCH_INTERVAL, WORKSHOP_STREAM_KEEPALIVE, WORKSHOP_STREAM_QUEUE_SIZE
+from app.my_log_conf import LOGGER_NAME
+from app.services.mission import get_mission_dicts, get_missions_page
+from app.services.user import get_worker_status_bulk, get_workshop_worker_status
+from app.services.workshop import device_status_cache, get_all_devices_status
+from app.utils.pubsub import PubSub
+from app.utils.response import default
+from app.utils.utils import gather_with_limit
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def format_event(event: str, data: Any) -> bytes:
+    """編碼為一則 Server-Sent Event。"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, default=default) + b"\n\n"
+
+
+class WorkshopStreamHub:
+    """將任務、員工狀態的變更通知（`app.mqtt.changes`）轉為各車間的即時推送。
+
+    每批變更只查詢一次，再分送給訂閱該車間的所有客戶端；沒有客戶端訂閱時不做任何查詢。
+    推送的內容都是項目當下的完整狀態，重複或晚到的推送可以直接覆蓋，不需要依序套用。
+    """
+
+    def __init__(self, batch_interval: float, queue_size: int):
+        self.batch_interval = batch_interval
+        self.bus: PubSub[bytes] = PubSub(queue_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pending: Set[Tuple[str, Any]] = set()
+        # 已推送的機台狀態（車間 → 機台 → 狀態），只推送有改變的機台
+        self._devices: Dict[str, Dict[str, dict]] = {}
+        # 已推送給訂閱中的車間、尚未結束的任務所屬的車間，任務被刪除時用來通知該車間
+        self._mission_workshops: Dict[int, str] = {}
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        self.bus.close()
+        self._devices.clear()
+        self._mission_workshops.clear()
+
+    def handle_change(self, payload: bytes):
+        """MQTT 收到變更通知時呼叫（在 paho 的 thread 中）。"""
+        if self._loop is None:
+            return
+
+        try:
+            change = orjson.loads(payload)
+            key = (change["kind"], change["key"])
+        except Exception:
+            logger.warning(f"invalid change notification: {payload!r}")
+            return
+
+        self._loop.call_soon_threadsafe(self.add_change, *key)
+
+    def add_change(self, kind: str, key: Any):
+        if self._wakeup is None or not self.bus.has_subscribers():
+            return
+
+        self._pending.add((kind, key))
+        self._wakeup.set()
+
+    async def _run(self):
+        assert self._wakeup is not None
+        while True:
+            await self._wakeup.wait()
+            # 合併短時間內的多筆變更，一次查詢
+            await asyncio.sleep(self.batch_interval)
+            self._wakeup.clear()
+            changes, self._pending = self._pending, set()
+
+            try:
+                await self.process(changes)
+            except Exception as e:
+                logger.error(f"failed to push workshop changes: {repr(e)}")
+
+    async def process(self, changes: Set[Tuple[str, Any]]):
+        mission_ids = sorted(key for kind, key in changes if kind == "mission")
+        usernames = sorted(key for kind, key in changes if kind == "worker")
+        workshops: Set[str] = set()
+
+        if len(mission_ids) > 0:
+            workshops |= await self.push_missions(mission_ids)
+
+        if len(usernames) > 0:
+            workshops |= await self.push_workers(usernames)
+
+        for workshop_name in workshops:
+            device_status_cache.invalidate(workshop_name)
+            if self.bus.has_subscribers(workshop_name):
+                await self.push_devices(workshop_name)
+
+    async def push_missions(self, mission_ids: List[int]) -> Set[str]:
+        missions = await get_mission_dicts(mission_ids)
+        workshops: Set[str] = set()
+
+        for m in missions:
+            workshop_name = m["device"]["workshop"]
+            workshops.add(workshop_name)
+            self.bus.publish(workshop_name, format_event("mission", m))
+
+            if m["is_closed"] or m["is_cancel"] or not self.bus.has_subscribers(workshop_name):
+                self._mission_workshops.pop(m["mission_id"], None)
+            else:
+                self._mission_workshops[m["mission_id"]] = workshop_name
+
+        # 查不到的任務已被刪除
+        for mission_id in set(mission_ids) - {m["mission_id"] for m in missions}:
+            workshop_name = self._mission_workshops.pop(mission_id, None)
+            if workshop_name is not None:
+                workshops.add(workshop_name)
+                self.bus.publish(workshop_name, format_event("mission_removed", {"mission_id": mission_id}))
+
+        return workshops
+
+    async def push_workers(self, usernames: List[str]) -> Set[str]:
+        rows = await database.fetch_all(
+            text(
+                """
+                SELECT u.username, f.name AS workshop FROM users u
+                INNER JOIN factorymaps f ON f.id = u.location
+                WHERE u.username IN :usernames AND u.level = :level;
+                """
+            ).bindparams(bindparam("usernames", usernames, expanding=True), level=UserLevel.maintainer.value)
+        )
+        workshop_by_worker = {row["username"]: row["workshop"] for row in rows}
+        subscribed = [u for u, w in workshop_by_worker.items() if self.bus.has_subscribers(w)]
+
+        for status in await get_worker_status_bulk(subscribed):
+            self.bus.publish(workshop_by_worker[status.worker_id], format_event("worker_status", status))
+
+        return set(workshop_by_worker.values())
+
+    async def push_devices(self, workshop_name: str):
+        devices = {d.device_id: d.dict() for d in await get_all_devices_status(workshop_name)}
+        previous = self._devices.get(workshop_name, {})
+        changed = [d for device_id, d in devices.items() if previous.get(device_id) != d]
+        self._devices[workshop_name] = devices
+
+        if len(changed) > 0:
+            self.bus.publish(workshop_name, format_event("device_status", changed))
+
+    async def snapshot(self, workshop_name: str) -> Dict[str, Any]:
+        devices, workers, (missions, _) = await gather_with_limit(
+            get_all_devices_status(workshop_name),
+            get_workshop_worker_status(workshop_name),
+            get_missions_page(workshop_name=workshop_name, is_closed=False, is_cancel=False),
+            database=database,
+        )
+
+        # 已有其他客戶端訂閱時保留原本的狀態，避免尚未處理的變更因為 snapshot 較新而漏送
+        self._devices.setdefault(workshop_name, {d.device_id: d.dict() for d in devices})
+        for m in missions:
+            self._mission_workshops[m["mission_id"]] = workshop_name
+
+        return {"devices": devices, "workers": workers, "missions": missions}
+
+    async def stream(self, workshop_name: str) -> AsyncIterator[bytes]:
+        """車間的 Server-Sent Events：先送出 `snapshot`，之後送出 `mission`、`mission_removed`、`worker_status`、`device_status` 的變更。
+
+        客戶端跟不上推送速度時會收到 `resync` 並結束連線，重新連線後會取得新的 snapshot。
+        """
+        # subscribe before taking the snapshot, so changes made meanwhile are pushed afterwards
+        subscription = self.bus.subscribe(workshop_name)
+        try:
+            yield format_event("snapshot", await self.snapshot(workshop_name))
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), WORKSHOP_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # keep proxies from closing an idle connection
+                    yield b": keepalive\n\n"
+                    continue
+
+                if message is None:
+                    if subscription.overflowed:
+                        yield format_event("resync", {})
+                    return
+
+                yield message
+        finally:
+            self.bus.unsubscribe(subscription)
+            # 沒有客戶端訂閱時不會處理變更，已推送的狀態也就不再準確
+            if not self.bus.has_subscribers(workshop_name):
+                self.forget(workshop_name)
+
+    def forget(self, workshop_name: str):
+        """清除車間已推送的狀態，下一個訂閱的客戶端會從 snapshot 重新開始。"""
+        self._devices.pop(workshop_name, None)
+        self._mission_workshops = {k: w for k, w in self._mission_workshops.items() if w != workshop_name}
+
+
+workshop_stream_hub = WorkshopStreamHub(WORKSHOP_STREAM_BATCH_INTERVAL, WORKSHOP_STREAM_QUEUE_SIZE)
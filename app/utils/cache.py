@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """In-memory cache whose entries expire after `ttl` seconds.
+
+    `get_or_set` coalesces concurrent misses of the same key (single-flight):
+    only the first caller runs the factory, the others wait for its result.
+
+    Args:
+    - ttl: 每筆快取的存活時間（秒），小於等於 0 代表停用快取
+    - maxsize: 最多保留的快取筆數
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: Dict[Hashable, Tuple[float, V]] = {}
+        self._inflight: Dict[Hashable, "asyncio.Future[V]"] = {}
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        return value
+
+    def set(self, key: Hashable, value: V):
+        if self.ttl <= 0:
+            return
+
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+        if len(self._entries) > self.maxsize:
+            now = time.monotonic()
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+            # still full, evict the oldest entries
+            while len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """清除指定的快取，若未指定 key 則清除全部。
+
+        正在計算中的結果仍會回傳給等待的呼叫者，但不會寫入快取，避免存入清除前讀到的舊資料。
+        """
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    async def get_or_set(self, key: Hashable, factory: Callable[[], Awaitable[V]]) -> V:
+        value = self.get(key)
+
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+
+        def on_done(t: "asyncio.Future[V]"):
+            # invalidated while computing
+            if self._inflight.get(key) is not t:
+                return
+
+            del self._inflight[key]
+            if not t.cancelled() and t.exception() is None:
+                self.set(key, t.result())
+
+        task.add_done_callback(on_done)
+
+        # shield the computation so a cancelled caller won't cancel it for the others.
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,183 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+from databases import Database
+from prometheus_client import Counter, Gauge, Histogram
+from app.utils.profiler import record_query
+
+# 目前執行中的 routine 名稱，用來標記資料庫查詢屬於哪個 routine；API 請求則為 "api"
+metrics_scope: ContextVar[str] = ContextVar("metrics_scope", default="api")
+
+ROUTINE_DURATION = Histogram(
+    "foxlink_routine_duration_seconds",
+    "Duration of daemon routines",
+    ["routine"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+DB_QUERY_DURATION = Histogram(
+    "foxlink_db_query_duration_seconds",
+    "Duration of database queries, database is 'main' or the Foxlink DB host",
+    ["database", "scope"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+DB_POOL_WAIT = Histogram(
+    "foxlink_db_pool_wait_seconds",
+    "Time spent waiting for a connection from the database pool",
+    ["database"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "foxlink_db_pool_connections",
+    "Connections of the database pool, state is 'in_use', 'waiting' (for a free connection) or 'max'",
+    ["database", "state"],
+)
+
+DB_REPLICA_READS = Counter(
+    "foxlink_db_replica_reads_total",
+    "Connections acquired for read-only requests, target is 'replica' or 'primary' (fallback)",
+    ["target"],
+)
+
+MQTT_PUBLISH_LATENCY = Histogram(
+    "foxlink_mqtt_publish_latency_seconds",
+    "Time from queueing an MQTT message until the broker acknowledges it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+MQTT_MESSAGES = Counter(
+    "foxlink_mqtt_messages_total",
+    "MQTT messages handled by the publisher, by result",
+    ["result"],
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "foxlink_http_request_duration_seconds",
+    "Duration of API requests",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+class InstrumentedConnection:
+    """包裝 databases 的 backend connection，記錄等待連線與查詢的時間。"""
+
+    def __init__(self, connection, database_name: str):
+        self._connection = connection
+        self._database_name = database_name
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    async def acquire(self):
+        waiting = DB_POOL_CONNECTIONS.labels(self._database_name, "waiting")
+        waiting.inc()
+        start = time.perf_counter()
+        try:
+            await self._connection.acquire()
+        finally:
+            waiting.dec()
+        DB_POOL_WAIT.labels(self._database_name).observe(time.perf_counter() - start)
+        DB_POOL_CONNECTIONS.labels(self._database_name, "in_use").inc()
+
+    async def release(self):
+        try:
+            await self._connection.release()
+        finally:
+            DB_POOL_CONNECTIONS.labels(self._database_name, "in_use").dec()
+
+    async def _timed(self, fn: Callable, query, *args, **kwargs):
+        start = time.perf_counter()
+        result = None
+        try:
+            result = await fn(query, *args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_QUERY_DURATION.labels(self._database_name, metrics_scope.get()).observe(elapsed)
+            # execute_many is given a list of queries built from the same statement
+            record_query(query[0] if isinstance(query, list) and query else query, elapsed, result)
+
+    async def fetch_all(self, query, *args, **kwargs):
+        return await self._timed(self._connection.fetch_all, query, *args, **kwargs)
+
+    async def fetch_one(self, query, *args, **kwargs):
+        return await self._timed(self._connection.fetch_one, query, *args, **kwargs)
+
+    async def fetch_val(self, query, *args, **kwargs):
+        return await self._timed(self._connection.fetch_val, query, *args, **kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(self._connection.execute, query, *args, **kwargs)
+
+    async def execute_many(self, queries, *args, **kwargs):
+        return await self._timed(self._connection.execute_many, queries, *args, **kwargs)
+
+
+class InstrumentedBackend:
+    def __init__(self, backend, database_name: str):
+        self._backend = backend
+        self._database_name = database_name
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._backend, name)
+
+    def connection(self):
+        return InstrumentedConnection(self._backend.connection(), self._database_name)
+
+
+def instrument_database(database: Database, database_name: str) -> Database:
+    """讓資料庫的查詢時間與等待連線的時間記錄到 metrics 中。
+
+    Args:
+    - database: 要記錄的資料庫
+    - database_name: metrics 中的資料庫名稱
+    """
+    if not isinstance(database._backend, InstrumentedBackend):
+        database._backend = InstrumentedBackend(database._backend, database_name)  # type: ignore
+
+    max_size = database.options.get("max_size")
+    if max_size is not None:
+        DB_POOL_CONNECTIONS.labels(database_name, "max").set(max_size)
+    return database
+
+
+class MetricsMiddleware:
+    """記錄每個 API route 的處理時間（ASGI middleware）。"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict[Callable, str]] = None
+
+    def route_path(self, scope) -> str:
+        # use the route template instead of the raw path, so path params don't explode the labels
+        if self._route_paths is None:
+            self._route_paths = {
+                r.endpoint: r.path for r in scope["app"].routes if hasattr(r, "endpoint")
+            }
+
+        endpoint = scope.get("endpoint")
+        return self._route_paths.get(endpoint, "unmatched") if endpoint is not None else "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], self.route_path(scope), str(status_code)
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,153 @@
+import logging
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from app.env import SQL_PROFILER, SQL_PROFILER_HISTORY, SQL_PROFILER_N_PLUS_ONE
+from app.my_log_conf import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r":\w+|%\(\w+\)s|%s|__\[POSTCOMPILE_\w+\]")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(query: Any) -> str:
+    """將 SQL 正規化為指紋：參數與常數換成 ?，IN 列表合併，空白壓縮。"""
+    sql = str(query)
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _BIND_PARAM.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _VALUE_LIST.sub("(?+)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryStats:
+    __slots__ = ("count", "total_time", "max_time", "rows")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+
+
+class QueryProfile:
+    """一次 API 請求或一次背景 routine 執行中，所有 SQL 查詢的統計。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.utcnow()
+        self.queries: Dict[str, QueryStats] = {}
+        self.duration: Optional[float] = None
+        self._start = time.perf_counter()
+
+    def record(self, query: Any, elapsed: float, rows: int):
+        stats = self.queries.setdefault(fingerprint(query), QueryStats())
+        stats.count += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        stats.rows += rows
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    @property
+    def query_count(self) -> int:
+        return sum(s.count for s in self.queries.values())
+
+    def suspected_n_plus_one(self, threshold: int = SQL_PROFILER_N_PLUS_ONE) -> List[str]:
+        """同一個查詢指紋執行次數達到門檻，多半是在迴圈中逐筆查詢（N+1）。"""
+        return [sql for sql, s in self.queries.items() if s.count >= threshold]
+
+    def report(self) -> Dict[str, Any]:
+        queries = sorted(self.queries.items(), key=lambda x: x[1].total_time, reverse=True)
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "query_count": self.query_count,
+            "query_time": sum(s.total_time for s in self.queries.values()),
+            "n_plus_one": self.suspected_n_plus_one(),
+            "queries": [
+                {
+                    "sql": sql,
+                    "count": s.count,
+                    "total_time": s.total_time,
+                    "max_time": s.max_time,
+                    "rows": s.rows,
+                }
+                for sql, s in queries
+            ],
+        }
+
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_profile", default=None)
+
+recent_profiles: Deque[QueryProfile] = deque(maxlen=SQL_PROFILER_HISTORY)
+
+
+def record_query(query: Any, elapsed: float, result: Any):
+    """由資料庫連線在每次查詢後呼叫，沒有在分析中時不做任何事。"""
+    profile = current_profile.get()
+
+    if profile is None:
+        return
+
+    if isinstance(result, list):
+        rows = len(result)
+    else:
+        rows = 0 if result is None else 1
+
+    profile.record(query, elapsed, rows)
+
+
+@contextmanager
+def profile_queries(name: str, enabled: bool = SQL_PROFILER) -> Iterator[Optional[QueryProfile]]:
+    """分析區塊中的 SQL 查詢，結束後保留在 `recent_profiles`，若疑似有 N+1 查詢則記錄警告。
+
+    Args:
+    - name: 分析的名稱，例如 API route 或 routine 名稱
+    - enabled: 是否啟用，預設依 `SQL_PROFILER` 設定
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = QueryProfile(name)
+    token = current_profile.set(profile)
+
+    try:
+        yield profile
+    finally:
+        current_profile.reset(token)
+        profile.finish()
+
+        if profile.query_count > 0:
+            recent_profiles.append(profile)
+
+        for sql in profile.suspected_n_plus_one():
+            logger.warning(
+                f"[{name}] possible N+1 query, executed {profile.queries[sql].count} times: {sql}"
+            )
+
+
+class ProfilerMiddleware:
+    """以 `METHOD path` 為名稱，分析每個 API 請求的 SQL 查詢（ASGI middleware）。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_PROFILER:
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
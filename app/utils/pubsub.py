@@ -0,0 +1,91 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Generic, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+
+class Subscription(Generic[T]):
+    """一個訂閱者的訊息佇列；佇列滿了代表訂閱者跟不上，訂閱會被關閉（`overflowed`）。"""
+
+    def __init__(self, topic: str, maxsize: int):
+        self.topic = topic
+        self.overflowed = False
+        self._queue: "asyncio.Queue[Optional[T]]" = asyncio.Queue(maxsize)
+        self._closed = False
+
+    def put(self, message: T) -> bool:
+        if self._closed:
+            return False
+
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.close()
+            return False
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        # wake up the reader, the sentinel may drop one pending message when the queue is full
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def get(self) -> Optional[T]:
+        """取得下一則訊息，訂閱關閉後回傳 None。"""
+        return await self._queue.get()
+
+
+class PubSub(Generic[T]):
+    """process 內以 topic 區分的 async pub/sub，發布不會等待訂閱者。"""
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self._subscriptions: Dict[str, Set[Subscription[T]]] = defaultdict(set)
+
+    def subscribe(self, topic: str) -> Subscription[T]:
+        subscription: Subscription[T] = Subscription(topic, self.maxsize)
+        self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription[T]):
+        subscription.close()
+        subscriptions = self._subscriptions.get(subscription.topic)
+
+        if subscriptions is None:
+            return
+
+        subscriptions.discard(subscription)
+        if len(subscriptions) == 0:
+            del self._subscriptions[subscription.topic]
+
+    def has_subscribers(self, topic: Optional[str] = None) -> bool:
+        if topic is None:
+            return len(self._subscriptions) > 0
+        return topic in self._subscriptions
+
+    def topics(self) -> Set[str]:
+        return set(self._subscriptions.keys())
+
+    def close(self):
+        """關閉所有訂閱。"""
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                self.unsubscribe(subscription)
+
+    def publish(self, topic: str, message: T) -> int:
+        """發布訊息給 topic 的所有訂閱者，回傳成功送達的數量；佇列已滿的訂閱者會被移除。"""
+        delivered = 0
+
+        for subscription in list(self._subscriptions.get(topic, ())):
+            if subscription.put(message):
+                delivered += 1
+            else:
+                self.unsubscribe(subscription)
+
+        return delivered
@@ -0,0 +1,17 @@
+from typing import Any
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+
+def default(o):
+    if isinstance(o, BaseModel):
+        return o.dict()
+    raise TypeError
+
+
+class ORJSONResponse(JSONResponse):
+    """以 orjson 編碼的 JSON 回應，datetime 等型別由 orjson 直接輸出，不需先經過 jsonable_encoder。"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=default, option=orjson.OPT_NON_STR_KEYS)
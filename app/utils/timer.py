@@ -1,10 +1,13 @@
 import asyncio
 import logging
+import time
 import traceback
 from typing import Callable
 from contextlib import suppress
 
 from app.my_log_conf import LOGGER_NAME
+from app.utils.metrics import ROUTINE_DURATION, metrics_scope
+from app.utils.profiler import profile_queries
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -34,11 +37,17 @@ class Ticker:
         while True:
             await asyncio.sleep(self.time)
 
+            token = metrics_scope.set(self.func.__name__)
+            start = time.perf_counter()
             try:
-                await self.func()
+                with profile_queries(self.func.__name__):
+                    await self.func()
             except Exception as e:
                 logger.error(
                     f"""
                     Ticker error: {repr(e)}
                     Traceback: {traceback.format_exc()}
                     """)
+            finally:
+                metrics_scope.reset(token)
+                ROUTINE_DURATION.labels(self.func.__name__).observe(time.perf_counter() - start)
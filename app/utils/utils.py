@@ -1,9 +1,13 @@
 from pickle import TUPLE
+import asyncio
 import pytz
-from typing import Tuple
+from typing import Awaitable, List, Optional, Tuple, TypeVar
+from databases import Database
 from app.core.database import ShiftType
-from datetime import datetime, timedelta
-from app.env import DAY_SHIFT_BEGIN, DAY_SHIFT_END
+from datetime import date, datetime, timedelta
+from app.env import DATABASE_FANOUT_LIMIT, DAY_SHIFT_BEGIN, DAY_SHIFT_END, WEEK_START
+
+T = TypeVar("T")
 
 CST_TIMEZONE = pytz.timezone("Asia/Taipei")
 
@@ -43,6 +47,22 @@ def get_shift_type_by_datetime(dt: datetime) -> ShiftType:
     else:
         return ShiftType.night
 
+def get_shift_date_by_datetime(dt: datetime) -> date:
+    """取得 dt (UTC) 所屬班別開始的日期（當地時間），例如凌晨的夜班屬於前一天的班別。"""
+    day_begin = datetime.strptime(DAY_SHIFT_BEGIN, "%H:%M")
+
+    china_tz_dt = dt + CST_TIMEZONE.utcoffset(dt)
+    return (china_tz_dt - timedelta(hours=day_begin.hour, minutes=day_begin.minute)).date()
+
+def get_local_date_by_datetime(dt: datetime) -> date:
+    """取得 dt (UTC) 在當地時間的日期。"""
+    return (dt + CST_TIMEZONE.utcoffset(dt)).date()
+
+def get_week_start_date(d: date) -> date:
+    """取得 d 所在週的第一天，與 MySQL `YEARWEEK(..., WEEK_START)` 相同：WEEK_START 為偶數時週日開始，奇數時週一開始。"""
+    days = (d.weekday() + 1) % 7 if WEEK_START % 2 == 0 else d.weekday()
+    return d - timedelta(days=days)
+
 def get_current_shift_time_interval() -> Tuple[datetime, datetime]:
     shift_type = get_shift_type_now()
     now_time = datetime.now(CST_TIMEZONE)
@@ -89,6 +109,32 @@ def get_previous_shift_time_interval():
 
     return day_shift_start.astimezone(pytz.utc), day_shift_end.astimezone(pytz.utc), night_shift_start.astimezone(pytz.utc), night_shift_end.astimezone(pytz.utc)
 
+async def gather_with_limit(
+    *aws: Awaitable[T], database: Optional[Database] = None, limit: int = DATABASE_FANOUT_LIMIT
+) -> List[T]:
+    """與 `asyncio.gather` 相同，但同時執行的協程不超過 limit 個。
+
+    databases 以 ContextVar 保存目前的連線，gather 出來的 task 會繼承呼叫者的連線，
+    查詢仍在同一條連線上依序執行；指定 database 時每個協程改用自己的連線，才會真的同時查詢，
+    同時佔用的連線也不超過 limit 條，不會佔滿連線池讓其他 routine / API 請求都在等連線。
+
+    Args:
+    - aws: 要執行的協程
+    - database: 協程查詢所使用的資料庫
+    - limit: 同時執行的數量上限
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw: Awaitable[T]) -> T:
+        async with semaphore:
+            if database is not None:
+                # 只會設定到這個 task 的 context，不影響呼叫者的連線；
+                # databases 沒有對應的公開 API，因此在 requirements.in 固定了 databases 的版本
+                database._new_connection()
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws))
+
     
 
 
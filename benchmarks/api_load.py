@@ -0,0 +1,368 @@
+"""
+In-process load test of the HTTP API (`app.main:app`).
+
+The app is started with its own startup/shutdown handlers and requests are sent
+straight to the ASGI app, so the numbers include routing, dependencies,
+serialization and the database but no network or HTTP server. MQTT messages go
+to a stub broker running in a background thread which acknowledges and drops
+everything.
+
+Two kinds of virtual users run concurrently, each with its own seeded account:
+
+- workers log in once, then on every iteration load `/users/info`,
+  `/missions/self` and the workshop image, and accept, start and finish the
+  mission seeded for that iteration
+- managers log in once, then on every iteration load the dashboard:
+  `/stats/`, `/stats/{workshop}/worker-status`, `/missions/` and the workshop image
+
+Usage:
+    python -m benchmarks.api_load --workers 50 --managers 5 --iterations 10 --output report.json
+
+The rows are written into the database configured by the DATABASE_* env
+variables, so point it at a scratch database (MySQL 8). Every seeded row belongs
+to the `benchmark-load` workshop and is removed when the benchmark finishes.
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import cv2
+import numpy as np
+
+import app.main as app_main
+from app.core.database import UserLevel, WorkerStatusEnum, database
+from app.foxlink_db import foxlink_db
+from app.services.user import get_password_hash
+from benchmarks.report import git_revision, write_report
+
+WORKSHOP_NAME = "benchmark-load"
+DEVICE_PREFIX = "BENCHLOAD@1@Device_"
+DEVICE_PATTERN = "BENCHLOAD@%"
+WORKER_PREFIX = "bench-load-w"
+MANAGER_PREFIX = "bench-load-m"
+USER_PATTERN = "bench-load-%"
+PASSWORD = "benchmark"
+IMAGE_SIZE = (1000, 1600)  # height, width
+
+
+class StubMqttBroker:
+    """A MQTT 3.1.1 broker which acknowledges every packet and drops the messages."""
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = 0
+        self.received = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self) -> "StubMqttBroker":
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        server.close()
+        self._loop.run_until_complete(server.wait_closed())
+        self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, shift = 0, 0
+                while True:
+                    b = (await reader.readexactly(1))[0]
+                    length |= (b & 0x7F) << shift
+                    shift += 7
+                    if b & 0x80 == 0:
+                        break
+                body = await reader.readexactly(length)
+                kind = header >> 4
+
+                if kind == 1:  # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 3:  # PUBLISH
+                    self.received += 1
+                    qos = (header >> 1) & 0x03
+                    if qos > 0:
+                        topic_len = int.from_bytes(body[:2], "big")
+                        mid = body[2 + topic_len:4 + topic_len]
+                        writer.write((b"\x40\x02" if qos == 1 else b"\x50\x02") + mid)
+                elif kind == 6:  # PUBREL
+                    writer.write(b"\x70\x02" + body[:2])
+                elif kind == 8:  # SUBSCRIBE, grant QoS 0 to every topic
+                    topics, i = 0, 2
+                    while i < len(body):
+                        i += 2 + int.from_bytes(body[i:i + 2], "big") + 1
+                        topics += 1
+                    writer.write(bytes([0x90, 2 + topics]) + body[:2] + bytes(topics))
+                elif kind == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    break
+
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def request(
+    method: str, path: str, query: Optional[Dict[str, Any]] = None, token: Optional[str] = None, form: Optional[Dict[str, str]] = None
+) -> Tuple[int, bytes]:
+    """Send one request to the ASGI app, returns the status code and body."""
+    headers = [(b"host", b"benchmark")]
+    body = b""
+    if token is not None:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    if form is not None:
+        body = urlencode(form).encode()
+        headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+        headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "path": path, "raw_path": path.encode(), "root_path": "", "scheme": "http",
+        "query_string": urlencode(query or {}).encode(), "headers": headers,
+        "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+    }
+    status = 500
+    chunks: List[bytes] = []
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.Event().wait()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app_main.app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[int, int]] = {}
+
+    async def call(self, route: str, method: str, path: str, **kwargs) -> bytes:
+        start = time.perf_counter()
+        status, body = await request(method, path, **kwargs)
+        self.latencies.setdefault(f"{method} {route}", []).append(time.perf_counter() - start)
+
+        if status >= 400:
+            errors = self.errors.setdefault(f"{method} {route}", {})
+            errors[status] = errors.get(status, 0) + 1
+        return body
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        result = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            pct = lambda p: round(values[min(int(len(values) * p), len(values) - 1)] * 1000, 2)
+            result[route] = {
+                "count": len(values),
+                "errors": self.errors.get(route, {}),
+                "throughput": round(len(values) / duration, 2),
+                "p50_ms": pct(0.5),
+                "p95_ms": pct(0.95),
+                "p99_ms": pct(0.99),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        return result
+
+
+async def seed(devices: int, workers: int, managers: int, iterations: int):
+    _, png = cv2.imencode(".png", np.full((*IMAGE_SIZE, 3), 255, dtype=np.uint8))
+    password_hash = await get_password_hash(PASSWORD)
+    missions = workers * iterations
+
+    async with database.connection() as conn:
+        await conn.execute(f"SET SESSION cte_max_recursion_depth = {max(devices, workers, managers, missions) + 1}")
+
+        await conn.execute(
+            "INSERT INTO factorymaps (name, map, related_devices, image) VALUES (:name, '[]', '[]', :image)",
+            {"name": WORKSHOP_NAME, "image": png.tobytes()},
+        )
+        workshop_id = await conn.fetch_val("SELECT id FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+        mission_base = await conn.fetch_val("SELECT COALESCE(MAX(id), 0) FROM missions")
+
+        await conn.execute(
+            f"""
+            INSERT INTO devices (id, project, line, device_name, x_axis, y_axis, is_rescue, workshop)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {devices})
+            SELECT CONCAT('{DEVICE_PREFIX}', n), 'BENCHLOAD', 1, CONCAT('Device_', n),
+                50 + (n * 37) % {IMAGE_SIZE[1] - 100}, 50 + (n * 53) % {IMAGE_SIZE[0] - 100}, n = {devices}, :workshop_id
+            FROM seq
+            """,
+            {"workshop_id": workshop_id},
+        )
+        for prefix, count, level in ((WORKER_PREFIX, workers, UserLevel.maintainer), (MANAGER_PREFIX, managers, UserLevel.manager)):
+            if count == 0:
+                continue
+            await conn.execute(
+                f"""
+                INSERT INTO users (username, password_hash, full_name, expertises, location, level)
+                WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {count - 1})
+                SELECT CONCAT('{prefix}', n), :password_hash, CONCAT('Bench User ', n), '[]', :workshop_id, {level.value} FROM seq
+                """,
+                {"password_hash": password_hash, "workshop_id": workshop_id},
+            )
+        await conn.execute(
+            """
+            INSERT INTO worker_status (worker, at_device, status, last_event_end_date, dispatch_count, check_alive_time)
+            SELECT username, :rescue, :status, UTC_TIMESTAMP(), 0, UTC_TIMESTAMP() FROM users WHERE username LIKE :pattern
+            """,
+            {"rescue": f"{DEVICE_PREFIX}{devices}", "status": WorkerStatusEnum.idle.value, "pattern": f"{WORKER_PREFIX}%"},
+        )
+
+        # mission `mission_base + worker * iterations + k + 1` is the one worker handles in its k-th iteration
+        await conn.execute(
+            f"""
+            INSERT INTO missions (id, device, name, description, required_expertises, is_cancel, is_emergency, is_autocanceled, created_date, updated_date)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {missions - 1})
+            SELECT :mission_base + n + 1, CONCAT('{DEVICE_PREFIX}', n % {devices}), 'benchmark', '', '[]', FALSE, FALSE, FALSE, UTC_TIMESTAMP(), UTC_TIMESTAMP()
+            FROM seq
+            """,
+            {"mission_base": mission_base},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO missions_users (user, mission)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {missions - 1})
+            SELECT CONCAT('{WORKER_PREFIX}', n DIV {iterations}), :mission_base + n + 1 FROM seq
+            """,
+            {"mission_base": mission_base},
+        )
+        # the failure is already verified as fixed, so the mission can be finished right after it's started
+        await conn.execute(
+            f"""
+            INSERT INTO missionevents (mission, event_id, table_name, category, message, done_verified, event_start_date, event_end_date)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {missions - 1})
+            SELECT :mission_base + n + 1, n, 'benchmark', 1 + n % 50, CONCAT('故障 ', n % 50), TRUE,
+                UTC_TIMESTAMP() + INTERVAL 8 HOUR, UTC_TIMESTAMP() + INTERVAL 1 DAY
+            FROM seq
+            """,
+            {"mission_base": mission_base},
+        )
+
+    return mission_base
+
+
+async def cleanup():
+    await database.execute("DELETE FROM auditlogheaders WHERE user LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute(
+        "DELETE mu FROM missions_users mu INNER JOIN missions m ON m.id = mu.mission WHERE m.device LIKE :pattern",
+        {"pattern": DEVICE_PATTERN},
+    )
+    await database.execute("DELETE FROM missions WHERE device LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM worker_status WHERE worker LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM users WHERE username LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM devices WHERE id LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+
+
+async def login(recorder: Recorder, username: str) -> str:
+    body = await recorder.call("/auth/token", "POST", "/auth/token", form={"username": username, "password": PASSWORD})
+    return json.loads(body)["access_token"]
+
+
+async def worker_user(recorder: Recorder, index: int, iterations: int, mission_base: int):
+    token = await login(recorder, f"{WORKER_PREFIX}{index}")
+
+    for k in range(iterations):
+        mission_id = mission_base + index * iterations + k + 1
+        await recorder.call("/users/info", "GET", "/users/info", token=token)
+        await recorder.call("/missions/self", "GET", "/missions/self", token=token, query={"is_closed": "false"})
+        for action in ("accept", "start", "finish"):
+            await recorder.call(f"/missions/{{mission_id}}/{action}", "POST", f"/missions/{mission_id}/{action}", token=token)
+        await recorder.call("/workshop/{workshop_name}/image", "GET", f"/workshop/{WORKSHOP_NAME}/image", token=token)
+
+
+async def manager_user(recorder: Recorder, index: int, iterations: int):
+    token = await login(recorder, f"{MANAGER_PREFIX}{index}")
+    end_date = datetime.utcnow()
+    stats_query = {
+        "workshop_name": WORKSHOP_NAME,
+        "start_date": (end_date - timedelta(days=30)).isoformat(),
+        "end_date": end_date.isoformat(),
+    }
+
+    for _ in range(iterations):
+        await recorder.call("/stats/", "GET", "/stats/", token=token, query=stats_query)
+        await recorder.call("/stats/{workshop_name}/worker-status", "GET", f"/stats/{WORKSHOP_NAME}/worker-status", token=token)
+        await recorder.call("/missions/", "GET", "/missions/", token=token, query={"workshop_name": WORKSHOP_NAME, "is_closed": "false"})
+        await recorder.call("/workshop/{workshop_name}/image", "GET", f"/workshop/{WORKSHOP_NAME}/image", token=token)
+
+
+async def main(args):
+    broker = StubMqttBroker().start()
+    app_main.MQTT_BROKER = broker.host
+    app_main.MQTT_PORT = broker.port
+    # the Foxlink databases are not needed by any of the replayed routes
+    foxlink_db._dbs = []
+
+    await app_main.app.router.startup()
+    try:
+        await cleanup()
+        mission_base = await seed(args.devices, args.workers, args.managers, args.iterations)
+
+        recorder = Recorder()
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[worker_user(recorder, i, args.iterations, mission_base) for i in range(args.workers)],
+            *[manager_user(recorder, i, args.iterations) for i in range(args.managers)],
+        )
+        duration = time.perf_counter() - start
+
+        report = {
+            **git_revision(),
+            "created_at": datetime.utcnow().isoformat(),
+            "params": vars(args),
+            "duration_seconds": round(duration, 2),
+            "requests_per_second": round(sum(len(v) for v in recorder.latencies.values()) / duration, 2),
+            "mqtt_messages": broker.received,
+            "routes": recorder.report(duration),
+        }
+    finally:
+        if not args.keep:
+            await cleanup()
+        await app_main.app.router.shutdown()
+        broker.stop()
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=50, help="concurrent worker sessions")
+    parser.add_argument("--managers", type=int, default=5, help="concurrent manager dashboard sessions")
+    parser.add_argument("--iterations", type=int, default=10, help="scenario iterations per session")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows after the run")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,453 @@
+"""
+Deterministic benchmark of the dispatch daemon (`main_routine`).
+
+For every (devices, workers) pair of the grid a synthetic factory is seeded:
+
+- the devices are spread over workshops of `--devices-per-workshop` devices, each
+  with its own `FactoryMap.map` distance matrix and a few rescue stations
+- the maintainers are spread over the same workshops, every one of them has an
+  idle `WorkerStatus` and a `UserDeviceLevel` row (both shifts) for a
+  deterministic `--coverage` share of the devices of their workshop
+- a simulated Foxlink event table (`benchmark_aoi.bench_event_new`) is fed with
+  new failures on every tick
+
+Each tick injects events, lets the simulated workers start/finish the missions
+they were assigned and then runs the same routines as one `main_routine` loop
+(plus the two Foxlink tickers), timing each routine and counting its database
+round trips. The MQTT client is replaced by one that only counts messages and
+every seeded worker is reported online, so no broker or EMQX is needed.
+
+Usage:
+    python -m benchmarks.dispatch_daemon --devices 100,1000,5000 --workers 10,100,500 --ticks 20 --output report.json
+
+The rows are written into the database configured by the DATABASE_* env
+variables, so point it at a scratch database (MySQL 8, the daemon's queries are
+MySQL specific); the user needs to be able to create the `benchmark_aoi` schema.
+Every seeded row is removed when the benchmark finishes. With the same `--seed`
+the injected events are identical, so reports of different commits can be
+compared directly.
+"""
+import os
+
+# routines already profile their queries when SQL_PROFILER is set, which would hide them from the benchmark
+os.environ["SQL_PROFILER"] = "0"
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import app.mqtt.main as mqtt_main
+from app.background_service import (
+    FoxlinkBackground,
+    auto_close_missions,
+    check_alive_worker_routine,
+    check_mission_duration_routine,
+    dispatch_routine,
+    overtime_workers_routine,
+    track_worker_status_routine,
+    worker_monitor_routine,
+)
+from app.core.database import AuditActionEnum, UserLevel, WorkerStatusEnum, database
+from app.mqtt.presence import presence_map
+from app.utils.profiler import profile_queries
+from benchmarks.report import git_revision, write_report
+
+WORKSHOP_PREFIX = "benchmark-dispatch-"
+FOXLINK_SCHEMA = "benchmark_aoi"
+EVENT_TABLE = "bench_event_new"
+# device ids are generated from the Foxlink table name, see `FoxlinkBackground.generate_device_id`
+DEVICE_PATTERN = "bench\\_event\\_new@%"
+USER_PREFIX = "bench-dispatch-"
+USER_PATTERN = "bench-dispatch-%"
+
+
+class NullMqttClient:
+    """Stands in for the paho client, messages are only counted."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False):
+        self.published += 1
+        return (0, self.published)
+
+
+async def insert_rows(table: str, columns: Sequence[str], rows: List[Sequence[Any]], chunk_size: int = 500):
+    """Multi-row INSERT, `databases.execute_many` would send one statement per row."""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        values = {}
+        placeholders = []
+        for i, row in enumerate(chunk):
+            placeholders.append("(" + ", ".join(f":v{i}_{j}" for j in range(len(columns))) + ")")
+            values.update({f"v{i}_{j}": v for j, v in enumerate(row)})
+
+        await database.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(placeholders)}", values
+        )
+
+
+async def seed(rng: random.Random, devices: int, workers: int, devices_per_workshop: int, rescue_stations: int, coverage: float) -> List[str]:
+    """Seed the synthetic factory, returns the device ids Foxlink events can be raised for."""
+    workshops = (devices + devices_per_workshop - 1) // devices_per_workshop
+    workshop_ids: List[int] = []
+    event_devices: List[str] = []
+    device_rows = []
+    rescue_ids: Dict[int, List[str]] = {}
+
+    for w in range(workshops):
+        await database.execute(
+            "INSERT INTO factorymaps (name, map, related_devices) VALUES (:name, '[]', '[]')",
+            {"name": f"{WORKSHOP_PREFIX}{w}"},
+        )
+        workshop_id = await database.fetch_val(
+            "SELECT id FROM factorymaps WHERE name = :name", {"name": f"{WORKSHOP_PREFIX}{w}"}
+        )
+        workshop_ids.append(workshop_id)
+
+        layout: List[Tuple[str, float, float]] = []
+        for r in range(rescue_stations):
+            device_id = f"{EVENT_TABLE}@0@Rescue_{w}_{r}"
+            x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+            layout.append((device_id, x, y))
+            device_rows.append((device_id, EVENT_TABLE, 0, f"Rescue_{w}_{r}", x, y, True, workshop_id))
+        rescue_ids[workshop_id] = [d[0] for d in layout]
+
+        for i in range(w * devices_per_workshop, min(devices, (w + 1) * devices_per_workshop)):
+            line = 1 + i // 50
+            device_id = f"{EVENT_TABLE}@{line}@Device_{i}"
+            x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+            layout.append((device_id, x, y))
+            device_rows.append((device_id, EVENT_TABLE, line, f"Device_{i}", x, y, False, workshop_id))
+            event_devices.append(device_id)
+
+        # manhattan distance, like walking along the production lines
+        matrix = [[round(abs(x1 - x2) + abs(y1 - y2), 1) for _, x2, y2 in layout] for _, x1, y1 in layout]
+        await database.execute(
+            "UPDATE factorymaps SET map = :map, related_devices = :related_devices WHERE id = :id",
+            {"map": json.dumps(matrix), "related_devices": json.dumps([d[0] for d in layout]), "id": workshop_id},
+        )
+
+    await insert_rows(
+        "devices", ["id", "project", "line", "device_name", "x_axis", "y_axis", "is_rescue", "workshop"], device_rows
+    )
+
+    now = datetime.utcnow()
+    user_rows = []
+    status_rows = []
+    for j in range(workers):
+        workshop_id = workshop_ids[j % workshops]
+        username = f"{USER_PREFIX}{j}"
+        user_rows.append((username, "", f"Bench Worker {j}", "[]", workshop_id, UserLevel.maintainer.value))
+        status_rows.append((username, rng.choice(rescue_ids[workshop_id]), WorkerStatusEnum.idle.value, now, 0, now))
+
+    await insert_rows("users", ["username", "password_hash", "full_name", "expertises", "location", "level"], user_rows)
+    await insert_rows(
+        "worker_status",
+        ["worker", "at_device", "status", "last_event_end_date", "dispatch_count", "check_alive_time"],
+        status_rows,
+    )
+
+    # CRC32 keeps the matrix identical for the same seed without sending every row from here
+    await database.execute(
+        """
+        INSERT INTO userdevicelevels (device, user, shift, level)
+        SELECT d.id, u.username, s.shift, 1 + CRC32(CONCAT(:seed, d.id, u.username)) % 3
+        FROM devices d
+        INNER JOIN users u ON u.location = d.workshop
+        CROSS JOIN (SELECT 0 AS shift UNION ALL SELECT 1) s
+        WHERE d.id LIKE :device_pattern AND u.username LIKE :user_pattern
+            AND (d.is_rescue OR CRC32(CONCAT(:seed, d.id, u.username)) % 1000 < :coverage)
+        """,
+        {"seed": rng.random(), "device_pattern": DEVICE_PATTERN, "user_pattern": USER_PATTERN, "coverage": int(coverage * 1000)},
+    )
+
+    return event_devices
+
+
+async def create_foxlink_table():
+    await database.execute(f"CREATE DATABASE IF NOT EXISTS `{FOXLINK_SCHEMA}`")
+    await database.execute(f"DROP TABLE IF EXISTS `{FOXLINK_SCHEMA}`.`{EVENT_TABLE}`")
+    await database.execute(
+        f"""
+        CREATE TABLE `{FOXLINK_SCHEMA}`.`{EVENT_TABLE}` (
+            ID INT AUTO_INCREMENT PRIMARY KEY,
+            Line INT NOT NULL,
+            Device_Name VARCHAR(20) NOT NULL,
+            Category INT NOT NULL,
+            Start_Time DATETIME NOT NULL,
+            End_Time DATETIME NULL,
+            Message VARCHAR(100) NULL,
+            Start_File_Name VARCHAR(100) NULL,
+            End_File_Name VARCHAR(100) NULL,
+            INDEX (Start_Time)
+        )
+        """
+    )
+
+
+async def cleanup():
+    await database.execute(
+        "DELETE FROM auditlogheaders WHERE user LIKE :user_pattern OR (table_name = 'missions' AND record_pk IN (SELECT CAST(id AS CHAR) FROM missions WHERE device LIKE :device_pattern))",
+        {"user_pattern": USER_PATTERN, "device_pattern": DEVICE_PATTERN},
+    )
+    await database.execute(
+        "DELETE mu FROM missions_users mu INNER JOIN missions m ON m.id = mu.mission WHERE m.device LIKE :pattern",
+        {"pattern": DEVICE_PATTERN},
+    )
+    await database.execute("DELETE FROM missions WHERE device LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM worker_status WHERE worker LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM userdevicelevels WHERE user LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM users WHERE username LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM devices WHERE id LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM factorymaps WHERE name LIKE :pattern", {"pattern": f"{WORKSHOP_PREFIX}%"})
+    await database.execute(f"DROP DATABASE IF EXISTS `{FOXLINK_SCHEMA}`")
+
+
+def id_list(ids) -> str:
+    return ", ".join(str(int(x)) for x in ids)
+
+
+class Simulation:
+    """Feeds the Foxlink event table and plays the part of the workers."""
+
+    def __init__(self, rng: random.Random, event_devices: List[str], event_rate: float, self_resolve: float, repair_ticks: int):
+        self.rng = rng
+        self.event_devices = event_devices
+        self.events_per_tick = max(1, round(len(event_devices) * event_rate))
+        self.self_resolve = self_resolve
+        self.repair_ticks = repair_ticks
+        self.started_at: Dict[int, int] = {}
+        self.tick = 0
+
+    async def inject_events(self):
+        rows = []
+        for device_id in self.rng.sample(self.event_devices, min(self.events_per_tick, len(self.event_devices))):
+            _, line, device_name = device_id.split("@")
+            category = self.rng.randint(1, 199)
+            rows.append((int(line), device_name, category, f"故障 {category}"))
+
+        values = ", ".join(f"(:l{i}, :d{i}, :c{i}, NOW(), :m{i})" for i in range(len(rows)))
+        params = {}
+        for i, (line, device_name, category, message) in enumerate(rows):
+            params.update({f"l{i}": line, f"d{i}": device_name, f"c{i}": category, f"m{i}": message})
+
+        await database.execute(
+            f"INSERT INTO `{FOXLINK_SCHEMA}`.`{EVENT_TABLE}` (Line, Device_Name, Category, Start_Time, Message) VALUES {values}",
+            params,
+        )
+
+        # some failures are fixed on the spot before anyone is dispatched
+        open_events = await database.fetch_all(
+            f"""
+            SELECT e.ID FROM `{FOXLINK_SCHEMA}`.`{EVENT_TABLE}` e
+            LEFT JOIN missionevents me ON me.event_id = e.ID AND me.table_name = '{EVENT_TABLE}'
+            LEFT JOIN missions_users mu ON mu.mission = me.mission
+            WHERE e.End_Time IS NULL AND mu.id IS NULL
+            ORDER BY e.ID
+            """
+        )
+        resolved = [r[0] for r in open_events if self.rng.random() < self.self_resolve]
+        if len(resolved) != 0:
+            await database.execute(
+                f"UPDATE `{FOXLINK_SCHEMA}`.`{EVENT_TABLE}` SET End_Time = NOW() WHERE ID IN ({id_list(resolved)})"
+            )
+
+    async def advance_workers(self):
+        # workers start the missions they were notified of on the next tick
+        assigned = await database.fetch_all(
+            """
+            SELECT DISTINCT m.id FROM missions m
+            INNER JOIN missions_users mu ON mu.mission = m.id
+            WHERE m.device LIKE :pattern AND m.repair_end_date IS NULL AND m.is_cancel = FALSE
+            """,
+            {"pattern": DEVICE_PATTERN},
+        )
+        to_start = [r[0] for r in assigned if r[0] not in self.started_at]
+        for mission_id in to_start:
+            self.started_at[mission_id] = self.tick
+
+        if len(to_start) != 0:
+            await database.execute(
+                f"UPDATE missions SET repair_start_date = UTC_TIMESTAMP() WHERE id IN ({id_list(to_start)}) AND repair_start_date IS NULL"
+            )
+
+        to_finish = [m for m, started in self.started_at.items() if self.tick - started >= self.repair_ticks]
+        if len(to_finish) != 0:
+            await database.execute(
+                f"""
+                UPDATE worker_status ws
+                INNER JOIN missions_users mu ON mu.user = ws.worker
+                INNER JOIN missions m ON m.id = mu.mission
+                SET ws.status = :idle, ws.at_device = m.device, ws.last_event_end_date = UTC_TIMESTAMP()
+                WHERE m.id IN ({id_list(to_finish)})
+                """,
+                {"idle": WorkerStatusEnum.idle.value},
+            )
+            await database.execute(
+                f"""
+                UPDATE `{FOXLINK_SCHEMA}`.`{EVENT_TABLE}` e
+                INNER JOIN missionevents me ON me.event_id = e.ID AND me.table_name = '{EVENT_TABLE}'
+                SET e.End_Time = NOW()
+                WHERE me.mission IN ({id_list(to_finish)}) AND e.End_Time IS NULL
+                """
+            )
+            await database.execute(
+                f"UPDATE missions SET repair_end_date = UTC_TIMESTAMP() WHERE id IN ({id_list(to_finish)})"
+            )
+            for mission_id in to_finish:
+                del self.started_at[mission_id]
+
+        self.tick += 1
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "median": round(values[len(values) // 2], 4),
+        "p95": round(values[min(int(len(values) * 0.95), len(values) - 1)], 4),
+        "max": round(values[-1], 4),
+        "total": round(sum(values), 4),
+    }
+
+
+async def count_assigned() -> int:
+    return await database.fetch_val(
+        "SELECT COUNT(*) FROM auditlogheaders WHERE action = :action AND user LIKE :pattern",
+        {"action": AuditActionEnum.MISSION_ASSIGNED.value, "pattern": USER_PATTERN},
+    )
+
+
+async def run(args, devices: int, workers: int) -> dict:
+    rng = random.Random(f"{args.seed}-{devices}-{workers}")
+
+    await cleanup()
+    await create_foxlink_table()
+
+    seed_start = time.perf_counter()
+    event_devices = await seed(rng, devices, workers, args.devices_per_workshop, args.rescue_stations, args.coverage)
+    seed_duration = time.perf_counter() - seed_start
+
+    foxlink = FoxlinkBackground()
+    # read the simulated event table through the main database instead of the Foxlink hosts
+    foxlink._dbs = [database]
+    foxlink.db_name = FOXLINK_SCHEMA
+
+    mqtt_client = NullMqttClient()
+    mqtt_main.mqtt_client = mqtt_client  # type: ignore
+
+    routines = [
+        ("fetch_events_from_foxlink", foxlink.fetch_events_from_foxlink),
+        ("check_events_is_complete", foxlink.check_events_is_complete),
+        ("auto_close_missions", auto_close_missions),
+        ("worker_monitor_routine", worker_monitor_routine),
+        ("overtime_workers_routine", overtime_workers_routine),
+        ("track_worker_status_routine", track_worker_status_routine),
+        ("check_mission_duration_routine", check_mission_duration_routine),
+        ("check_alive_worker_routine", check_alive_worker_routine),
+        ("dispatch_routine", dispatch_routine),
+    ]
+    durations: Dict[str, List[float]] = {name: [] for name, _ in routines}
+    queries: Dict[str, List[int]] = {name: [] for name, _ in routines}
+    tick_durations: List[float] = []
+    simulation = Simulation(rng, event_devices, args.event_rate, args.self_resolve, args.repair_ticks)
+    usernames = [f"{USER_PREFIX}{j}" for j in range(workers)]
+    assigned_before = 0
+
+    for tick in range(args.warmup + args.ticks):
+        measured = tick >= args.warmup
+        if tick == args.warmup:
+            assigned_before = await count_assigned()
+
+        await simulation.inject_events()
+        await simulation.advance_workers()
+        presence_map.enabled = True
+        presence_map.seed({u: {} for u in usernames}, datetime.utcnow())
+
+        tick_start = time.perf_counter()
+        for name, fn in routines:
+            start = time.perf_counter()
+            with profile_queries(name, enabled=True) as profile:
+                await fn()
+            if measured:
+                durations[name].append(time.perf_counter() - start)
+                queries[name].append(profile.query_count)  # type: ignore
+        if measured:
+            tick_durations.append(time.perf_counter() - tick_start)
+
+    dispatched = await count_assigned() - assigned_before
+    missions = await database.fetch_val("SELECT COUNT(*) FROM missions WHERE device LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    presence_map.clear()
+
+    return {
+        "devices": devices,
+        "workers": workers,
+        "workshops": (devices + args.devices_per_workshop - 1) // args.devices_per_workshop,
+        "events_per_tick": simulation.events_per_tick,
+        "seed_seconds": round(seed_duration, 2),
+        "tick": summarize(tick_durations),
+        "routines": {
+            name: {
+                **summarize(durations[name]),
+                "queries_per_call": round(sum(queries[name]) / len(queries[name]), 1),
+                "max_queries": max(queries[name]),
+            }
+            for name, _ in routines
+        },
+        "missions_created": missions,
+        "missions_dispatched": dispatched,
+        "dispatched_per_second": round(dispatched / sum(tick_durations), 2),
+        "mqtt_messages": mqtt_client.published,
+    }
+
+
+async def main(args):
+    report = {
+        **git_revision(),
+        "created_at": datetime.utcnow().isoformat(),
+        "params": vars(args),
+        "results": [],
+    }
+
+    await database.connect()
+    try:
+        for devices in args.devices:
+            for workers in args.workers:
+                result = await run(args, devices, workers)
+                report["results"].append(result)
+                print(
+                    f"devices={devices} workers={workers} tick_median={result['tick']['median']}s dispatched/s={result['dispatched_per_second']}",
+                    flush=True,
+                )
+    finally:
+        if not args.keep:
+            await cleanup()
+        await database.disconnect()
+
+    write_report(report, args.output)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(x) for x in value.split(",") if x != ""]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int_list, default=[100, 1000, 5000], help="comma separated device counts")
+    parser.add_argument("--workers", type=int_list, default=[10, 100, 500], help="comma separated maintainer counts")
+    parser.add_argument("--devices-per-workshop", type=int, default=500)
+    parser.add_argument("--rescue-stations", type=int, default=3, help="rescue stations per workshop")
+    parser.add_argument("--coverage", type=float, default=0.2, help="share of the workshop's devices a worker can repair")
+    parser.add_argument("--event-rate", type=float, default=0.01, help="share of the devices failing on every tick")
+    parser.add_argument("--self-resolve", type=float, default=0.05, help="chance an undispatched event is fixed on its own per tick")
+    parser.add_argument("--repair-ticks", type=int, default=3, help="ticks a worker needs to finish a mission")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows after the last run")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,176 @@
+"""
+Login burst at shift change: every worker of a workshop POSTs `/auth/token` at
+(almost) the same moment.
+
+Requests are sent straight to the ASGI app like `benchmarks.api_load`, so the
+numbers include the bcrypt verification, the audit log and worker status
+updates of the login route. While the burst is processed a probe task sleeps
+in 10 ms steps and records how late it wakes up, i.e. how long any other
+request would have been stalled by work blocking the event loop.
+
+Usage:
+    python -m benchmarks.login_burst --users 500 --output report.json
+    # verify passwords on the event loop instead of the thread pool (the behaviour before the pool)
+    python -m benchmarks.login_burst --users 500 --hash-workers 0
+
+The rows are written into the database configured by the DATABASE_* env
+variables, so point it at a scratch database (MySQL 8). Every seeded row belongs
+to the `benchmark-login` workshop and is removed when the benchmark finishes.
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+import app.main as app_main
+import app.services.user as user_service
+from app.core.database import UserLevel, WorkerStatusEnum, database
+from app.foxlink_db import foxlink_db
+from app.services.user import get_password_hash
+from benchmarks.api_load import Recorder, StubMqttBroker
+from benchmarks.report import git_revision, write_report
+
+WORKSHOP_NAME = "benchmark-login"
+RESCUE_DEVICE = "BENCHLOGIN@1@Rescue"
+DEVICE_PATTERN = "BENCHLOGIN@%"
+USER_PREFIX = "bench-login-"
+USER_PATTERN = "bench-login-%"
+PASSWORD = "benchmark"
+PROBE_INTERVAL = 0.01
+
+
+class InlineExecutor(Executor):
+    """Runs the submitted function right away on the calling thread, blocking the event loop."""
+
+    def submit(self, fn, *args, **kwargs):
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+async def seed(users: int):
+    password_hash = await get_password_hash(PASSWORD)
+
+    async with database.connection() as conn:
+        await conn.execute(f"SET SESSION cte_max_recursion_depth = {users + 1}")
+        await conn.execute(
+            "INSERT INTO factorymaps (name, map, related_devices) VALUES (:name, '[]', '[]')", {"name": WORKSHOP_NAME}
+        )
+        workshop_id = await conn.fetch_val("SELECT id FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+        await conn.execute(
+            """
+            INSERT INTO devices (id, project, line, device_name, x_axis, y_axis, is_rescue, workshop)
+            VALUES (:id, 'BENCHLOGIN', 1, 'Rescue', 0, 0, TRUE, :workshop_id)
+            """,
+            {"id": RESCUE_DEVICE, "workshop_id": workshop_id},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO users (username, password_hash, full_name, expertises, location, level)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {users - 1})
+            SELECT CONCAT('{USER_PREFIX}', n), :password_hash, CONCAT('Bench User ', n), '[]', :workshop_id, {UserLevel.maintainer.value}
+            FROM seq
+            """,
+            {"password_hash": password_hash, "workshop_id": workshop_id},
+        )
+        # everyone is off work, so each login is the first one of the day
+        await conn.execute(
+            """
+            INSERT INTO worker_status (worker, at_device, status, last_event_end_date, dispatch_count, check_alive_time)
+            SELECT username, :rescue, :status, UTC_TIMESTAMP(), 0, UTC_TIMESTAMP() FROM users WHERE username LIKE :pattern
+            """,
+            {"rescue": RESCUE_DEVICE, "status": WorkerStatusEnum.leave.value, "pattern": USER_PATTERN},
+        )
+
+
+async def cleanup():
+    await database.execute("DELETE FROM auditlogheaders WHERE user LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM worker_status WHERE worker LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM users WHERE username LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM devices WHERE id LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+
+
+async def probe_loop_lag(lags: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def login(recorder: Recorder, index: int, delay: float):
+    await asyncio.sleep(delay)
+    await recorder.call(
+        "/auth/token", "POST", "/auth/token", form={"username": f"{USER_PREFIX}{index}", "password": PASSWORD}
+    )
+
+
+def lag_stats(lags: List[float]) -> Dict[str, float]:
+    values = sorted(lags) or [0.0]
+    pct = lambda p: round(values[min(int(len(values) * p), len(values) - 1)] * 1000, 2)
+    return {"samples": len(lags), "p50_ms": pct(0.5), "p99_ms": pct(0.99), "max_ms": round(values[-1] * 1000, 2)}
+
+
+async def main(args):
+    broker = StubMqttBroker().start()
+    app_main.MQTT_BROKER = broker.host
+    app_main.MQTT_PORT = broker.port
+    foxlink_db._dbs = []
+
+    await app_main.app.router.startup()
+    try:
+        await cleanup()
+        await seed(args.users)
+
+        user_service.password_executor = (
+            ThreadPoolExecutor(args.hash_workers, thread_name_prefix="password-hash")
+            if args.hash_workers > 0
+            else InlineExecutor()
+        )
+
+        rng = random.Random(args.seed)
+        recorder = Recorder()
+        lags: List[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.ensure_future(probe_loop_lag(lags, stop))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[login(recorder, i, rng.uniform(0, args.spread)) for i in range(args.users)])
+        duration = time.perf_counter() - start
+
+        stop.set()
+        await probe
+
+        report = {
+            **git_revision(),
+            "created_at": datetime.utcnow().isoformat(),
+            "params": vars(args),
+            "duration_seconds": round(duration, 2),
+            "logins_per_second": round(args.users / duration, 2),
+            "routes": recorder.report(duration),
+            "event_loop_lag": lag_stats(lags),
+        }
+    finally:
+        if not args.keep:
+            await cleanup()
+        await app_main.app.router.shutdown()
+        broker.stop()
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500, help="workers logging in during the burst")
+    parser.add_argument("--spread", type=float, default=1.0, help="logins start uniformly within this many seconds")
+    parser.add_argument("--hash-workers", type=int, default=user_service.PASSWORD_HASH_WORKERS, help="bcrypt threads, 0 runs bcrypt on the event loop")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows after the run")
+    asyncio.run(main(parser.parse_args()))
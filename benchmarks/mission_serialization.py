@@ -0,0 +1,164 @@
+"""
+Per-mission cost of turning query results into the `/missions` response body.
+
+- `ormar`: the previous path. Every row becomes a Mission model with its device,
+  workshop, assignees and events (the models ormar builds when hydrating a
+  query), then `MissionDto.from_mission`, `jsonable_encoder` and the default
+  `JSONResponse`.
+- `raw`: `mission_dto_dict` straight from the row dicts, rendered by `ORJSONResponse`.
+
+The rows are generated in memory, so no database is needed and the numbers only
+cover the Python side of the request; query time is measured by the other benchmarks.
+
+Usage:
+    python -m benchmarks.mission_serialization --missions 1000 10000 --output report.json
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.core.database import Device, FactoryMap, Mission, MissionEvent, User
+from app.models.schema import MissionDto
+from app.services.mission import mission_dto_dict
+from app.utils.response import ORJSONResponse
+from benchmarks.report import git_revision, write_report
+
+
+def generate(missions: int, assignees: int, events: int) -> List[Dict[str, Any]]:
+    """Rows shaped like `MISSION_ROWS_QUERY` results, with their assignee and event rows attached."""
+    now = datetime.utcnow()
+    rows = []
+    for n in range(missions):
+        created = now - timedelta(minutes=n)
+        rows.append(
+            {
+                "row": {
+                    "id": n + 1,
+                    "name": "設備故障",
+                    "description": f"Device_{n % 200} 停機",
+                    "repair_start_date": created + timedelta(minutes=5) if n % 3 != 0 else None,
+                    "repair_end_date": created + timedelta(minutes=20) if n % 3 == 2 else None,
+                    "is_cancel": 0,
+                    "is_emergency": int(n % 10 == 0),
+                    "created_date": created,
+                    "updated_date": created,
+                    "device_id": f"BENCH@1@Device_{n % 200}",
+                    "device_name": f"Device_{n % 200}",
+                    "device_cname": f"機台 {n % 200}",
+                    "project": "BENCH",
+                    "process": "M3",
+                    "line": 1,
+                    "workshop": "benchmark",
+                },
+                "assignees": [
+                    {"username": f"bench-{(n + i) % 500}", "full_name": f"Bench Worker {(n + i) % 500}"}
+                    for i in range(assignees)
+                ],
+                "events": [
+                    {
+                        "category": 100 + i,
+                        "message": "馬達異常",
+                        "done_verified": False,
+                        "event_start_date": created - timedelta(minutes=i),
+                        "event_end_date": None,
+                    }
+                    for i in range(events)
+                ],
+            }
+        )
+    return rows
+
+
+def ormar_mission(item: Dict[str, Any]) -> Mission:
+    row = item["row"]
+    workshop = FactoryMap(id=1, name=row["workshop"], map=[], related_devices=[])
+    device = Device(
+        id=row["device_id"],
+        project=row["project"],
+        process=row["process"],
+        line=row["line"],
+        device_name=row["device_name"],
+        device_cname=row["device_cname"],
+        x_axis=0,
+        y_axis=0,
+        workshop=workshop,
+    )
+    return Mission(
+        id=row["id"],
+        device=device,
+        name=row["name"],
+        description=row["description"],
+        repair_start_date=row["repair_start_date"],
+        repair_end_date=row["repair_end_date"],
+        required_expertises=[],
+        is_cancel=bool(row["is_cancel"]),
+        is_emergency=bool(row["is_emergency"]),
+        created_date=row["created_date"],
+        updated_date=row["updated_date"],
+        assignees=[User(password_hash="", expertises=[], level=1, **a) for a in item["assignees"]],
+        missionevents=[
+            MissionEvent(id=i + 1, event_id=i + 1, table_name="bench", **e) for i, e in enumerate(item["events"])
+        ],
+    )
+
+
+def render_ormar(items: List[Dict[str, Any]]) -> bytes:
+    return JSONResponse(jsonable_encoder([MissionDto.from_mission(ormar_mission(item)) for item in items])).body
+
+
+def render_raw(items: List[Dict[str, Any]]) -> bytes:
+    return ORJSONResponse([mission_dto_dict(item["row"], item["assignees"], item["events"]) for item in items]).body
+
+
+def measure(render, items: List[Dict[str, Any]], repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = render(items)
+        durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    median = durations[len(durations) // 2]
+    return {
+        "bytes": len(body),
+        "min": round(durations[0], 4),
+        "median": round(median, 4),
+        "max": round(durations[-1], 4),
+        "us_per_mission": round(median / len(items) * 1_000_000, 2),
+    }
+
+
+def main(args):
+    report: Dict[str, Any] = {
+        **git_revision(),
+        "created_at": datetime.utcnow().isoformat(),
+        "params": vars(args),
+        "results": {},
+    }
+
+    for missions in args.missions:
+        items = generate(missions, args.assignees, args.events)
+        result = {"raw": measure(render_raw, items, args.repeat)}
+
+        if not args.skip_legacy:
+            result["ormar"] = measure(render_ormar, items, args.repeat)
+            result["speedup"] = round(result["ormar"]["median"] / result["raw"]["median"], 1)
+
+        report["results"][str(missions)] = result
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--missions", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--assignees", type=int, default=1, help="assignees per mission")
+    parser.add_argument("--events", type=int, default=2, help="events per mission")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    main(parser.parse_args())
@@ -0,0 +1,472 @@
+"""
+Replay exported Foxlink event logs through the dispatch daemon at accelerated time.
+
+Every input file holds the rows of one Foxlink `*_event_new` table (the table
+name is the file name, e.g. `n84_event_new.csv`) with the Foxlink columns
+ID, Line, Device_Name, Category, Start_Time, End_Time, Message,
+Start_File_Name, End_File_Name. CSV is read with pandas, Parquet additionally
+needs pyarrow or fastparquet to be installed.
+
+The rows are inserted into a stand-in schema (`replay_aoi`) when the simulated
+clock reaches their Start_Time, and `FoxlinkBackground` reads them from there.
+The daemon runs as in `main_routine`: the Foxlink fetch/check tickers and the
+main loop run concurrently, with their intervals divided by `--speed`.
+Simulated workers accept, travel to and repair the missions dispatched to them.
+The repair takes as long as the logged failure (End_Time - Start_Time). Events
+nobody was dispatched to end at their logged End_Time, as they did in history.
+
+The report contains, in simulated seconds:
+
+- mission wait time: created → dispatched
+- repair-start latency: created → repair started
+
+It also contains the daemon's routine busy time, its DB queries per routine
+(from the Prometheus metrics), and the process CPU time.
+`--policy` swaps the `foxlink_dispatch` implementation used by `dispatch_routine`,
+so policies and cadence settings can be compared on the same log.
+
+Usage:
+    python -m benchmarks.replay_events exports/n84_event_new.csv exports/d5x_event_new.parquet --speed 50 --output report.json
+
+Run it against a scratch copy of the production database (MySQL 8): the devices,
+maintainers and `UserDeviceLevel` matrix of the copy are used as they are, and
+every maintainer is set to idle when the replay starts. Missions created by the
+replay are removed afterwards, worker statuses are not restored. The thresholds
+inside the routines (e.g. `MOVE_TO_RESCUE_STATION_TIME`) still run on the wall
+clock and are not accelerated.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+from fastapi.exceptions import HTTPException
+from prometheus_client import REGISTRY
+
+import app.background_service as background_service
+import app.mqtt.main as mqtt_main
+from app.background_service import FoxlinkBackground
+from app.core.database import (
+    AuditActionEnum,
+    User,
+    UserLevel,
+    WorkerStatus,
+    WorkerStatusEnum,
+    database,
+)
+from app.mqtt.presence import presence_map
+from app.my_log_conf import LOGGER_NAME
+from app.services.mission import accept_mission, finish_mission_by_id, start_mission_by_id
+from app.utils.metrics import metrics_scope
+from app.utils.timer import Ticker
+from benchmarks.dispatch_daemon import NullMqttClient
+from benchmarks.report import git_revision, write_report
+
+logger = logging.getLogger(LOGGER_NAME)
+
+REPLAY_SCHEMA = "replay_aoi"
+FOXLINK_COLUMNS = ["ID", "Line", "Device_Name", "Category", "Start_Time", "End_Time", "Message", "Start_File_Name", "End_File_Name"]
+MAIN_ROUTINES = [
+    "auto_close_missions",
+    "worker_monitor_routine",
+    "overtime_workers_routine",
+    "track_worker_status_routine",
+    "check_mission_duration_routine",
+    "check_alive_worker_routine",
+    "dispatch_routine",
+]
+TICKER_ROUTINES = ["fetch_events_from_foxlink", "check_events_is_complete"]
+
+
+def load_events(paths: List[str]) -> pd.DataFrame:
+    frames = []
+    for path in paths:
+        p = Path(path)
+        frame = pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_csv(p)
+        missing = set(FOXLINK_COLUMNS) - set(frame.columns)
+        if len(missing) != 0:
+            raise ValueError(f"{path} is missing columns: {sorted(missing)}")
+
+        frame = frame[FOXLINK_COLUMNS].copy()
+        frame["table"] = p.stem
+        frames.append(frame)
+
+    events = pd.concat(frames, ignore_index=True)
+    events["Start_Time"] = pd.to_datetime(events["Start_Time"])
+    events["End_Time"] = pd.to_datetime(events["End_Time"])
+    events = events.astype(object).where(events.notna(), None)
+    return events.sort_values("Start_Time", kind="stable").reset_index(drop=True)
+
+
+async def create_replay_tables(tables: Set[str]):
+    await database.execute(f"DROP DATABASE IF EXISTS `{REPLAY_SCHEMA}`")
+    await database.execute(f"CREATE DATABASE `{REPLAY_SCHEMA}`")
+    for table in tables:
+        await database.execute(
+            f"""
+            CREATE TABLE `{REPLAY_SCHEMA}`.`{table}` (
+                ID INT PRIMARY KEY,
+                Line VARCHAR(20) NOT NULL,
+                Device_Name VARCHAR(20) NOT NULL,
+                Category INT NOT NULL,
+                Start_Time DATETIME NOT NULL,
+                End_Time DATETIME NULL,
+                Message VARCHAR(100) NULL,
+                Start_File_Name VARCHAR(100) NULL,
+                End_File_Name VARCHAR(100) NULL,
+                INDEX (Start_Time)
+            )
+            """
+        )
+
+
+def metric(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def routine_load() -> Dict[str, Dict[str, float]]:
+    return {
+        name: {
+            "calls": metric("foxlink_routine_duration_seconds_count", routine=name),
+            "busy_seconds": metric("foxlink_routine_duration_seconds_sum", routine=name),
+            "queries": metric("foxlink_db_query_duration_seconds_count", database="main", scope=name),
+            "query_seconds": metric("foxlink_db_query_duration_seconds_sum", database="main", scope=name),
+        }
+        for name in TICKER_ROUTINES + MAIN_ROUTINES
+    }
+
+
+def summarize(values: List[float]) -> Optional[Dict[str, float]]:
+    if len(values) == 0:
+        return None
+
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": round(values[len(values) // 2], 1),
+        "p95": round(values[min(int(len(values) * 0.95), len(values) - 1)], 1),
+        "max": round(values[-1], 1),
+    }
+
+
+class Replay:
+    """Feeds the stand-in tables on the simulated clock and plays the part of the workers.
+
+    Args:
+    - events: the exported rows, sorted by Start_Time
+    - speed: how many simulated seconds pass per wall clock second
+    - accept_delay / travel_delay: simulated seconds a worker needs to accept a mission / to arrive at the device
+    - default_repair: simulated repair seconds of events without a logged End_Time
+    """
+
+    def __init__(self, events: pd.DataFrame, speed: float, accept_delay: float, travel_delay: float, default_repair: float):
+        self.events = events.to_dict("records")
+        self.speed = speed
+        self.accept_delay = accept_delay
+        self.travel_delay = travel_delay
+        self.default_repair = default_repair
+        self.sim_start: datetime = self.events[0]["Start_Time"]
+        self.wall_start = 0.0
+        self.next_event = 0
+        self.repair_seconds: Dict[tuple, float] = {}
+        # (logged End_Time, table, ID) of the injected events which are still open
+        self.open_events: List[tuple] = []
+        self.worker_tasks: Dict[int, "asyncio.Task[None]"] = {}
+        self.finished_missions = 0
+        self.failed_actions = 0
+
+    def now(self) -> datetime:
+        return self.sim_start + timedelta(seconds=(time.monotonic() - self.wall_start) * self.speed)
+
+    async def sleep(self, sim_seconds: float):
+        await asyncio.sleep(max(sim_seconds, 0) / self.speed)
+
+    @property
+    def done_injecting(self) -> bool:
+        return self.next_event >= len(self.events)
+
+    async def inject(self):
+        now = self.now()
+
+        while not self.done_injecting and self.events[self.next_event]["Start_Time"] <= now:
+            e = self.events[self.next_event]
+            self.next_event += 1
+            key = (e["table"], int(e["ID"]))
+
+            if e["End_Time"] is not None:
+                self.repair_seconds[key] = (e["End_Time"] - e["Start_Time"]).total_seconds()
+                self.open_events.append((e["End_Time"], *key))
+
+            # the Foxlink tables are in local time (UTC+8), and the daemon only looks at the last day
+            await database.execute(
+                f"""
+                INSERT INTO `{REPLAY_SCHEMA}`.`{e['table']}` (ID, Line, Device_Name, Category, Start_Time, Message, Start_File_Name, End_File_Name)
+                VALUES (:id, :line, :device_name, :category, UTC_TIMESTAMP() + INTERVAL 8 HOUR, :message, :start_file_name, :end_file_name)
+                """,
+                {
+                    "id": key[1], "line": str(e["Line"]), "device_name": e["Device_Name"], "category": int(e["Category"]),
+                    "message": e["Message"], "start_file_name": e["Start_File_Name"], "end_file_name": e["End_File_Name"],
+                },
+            )
+
+        # failures nobody was dispatched to end when they ended in history
+        self.open_events.sort()
+        while len(self.open_events) != 0 and self.open_events[0][0] <= now:
+            _, table, event_id = self.open_events.pop(0)
+            await database.execute(
+                f"""
+                UPDATE `{REPLAY_SCHEMA}`.`{table}` e
+                SET e.End_Time = UTC_TIMESTAMP() + INTERVAL 8 HOUR
+                WHERE e.ID = :id AND e.End_Time IS NULL AND NOT EXISTS (
+                    SELECT 1 FROM missionevents me INNER JOIN missions_users mu ON mu.mission = me.mission
+                    WHERE me.event_id = :id AND me.table_name = :table
+                )
+                """,
+                {"id": event_id, "table": table},
+            )
+
+    async def pick_up_missions(self):
+        assigned = await database.fetch_all(
+            """
+            SELECT m.id, mu.user, d.is_rescue FROM missions m
+            INNER JOIN missions_users mu ON mu.mission = m.id
+            INNER JOIN devices d ON d.id = m.device
+            WHERE m.repair_end_date IS NULL AND m.is_cancel = FALSE
+            """
+        )
+
+        for mission_id, username, is_rescue in assigned:
+            if mission_id not in self.worker_tasks:
+                self.worker_tasks[mission_id] = asyncio.create_task(self.work_on(mission_id, username, bool(is_rescue)))
+
+    async def act(self, action, mission_id: int, username: str) -> bool:
+        user = await User.objects.get(username=username)
+        try:
+            await action(mission_id, user)
+            return True
+        except HTTPException as e:
+            # 200 means the action is already done
+            if e.status_code == 200:
+                return True
+            self.failed_actions += 1
+            logger.warning(f"[replay] {action.__name__} of mission {mission_id} by {username} failed: {e.detail}")
+            return False
+
+    async def work_on(self, mission_id: int, username: str, is_rescue: bool):
+        token = metrics_scope.set("replay_workers")
+        try:
+            await self.sleep(self.accept_delay)
+            if not await self.act(accept_mission, mission_id, username):
+                return
+
+            await self.sleep(self.travel_delay)
+            # starting a to-rescue-station mission also finishes it
+            if not await self.act(start_mission_by_id, mission_id, username) or is_rescue:
+                return
+
+            events = await database.fetch_all(
+                "SELECT table_name, event_id FROM missionevents WHERE mission = :mission_id", {"mission_id": mission_id}
+            )
+            await self.sleep(max((self.repair_seconds.get((t, i), self.default_repair) for t, i in events), default=self.default_repair))
+
+            for table, event_id in events:
+                await database.execute(
+                    f"UPDATE `{REPLAY_SCHEMA}`.`{table}` SET End_Time = UTC_TIMESTAMP() + INTERVAL 8 HOUR WHERE ID = :id AND End_Time IS NULL",
+                    {"id": event_id},
+                )
+
+            # wait for check_events_is_complete to verify the events
+            while await database.fetch_val(
+                "SELECT COUNT(*) FROM missionevents WHERE mission = :mission_id AND done_verified = FALSE", {"mission_id": mission_id}
+            ) != 0:
+                await asyncio.sleep(0.05)
+
+            if await self.act(finish_mission_by_id, mission_id, username):
+                self.finished_missions += 1
+        finally:
+            metrics_scope.reset(token)
+
+
+async def main_loop(interval: float, stop: asyncio.Event, usernames: List[str]):
+    """The routines of one `main_routine` iteration, until `stop` is set."""
+    routines = [getattr(background_service, name) for name in MAIN_ROUTINES]
+
+    while not stop.is_set():
+        # every maintainer is connected, so check_alive_worker_routine never needs EMQX
+        presence_map.enabled = True
+        presence_map.seed({u: {} for u in usernames}, datetime.utcnow())
+
+        for fn in routines:
+            try:
+                await fn()
+            except Exception as e:
+                logger.error(f"[replay] exception in main_routine: {repr(e)}")
+
+        await asyncio.sleep(interval)
+
+
+async def mission_latencies(since: datetime, speed: float) -> Dict[str, Any]:
+    rows = await database.fetch_all(
+        """
+        SELECT m.created_date, m.repair_start_date, d.is_rescue, m.is_cancel, (
+            SELECT MIN(a.created_date) FROM auditlogheaders a
+            WHERE a.action = :assigned AND a.table_name = 'missions' AND a.record_pk = CAST(m.id AS CHAR)
+        ) AS assigned_date
+        FROM missions m
+        INNER JOIN devices d ON d.id = m.device
+        WHERE m.created_date >= :since
+        """,
+        {"assigned": AuditActionEnum.MISSION_ASSIGNED.value, "since": since},
+    )
+    missions = [r for r in rows if not r["is_rescue"]]
+
+    return {
+        "missions": len(missions),
+        "rescue_missions": len(rows) - len(missions),
+        "never_dispatched": len([r for r in missions if r["assigned_date"] is None and not r["is_cancel"]]),
+        "autocanceled": len([r for r in missions if r["is_cancel"]]),
+        "wait_seconds": summarize([
+            (r["assigned_date"] - r["created_date"]).total_seconds() * speed
+            for r in missions if r["assigned_date"] is not None
+        ]),
+        "repair_start_seconds": summarize([
+            (r["repair_start_date"] - r["created_date"]).total_seconds() * speed
+            for r in missions if r["repair_start_date"] is not None
+        ]),
+    }
+
+
+async def cleanup(since: datetime):
+    await database.execute(
+        "DELETE FROM auditlogheaders WHERE table_name = 'missions' AND record_pk IN (SELECT CAST(id AS CHAR) FROM missions WHERE created_date >= :since)",
+        {"since": since},
+    )
+    await database.execute(
+        "DELETE mu FROM missions_users mu INNER JOIN missions m ON m.id = mu.mission WHERE m.created_date >= :since",
+        {"since": since},
+    )
+    await database.execute("DELETE FROM missions WHERE created_date >= :since", {"since": since})
+    await database.execute(f"DROP DATABASE IF EXISTS `{REPLAY_SCHEMA}`")
+
+
+def load_policy(spec: str):
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name or "Foxlink_dispatch")()
+
+
+async def main(args):
+    events = load_events(args.files)
+    if len(events) == 0:
+        raise ValueError("no events to replay")
+
+    background_service.dispatch = load_policy(args.policy)
+    mqtt_client = NullMqttClient()
+    mqtt_main.mqtt_client = mqtt_client  # type: ignore
+
+    foxlink = FoxlinkBackground()
+    foxlink._dbs = [database]
+    foxlink.db_name = REPLAY_SCHEMA
+    tickers = [
+        Ticker(foxlink.fetch_events_from_foxlink, args.fetch_interval / args.speed),
+        Ticker(foxlink.check_events_is_complete, args.check_interval / args.speed),
+    ]
+
+    await database.connect()
+    since = datetime.utcnow().replace(microsecond=0)
+    try:
+        await create_replay_tables(set(events["table"]))
+        usernames = [
+            u.username for u in await User.objects.filter(level=UserLevel.maintainer.value).fields(["username"]).all()
+        ]
+        if not args.keep_worker_status:
+            await WorkerStatus.objects.filter(worker__in=usernames).update(
+                status=WorkerStatusEnum.idle.value, last_event_end_date=datetime.utcnow()
+            )
+
+        replay = Replay(events, args.speed, args.accept_delay, args.travel_delay, args.default_repair)
+        load_before = routine_load()
+        cpu_start = time.process_time()
+        replay.wall_start = time.monotonic()
+
+        stop = asyncio.Event()
+        for t in tickers:
+            await t.start()
+        main_task = asyncio.create_task(main_loop(args.loop_interval / args.speed, stop, usernames))
+
+        token = metrics_scope.set("replay_simulator")
+        drain_until: Optional[datetime] = None
+        while drain_until is None or replay.now() < drain_until:
+            await replay.inject()
+            await replay.pick_up_missions()
+            if drain_until is None and replay.done_injecting:
+                drain_until = replay.now() + timedelta(seconds=args.drain)
+            await asyncio.sleep(0.05)
+        metrics_scope.reset(token)
+
+        stop.set()
+        await main_task
+        for t in tickers:
+            await t.stop()
+        for task in replay.worker_tasks.values():
+            task.cancel()
+        await asyncio.gather(*replay.worker_tasks.values(), return_exceptions=True)
+
+        wall = time.monotonic() - replay.wall_start
+        load_after = routine_load()
+        routines = {
+            name: {k: round(load_after[name][k] - load_before[name][k], 3) for k in load_after[name]}
+            for name in load_after
+        }
+        busy = sum(r["busy_seconds"] for r in routines.values())
+
+        report = {
+            **git_revision(),
+            "created_at": datetime.utcnow().isoformat(),
+            "params": vars(args),
+            "events": len(events),
+            "simulated_seconds": round(wall * args.speed, 1),
+            "wall_seconds": round(wall, 1),
+            **await mission_latencies(since, args.speed),
+            "finished_missions": replay.finished_missions,
+            "failed_worker_actions": replay.failed_actions,
+            "mqtt_messages": mqtt_client.published,
+            "daemon": {
+                "process_cpu_seconds": round(time.process_time() - cpu_start, 2),
+                "busy_seconds": round(busy, 2),
+                "utilization": round(busy / wall, 3),
+                "queries": int(sum(r["queries"] for r in routines.values())),
+                "queries_per_second": round(sum(r["queries"] for r in routines.values()) / wall, 1),
+                "routines": routines,
+            },
+        }
+    finally:
+        presence_map.clear()
+        if not args.keep:
+            await cleanup(since)
+        await database.disconnect()
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="exported *_event_new tables (.csv or .parquet)")
+    parser.add_argument("--speed", type=float, default=10, help="simulated seconds per wall clock second")
+    parser.add_argument("--policy", default="foxlink_dispatch.dispatch:Foxlink_dispatch", help="dispatch implementation, module:class")
+    parser.add_argument("--fetch-interval", type=float, default=10, help="simulated seconds between Foxlink fetches")
+    parser.add_argument("--check-interval", type=float, default=5, help="simulated seconds between event completion checks")
+    parser.add_argument("--loop-interval", type=float, default=1, help="simulated idle seconds between main_routine loops")
+    parser.add_argument("--accept-delay", type=float, default=30, help="simulated seconds until a worker accepts a mission")
+    parser.add_argument("--travel-delay", type=float, default=120, help="simulated seconds until a worker starts the repair")
+    parser.add_argument("--default-repair", type=float, default=600, help="simulated repair seconds of events without End_Time")
+    parser.add_argument("--drain", type=float, default=1800, help="simulated seconds to keep running after the last event")
+    parser.add_argument("--keep-worker-status", action="store_true", help="don't set every maintainer to idle before the replay")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the missions and the replay schema after the run")
+    asyncio.run(main(parser.parse_args()))
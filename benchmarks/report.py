@@ -0,0 +1,24 @@
+"""Helpers shared by the benchmarks to produce JSON reports comparable across commits."""
+import json
+import subprocess
+from typing import Any, Dict, Optional
+
+
+def git_revision() -> Dict[str, Any]:
+    """The commit the benchmark ran on, and whether tracked files had local changes."""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip() != ""
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def write_report(report: Dict[str, Any], output: Optional[str]):
+    """Write the report to `output`, or print it when no file is given."""
+    content = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(content)
+    else:
+        print(content)
@@ -0,0 +1,211 @@
+"""
+Benchmark `get_top_abnormal_devices` against a synthetic `missionevents` table.
+
+The previous implementation issued one extra "top 3 assignees" query per returned
+device; it is kept here as `legacy_top_abnormal_devices` so both versions can be
+timed against the same data.
+
+Usage:
+    python -m benchmarks.top_abnormal_devices --events 1000000 --repeat 5
+
+The rows are written into the database configured by the DATABASE_* env
+variables, so point it at a scratch database (MySQL 8). Every seeded row belongs
+to the `benchmark-workshop` workshop and is removed when the benchmark finishes.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from app.core.database import database
+from app.services.statistics import (
+    AbnormalDeviceInfo,
+    UserInfoWithDuration,
+    get_top_abnormal_devices,
+)
+
+WORKSHOP_NAME = "benchmark-workshop"
+DEVICE_PREFIX = "BENCH@1@Device_"
+USER_PREFIX = "bench-"
+
+
+async def seed(devices: int, users: int, events: int, events_per_mission: int, start_date: datetime) -> int:
+    """Seed the synthetic workshop, returns the workshop id."""
+    missions = events // events_per_mission
+
+    async with database.connection() as conn:
+        await conn.execute(f"SET SESSION cte_max_recursion_depth = {max(devices, users, events) + 1}")
+
+        await conn.execute(
+            "INSERT INTO factorymaps (name, map, related_devices) VALUES (:name, '[]', '[]')",
+            {"name": WORKSHOP_NAME},
+        )
+        workshop_id = await conn.fetch_val("SELECT id FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+        mission_base = await conn.fetch_val("SELECT COALESCE(MAX(id), 0) FROM missions")
+
+        await conn.execute(
+            f"""
+            INSERT INTO devices (id, project, line, device_name, x_axis, y_axis, is_rescue, workshop)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {devices - 1})
+            SELECT CONCAT('{DEVICE_PREFIX}', n), 'BENCH', 1, CONCAT('Device_', n), n, n, FALSE, :workshop_id FROM seq
+            """,
+            {"workshop_id": workshop_id},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO users (username, password_hash, full_name, expertises, location, level)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {users - 1})
+            SELECT CONCAT('{USER_PREFIX}', n), '', CONCAT('Bench Worker ', n), '[]', :workshop_id, 1 FROM seq
+            """,
+            {"workshop_id": workshop_id},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO missions (id, device, name, description, required_expertises, is_cancel, is_emergency, is_autocanceled, created_date, updated_date, repair_start_date, repair_end_date)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {missions - 1})
+            SELECT
+                :mission_base + n + 1, CONCAT('{DEVICE_PREFIX}', n % {devices}), 'benchmark', '', '[]', FALSE, FALSE, FALSE,
+                :start_date + INTERVAL (n % 43200) MINUTE, :start_date + INTERVAL (n % 43200) MINUTE,
+                :start_date + INTERVAL (n % 43200) MINUTE, :start_date + INTERVAL (n % 43200 + 30) MINUTE
+            FROM seq
+            """,
+            {"mission_base": mission_base, "start_date": start_date},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO missions_users (user, mission)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {missions - 1})
+            SELECT CONCAT('{USER_PREFIX}', (n * 31) % {users}), :mission_base + n + 1 FROM seq
+            """,
+            {"mission_base": mission_base},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO missionevents (mission, event_id, table_name, category, message, done_verified, event_start_date, event_end_date)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {events - 1})
+            SELECT
+                :mission_base + (n DIV {events_per_mission}) + 1, n, 'benchmark', 1 + (n * 7) % 50, CONCAT('故障 ', (n * 7) % 50), TRUE,
+                :start_date + INTERVAL 8 HOUR + INTERVAL ((n DIV {events_per_mission}) % 43200) MINUTE,
+                :start_date + INTERVAL 8 HOUR + INTERVAL ((n DIV {events_per_mission}) % 43200) MINUTE + INTERVAL (60 + (n * 13) % 3600) SECOND
+            FROM seq
+            """,
+            {"mission_base": mission_base, "start_date": start_date},
+        )
+
+    return workshop_id
+
+
+async def cleanup():
+    await database.execute(
+        "DELETE mu FROM missions_users mu INNER JOIN missions m ON m.id = mu.mission WHERE m.device LIKE :prefix",
+        {"prefix": f"{DEVICE_PREFIX}%"},
+    )
+    await database.execute("DELETE FROM missions WHERE device LIKE :prefix", {"prefix": f"{DEVICE_PREFIX}%"})
+    await database.execute("DELETE FROM users WHERE username LIKE :prefix", {"prefix": f"{USER_PREFIX}%"})
+    await database.execute("DELETE FROM devices WHERE id LIKE :prefix", {"prefix": f"{DEVICE_PREFIX}%"})
+    await database.execute("DELETE FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+
+
+async def legacy_top_abnormal_devices(workshop_id: int, start_date: datetime, end_date: datetime, limit=10) -> List[AbnormalDeviceInfo]:
+    """The N+1 implementation replaced by the windowed query."""
+    abnormal_devices = await database.fetch_all(
+        """
+        SELECT device as device_id, d.device_cname,  max(message) as message, max(category) as category, max(TIMESTAMPDIFF(SECOND, event_start_date, event_end_date)) as duration
+        FROM missionevents
+        INNER JOIN missions m ON m.id = mission
+        INNER JOIN devices d ON d.id = m.device 
+        WHERE 
+            event_start_date IS NOT NULL
+            AND event_end_date IS NOT NULL
+            AND (event_start_date BETWEEN :start_date AND :end_date)
+            AND d.workshop = :workshop_id
+        GROUP BY device
+        ORDER BY duration DESC
+        LIMIT :limit;
+        """,
+        {"workshop_id": workshop_id, "start_date": start_date + timedelta(hours=8), "end_date": end_date + timedelta(hours=8), "limit": limit},
+    )
+
+    result = [AbnormalDeviceInfo(**m) for m in abnormal_devices]
+
+    for m in result:
+        top_assignees_in_mission = await database.fetch_all(
+            """
+            SELECT t1.username, t1.full_name, min(t1.duration) as duration FROM (
+                SELECT u.username, u.full_name, TIMESTAMPDIFF(SECOND, me.event_start_date, me.event_end_date) as duration
+                FROM missionevents me
+                LEFT OUTER JOIN missions_users mu ON mu.mission = me.mission
+                INNER JOIN missions m ON m.id = me.mission
+                INNER JOIN users u ON u.username = mu.user
+                WHERE device = :device_id AND category = :category AND event_end_date IS NOT NULL
+                ORDER BY duration ASC
+            ) t1
+            GROUP BY t1.username
+            ORDER BY duration
+            LIMIT 3;
+            """,
+            {"device_id": m.device_id, "category": m.category},
+        )
+        m.top_great_assignees = [UserInfoWithDuration(**x) for x in top_assignees_in_mission]
+
+    return result
+
+
+async def measure(fn, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    return {
+        "min": round(durations[0], 4),
+        "median": round(durations[len(durations) // 2], 4),
+        "max": round(durations[-1], 4),
+    }
+
+
+async def main(args):
+    start_date = datetime(2022, 1, 1)
+    end_date = start_date + timedelta(days=30)
+
+    await database.connect()
+    try:
+        await cleanup()
+        seed_start = time.perf_counter()
+        workshop_id = await seed(args.devices, args.users, args.events, args.events_per_mission, start_date)
+        seed_duration = time.perf_counter() - seed_start
+
+        report = {
+            "events": args.events,
+            "devices": args.devices,
+            "users": args.users,
+            "limit": args.limit,
+            "seed_seconds": round(seed_duration, 2),
+            "windowed": await measure(lambda: get_top_abnormal_devices(workshop_id, start_date, end_date, None, args.limit), args.repeat),
+        }
+
+        if not args.skip_legacy:
+            report["legacy"] = await measure(lambda: legacy_top_abnormal_devices(workshop_id, start_date, end_date, args.limit), args.repeat)
+
+        print(json.dumps(report, indent=2))
+    finally:
+        if not args.keep:
+            await cleanup()
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--events-per-mission", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows after the run")
+    asyncio.run(main(parser.parse_args()))
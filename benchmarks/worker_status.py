@@ -0,0 +1,240 @@
+"""
+Benchmark `/stats/{workshop_name}/worker-status` (`get_workshop_worker_status`)
+for a workshop with many maintainers.
+
+The previous implementation loaded the statuses with ormar and then built every
+worker's DTO separately (status, dispatch count and working mission queries per
+worker); it is kept here as `legacy_workshop_worker_status` so both versions can
+be timed against the same data.
+
+Usage:
+    python -m benchmarks.worker_status --workers 500 --repeat 5 --output report.json
+
+The rows are written into the database configured by the DATABASE_* env
+variables, so point it at a scratch database (MySQL 8). Every seeded row belongs
+to the `benchmark-worker-status` workshop and is removed when the benchmark finishes.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from app.core.database import AuditActionEnum, UserLevel, WorkerStatus, WorkerStatusEnum, database
+from app.models.schema import WorkerStatusDto
+from app.mqtt.presence import presence_map
+from app.services.user import get_user_working_mission, get_workshop_worker_status
+from app.utils.profiler import profile_queries
+from app.utils.utils import gather_with_limit, get_current_shift_time_interval
+from benchmarks.report import git_revision, write_report
+
+WORKSHOP_NAME = "benchmark-worker-status"
+DEVICE_PREFIX = "BENCHSTATUS@1@Device_"
+DEVICE_PATTERN = "BENCHSTATUS@%"
+USER_PREFIX = "bench-status-"
+USER_PATTERN = "bench-status-%"
+
+# worker n has status STATUSES[n % 4], the first three are working on an open mission
+STATUSES = [WorkerStatusEnum.working, WorkerStatusEnum.moving, WorkerStatusEnum.notice, WorkerStatusEnum.idle]
+
+
+async def seed(workers: int, devices: int, finished_missions: int):
+    """Every worker has `finished_missions` missions started in the current shift, busy workers also an open one."""
+    closed = workers * finished_missions
+
+    async with database.connection() as conn:
+        await conn.execute(f"SET SESSION cte_max_recursion_depth = {max(workers, devices, closed) + 1}")
+
+        await conn.execute(
+            "INSERT INTO factorymaps (name, map, related_devices) VALUES (:name, '[]', '[]')", {"name": WORKSHOP_NAME}
+        )
+        workshop_id = await conn.fetch_val("SELECT id FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+        mission_base = await conn.fetch_val("SELECT COALESCE(MAX(id), 0) FROM missions")
+
+        await conn.execute(
+            f"""
+            INSERT INTO devices (id, project, line, device_name, device_cname, x_axis, y_axis, is_rescue, workshop)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {devices - 1})
+            SELECT CONCAT('{DEVICE_PREFIX}', n), 'BENCHSTATUS', 1, CONCAT('Device_', n), CONCAT('機台 ', n), n, n, FALSE, :workshop_id
+            FROM seq
+            """,
+            {"workshop_id": workshop_id},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO users (username, password_hash, full_name, expertises, location, level)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {workers - 1})
+            SELECT CONCAT('{USER_PREFIX}', n), '', CONCAT('Bench Worker ', n), '[]', :workshop_id, {UserLevel.maintainer.value}
+            FROM seq
+            """,
+            {"workshop_id": workshop_id},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO worker_status (worker, at_device, status, last_event_end_date, dispatch_count, check_alive_time)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {workers - 1})
+            SELECT CONCAT('{USER_PREFIX}', n), CONCAT('{DEVICE_PREFIX}', n % {devices}),
+                ELT(n % 4 + 1, {", ".join(f"'{s.value}'" for s in STATUSES)}), UTC_TIMESTAMP(), 0, UTC_TIMESTAMP()
+            FROM seq
+            """
+        )
+
+        # missions [1, closed] are finished, [closed + 1, closed + workers] are the open ones of busy workers
+        await conn.execute(
+            f"""
+            INSERT INTO missions (id, device, name, description, required_expertises, is_cancel, is_emergency, is_autocanceled,
+                created_date, updated_date, repair_start_date, repair_end_date)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {closed - 1})
+            SELECT :mission_base + n + 1, CONCAT('{DEVICE_PREFIX}', n % {devices}), 'benchmark', '', '[]', FALSE, FALSE, FALSE,
+                :shift_start, :shift_start, :shift_start, :shift_start + INTERVAL 10 MINUTE
+            FROM seq
+            """,
+            {"mission_base": mission_base, "shift_start": get_current_shift_time_interval()[0]},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO missions (id, device, name, description, required_expertises, is_cancel, is_emergency, is_autocanceled,
+                created_date, updated_date, repair_start_date)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {workers - 1})
+            SELECT :mission_base + {closed} + n + 1, CONCAT('{DEVICE_PREFIX}', n % {devices}), 'benchmark', '', '[]', FALSE, FALSE, FALSE,
+                UTC_TIMESTAMP() - INTERVAL 20 MINUTE, UTC_TIMESTAMP(), IF(n % 4 = 0, UTC_TIMESTAMP() - INTERVAL 10 MINUTE, NULL)
+            FROM seq WHERE n % 4 != 3
+            """,
+            {"mission_base": mission_base},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO missions_users (user, mission)
+            WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {closed + workers - 1})
+            SELECT CONCAT('{USER_PREFIX}', IF(n < {closed}, n % {workers}, n - {closed})), :mission_base + n + 1
+            FROM seq WHERE n < {closed} OR (n - {closed}) % 4 != 3
+            """,
+            {"mission_base": mission_base},
+        )
+        await conn.execute(
+            f"""
+            INSERT INTO auditlogheaders (action, table_name, record_pk, user, created_date)
+            SELECT :action, 'missions', mu.mission, mu.user, UTC_TIMESTAMP()
+            FROM missions_users mu WHERE mu.user LIKE :pattern
+            """,
+            {"action": AuditActionEnum.MISSION_STARTED.value, "pattern": USER_PATTERN},
+        )
+
+
+async def cleanup():
+    await database.execute("DELETE FROM auditlogheaders WHERE user LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute(
+        "DELETE mu FROM missions_users mu INNER JOIN missions m ON m.id = mu.mission WHERE m.device LIKE :pattern",
+        {"pattern": DEVICE_PATTERN},
+    )
+    await database.execute("DELETE FROM missions WHERE device LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM worker_status WHERE worker LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM users WHERE username LIKE :pattern", {"pattern": USER_PATTERN})
+    await database.execute("DELETE FROM devices WHERE id LIKE :pattern", {"pattern": DEVICE_PATTERN})
+    await database.execute("DELETE FROM factorymaps WHERE name = :name", {"name": WORKSHOP_NAME})
+
+
+async def legacy_worker_status(username: str) -> Optional[WorkerStatusDto]:
+    """The per-worker implementation replaced by `build_worker_status_dtos`."""
+    s = await WorkerStatus.objects.filter(worker=username).select_related(["worker", "at_device"]).get_or_none()
+
+    if s is None:
+        return None
+
+    shift_start, shift_end = get_current_shift_time_interval()
+    total_start_count = await database.fetch_val(
+        """
+        SELECT COUNT(DISTINCT mu.mission) FROM missions_users mu
+        INNER JOIN missions m ON m.id = mu.mission
+        INNER JOIN auditlogheaders a ON a.record_pk = m.id
+        WHERE mu.user = :username AND a.action = 'MISSION_STARTED' AND (a.created_date BETWEEN :shift_start AND :shift_end);
+        """,
+        {"username": username, "shift_start": shift_start, "shift_end": shift_end},
+    )
+
+    item = WorkerStatusDto(
+        worker_id=username,
+        worker_name=s.worker.full_name,
+        status=s.status,
+        last_event_end_date=s.last_event_end_date,
+        total_dispatches=total_start_count,
+        is_online=presence_map.is_connected(username),
+    )
+    item.at_device = s.at_device.id if s.at_device is not None else None
+    item.at_device_cname = s.at_device.device_cname if s.at_device is not None else None
+
+    mission = await get_user_working_mission(username)
+    if s.status in [WorkerStatusEnum.working.value, WorkerStatusEnum.moving.value, WorkerStatusEnum.notice.value] and mission is not None:
+        item.mission_duration = mission.mission_duration.total_seconds()  # type: ignore
+
+        if mission.repair_duration is not None and not mission.device.is_rescue:
+            item.repair_duration = mission.repair_duration.total_seconds()
+
+        if s.status == WorkerStatusEnum.moving.value:
+            item.at_device = mission.device.id
+            item.at_device_cname = mission.device.device_cname
+
+    return item
+
+
+async def legacy_workshop_worker_status(workshop_name: str) -> List[Optional[WorkerStatusDto]]:
+    states = (
+        await WorkerStatus.objects.select_related(["worker", "worker__location"])
+        .exclude_fields(["worker__location__related_devices", "worker__location__image", "worker__location__map"])
+        .filter(worker__level=UserLevel.maintainer.value, worker__location__name=workshop_name)
+        .all()
+    )
+    return await gather_with_limit(*[legacy_worker_status(s.worker.username) for s in states], database=database)
+
+
+async def measure(name: str, fn, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        with profile_queries(name, enabled=True) as profile:
+            start = time.perf_counter()
+            result = await fn()
+            durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    return {
+        "workers": len(result),
+        "queries": profile.query_count,
+        "min": round(durations[0], 4),
+        "median": round(durations[len(durations) // 2], 4),
+        "max": round(durations[-1], 4),
+    }
+
+
+async def main(args):
+    await database.connect()
+    try:
+        await cleanup()
+        await seed(args.workers, args.devices, args.finished_missions)
+
+        report = {
+            **git_revision(),
+            "created_at": datetime.utcnow().isoformat(),
+            "params": vars(args),
+            "bulk": await measure("bulk", lambda: get_workshop_worker_status(WORKSHOP_NAME), args.repeat),
+        }
+
+        if not args.skip_legacy:
+            report["legacy"] = await measure("legacy", lambda: legacy_workshop_worker_status(WORKSHOP_NAME), args.repeat)
+    finally:
+        if not args.keep:
+            await cleanup()
+        await database.disconnect()
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=500)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--finished-missions", type=int, default=5, help="missions each worker started in the current shift")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows after the run")
+    asyncio.run(main(parser.parse_args()))
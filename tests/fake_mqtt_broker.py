@@ -0,0 +1,215 @@
+"""A minimal in-process MQTT 3.1.1 broker for tests.
+
+It supports CONNECT, SUBSCRIBE/UNSUBSCRIBE (with `+`/`#` wildcards), PUBLISH in
+QoS 0/1/2 (forwarded to subscribers in QoS 0), retained messages, PINGREQ and
+DISCONNECT. Like EMQX, it publishes `$SYS/brokers/{node}/clients/{clientid}/connected`
+and `.../disconnected` events as JSON when clients come and go.
+"""
+import asyncio
+import json
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+NODE = "fake@127.0.0.1"
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p_levels, t_levels = pattern.split("/"), topic.split("/")
+
+    # wildcards at the first level don't match topics starting with $
+    if topic.startswith("$") and p_levels[0] in ("+", "#"):
+        return False
+
+    for i, p in enumerate(p_levels):
+        if p == "#":
+            return True
+        if i >= len(t_levels) or (p != "+" and p != t_levels[i]):
+            return False
+
+    return len(p_levels) == len(t_levels)
+
+
+def encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b, n = n % 128, n // 128
+        out.append(b | 0x80 if n > 0 else b)
+        if n == 0:
+            return bytes(out)
+
+
+def encode_str(s: str) -> bytes:
+    b = s.encode()
+    return struct.pack("!H", len(b)) + b
+
+
+def packet(header: int, body: bytes) -> bytes:
+    return bytes([header]) + encode_length(len(body)) + body
+
+
+class Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id = ""
+        self.username: Optional[str] = None
+        self.subscriptions: Set[str] = set()
+        self.next_packet_id = 0
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class FakeMqttBroker:
+    def __init__(self, denied_topics: Tuple[str, ...] = ()):
+        self.denied_topics = denied_topics
+        self.port: Optional[int] = None
+        self.published: List[Tuple[str, bytes, int, bool]] = []
+        self.retained: Dict[str, bytes] = {}
+        self._sessions: List[Session] = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def start(self) -> int:
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop
+        )
+        self._server = future.result(5)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    def stop(self):
+        async def close():
+            assert self._server is not None
+            self._server.close()
+            for s in self._sessions:
+                s.writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def wait_for(self, predicate, timeout: float = 5) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _route(self, topic: str, payload: bytes, retain: bool = False):
+        if retain:
+            if len(payload) == 0:
+                self.retained.pop(topic, None)
+            else:
+                self.retained[topic] = payload
+
+        for s in self._sessions:
+            if any(topic_matches(p, topic) for p in s.subscriptions):
+                s.send(packet(0x30, encode_str(topic) + payload))
+
+    def _sys_event(self, session: Session, event: str):
+        payload = {"clientid": session.client_id, "username": session.username, "ts": int(time.time() * 1000)}
+        if event == "connected":
+            payload["ipaddress"] = "127.0.0.1"
+        self._route(f"$SYS/brokers/{NODE}/clients/{session.client_id}/{event}", json.dumps(payload).encode())
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            b = (await reader.readexactly(1))[0]
+            length += (b & 0x7F) * multiplier
+            multiplier *= 128
+            if b & 0x80 == 0:
+                break
+        return header, await reader.readexactly(length)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session(writer)
+        connected = False
+
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                kind = header >> 4
+
+                if kind == 1:  # CONNECT
+                    offset = 2 + struct.unpack("!H", body[:2])[0]
+                    flags = body[offset + 1]
+                    offset += 4
+
+                    def read_str() -> str:
+                        nonlocal offset
+                        n = struct.unpack("!H", body[offset:offset + 2])[0]
+                        s = body[offset + 2:offset + 2 + n].decode()
+                        offset += 2 + n
+                        return s
+
+                    session.client_id = read_str()
+                    if flags & 0x04:
+                        read_str()
+                        read_str()
+                    if flags & 0x80:
+                        session.username = read_str()
+
+                    self._sessions.append(session)
+                    connected = True
+                    session.send(packet(0x20, b"\x00\x00"))
+                    self._sys_event(session, "connected")
+                elif kind == 3:  # PUBLISH
+                    qos, retain = (header >> 1) & 0x03, bool(header & 0x01)
+                    n = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + n].decode()
+                    offset = 2 + n
+                    packet_id = None
+                    if qos > 0:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                    payload = body[offset:]
+                    self.published.append((topic, payload, qos, retain))
+                    self._route(topic, payload, retain)
+                    if qos == 1:
+                        session.send(packet(0x40, packet_id))
+                    elif qos == 2:
+                        session.send(packet(0x50, packet_id))
+                elif kind == 6:  # PUBREL
+                    session.send(packet(0x70, body[:2]))
+                elif kind == 8:  # SUBSCRIBE
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        n = struct.unpack("!H", body[offset:offset + 2])[0]
+                        topic = body[offset + 2:offset + 2 + n].decode()
+                        offset += 3 + n
+                        if topic in self.denied_topics:
+                            granted.append(0x80)
+                            continue
+                        session.subscriptions.add(topic)
+                        granted.append(0)
+                    session.send(packet(0x90, packet_id + bytes(granted)))
+                    for topic, payload in list(self.retained.items()):
+                        if any(topic_matches(p, topic) for p in session.subscriptions):
+                            session.send(packet(0x31, encode_str(topic) + payload))
+                elif kind == 10:  # UNSUBSCRIBE
+                    offset = 2
+                    while offset < len(body):
+                        n = struct.unpack("!H", body[offset:offset + 2])[0]
+                        session.subscriptions.discard(body[offset + 2:offset + 2 + n].decode())
+                        offset += 2 + n
+                    session.send(packet(0xB0, body[:2]))
+                elif kind == 12:  # PINGREQ
+                    session.send(packet(0xD0, b""))
+                elif kind == 14:  # DISCONNECT
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if connected:
+                self._sessions.remove(session)
+                self._sys_event(session, "disconnected")
+            writer.close()
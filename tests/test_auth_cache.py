@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.core.database import User
+from app.mqtt.changes import cache_invalidation_handler
+from app.services import user as user_service
+from app.services.user import get_user_principal, principal_cache
+
+
+class PrincipalCacheTestModule(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        principal_cache.invalidate()
+        self.addCleanup(principal_cache.invalidate)
+        self.lookups = 0
+        self.level = 1
+
+        async def get_user_by_username(username: str):
+            self.lookups += 1
+            level = self.level
+            await asyncio.sleep(0.01)
+
+            if username != "worker":
+                return None
+
+            return User(
+                username=username,
+                password_hash="hash",
+                full_name="worker",
+                expertises=[],
+                location=3,
+                is_active=True,
+                is_admin=False,
+                is_changepwd=False,
+                level=level,
+            )
+
+        patcher = patch.object(user_service, "get_user_by_username", get_user_by_username)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_cached_principal(self):
+        users = await asyncio.gather(*[get_user_principal("worker") for _ in range(5)])
+        user = await get_user_principal("worker")
+
+        self.assertEqual(self.lookups, 1)
+        self.assertEqual(user.location.id, 3)
+        self.assertEqual(user.level, 1)
+        # every request gets its own model
+        self.assertIsNot(users[0], users[1])
+
+    async def test_unknown_user(self):
+        self.assertIsNone(await get_user_principal("nobody"))
+        self.assertIsNone(await get_user_principal("nobody"))
+        self.assertEqual(self.lookups, 2)
+
+    async def test_invalidate(self):
+        await get_user_principal("worker")
+
+        self.level = 2
+        principal_cache.invalidate("worker")
+
+        self.assertEqual((await get_user_principal("worker")).level, 2)
+        self.assertEqual(self.lookups, 2)
+
+    async def test_invalidate_from_other_process(self):
+        await get_user_principal("worker")
+
+        # the user is updated through another API process
+        self.level = 2
+        cache_invalidation_handler(asyncio.get_running_loop())(b'{"name": "principals", "key": "worker"}')
+        await asyncio.sleep(0)
+
+        self.assertEqual((await get_user_principal("worker")).level, 2)
+        self.assertEqual(self.lookups, 2)
+
+    async def test_invalidate_while_loading(self):
+        loading = asyncio.ensure_future(get_user_principal("worker"))
+        await asyncio.sleep(0.001)
+
+        # the user is updated while the old row is being loaded
+        self.level = 2
+        principal_cache.invalidate("worker")
+
+        self.assertEqual((await loading).level, 1)
+        self.assertEqual((await get_user_principal("worker")).level, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
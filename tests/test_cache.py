@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.utils.cache import TTLCache
+
+
+class TTLCacheTestModule(unittest.IsolatedAsyncioTestCase):
+    async def test_single_flight(self):
+        cache: TTLCache[int] = TTLCache(ttl=60)
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return 42
+
+        results = await asyncio.gather(*[cache.get_or_set("key", compute) for _ in range(10)])
+
+        self.assertEqual([42] * 10, results)
+        self.assertEqual(1, calls)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(9, cache.coalesced)
+
+        self.assertEqual(42, await cache.get_or_set("key", compute))
+        self.assertEqual(1, cache.hits)
+
+    async def test_expire_and_invalidate(self):
+        cache: TTLCache[str] = TTLCache(ttl=0.05)
+        cache.set("a", "value")
+        self.assertEqual("value", cache.get("a"))
+
+        await asyncio.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+
+        cache.set("b", "value")
+        cache.invalidate("b")
+        self.assertIsNone(cache.get("b"))
+
+    async def test_exception_is_not_cached(self):
+        cache: TTLCache[int] = TTLCache(ttl=60)
+
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await cache.get_or_set("key", fail)
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(7, await cache.get_or_set("key", lambda: asyncio.sleep(0, result=7)))
+
+    def test_maxsize(self):
+        cache: TTLCache[int] = TTLCache(ttl=60, maxsize=2)
+        cache.set(1, 1)
+        cache.set(2, 2)
+        cache.set(3, 3)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(3, cache.get(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
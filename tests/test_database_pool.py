@@ -0,0 +1,90 @@
+import asyncio
+import tempfile
+import unittest
+import dotenv
+from databases import Database
+
+dotenv.load_dotenv('ntust.env')
+
+from app.utils.metrics import DB_POOL_CONNECTIONS, instrument_database
+from app.utils.utils import gather_with_limit
+
+
+def gauge_value(database_name: str, state: str) -> float:
+    return DB_POOL_CONNECTIONS.labels(database_name, state)._value.get()
+
+
+class DatabasePoolTestModule(unittest.IsolatedAsyncioTestCase):
+    async def test_gather_with_limit(self):
+        running = 0
+        max_running = 0
+
+        async def job(i: int):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return i
+
+        result = await gather_with_limit(*(job(i) for i in range(10)), limit=3)
+
+        self.assertEqual(result, list(range(10)))
+        self.assertEqual(max_running, 3)
+
+    async def test_gather_with_limit_connections(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db = instrument_database(Database(f"sqlite:///{tmp.name}/test.db"), "fanout-test")
+        await db.connect()
+        self.addAsyncCleanup(db.disconnect)
+
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+        parent = db.connection()
+
+        async def job():
+            await db.fetch_all("SELECT id FROM t")
+            return db.connection()
+
+        # without a database the tasks inherit the caller's connection
+        self.assertEqual({id(c) for c in await gather_with_limit(job(), job())}, {id(parent)})
+
+        connections = await gather_with_limit(*(job() for _ in range(4)), database=db, limit=2)
+        self.assertEqual(len({id(c) for c in connections}), 4)
+        self.assertNotIn(parent, connections)
+        self.assertIs(db.connection(), parent)
+        self.assertEqual(gauge_value("fanout-test", "in_use"), 0)
+
+    def test_new_connection(self):
+        # gather_with_limit relies on this private API of databases, which is pinned in requirements.in
+        db = Database("sqlite:///test.db")
+        parent = db.connection()
+
+        connection = db._new_connection()
+
+        self.assertIsNot(connection, parent)
+        self.assertIs(db.connection(), connection)
+
+    async def test_pool_gauges(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db = instrument_database(Database(f"sqlite:///{tmp.name}/test.db"), "pool-test")
+        await db.connect()
+        self.addAsyncCleanup(db.disconnect)
+
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+
+        async with db.connection() as conn:
+            await conn.fetch_all("SELECT id FROM t")
+            self.assertEqual(gauge_value("pool-test", "in_use"), 1)
+
+        self.assertEqual(gauge_value("pool-test", "in_use"), 0)
+        self.assertEqual(gauge_value("pool-test", "waiting"), 0)
+
+    def test_pool_max_size(self):
+        instrument_database(Database("mysql+aiomysql://u:p@localhost/db", max_size=3), "pool-max-test")
+        self.assertEqual(gauge_value("pool-max-test", "max"), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,11 @@
 import unittest
 import dotenv
 import os
-from datetime import datetime
+from datetime import date, datetime
 
 dotenv.load_dotenv('ntust.env')
 
-from app.utils.utils import get_current_shift_time_interval, get_shift_type_by_datetime
+from app.utils.utils import get_current_shift_time_interval, get_shift_date_by_datetime, get_shift_type_by_datetime
 from app.core.database import ShiftType
 
 class DutyShiftTestModule(unittest.TestCase):
@@ -34,6 +34,20 @@ class DutyShiftTestModule(unittest.TestCase):
 
         get_current_shift_time_interval()
 
+    def test_shift_date(self):
+        # DAY_SHIFT_BEGIN is 07:40 (local time) in ntust.env
+        # 04:00 local time belongs to the night shift started on previous day
+        dt = datetime(2022, 1, 1, 20, 0)
+        self.assertEqual(date(2022, 1, 1), get_shift_date_by_datetime(dt))
+
+        # 08:00 local time
+        dt = datetime(2022, 1, 2, 0, 0)
+        self.assertEqual(date(2022, 1, 2), get_shift_date_by_datetime(dt))
+
+        # 23:00 local time
+        dt = datetime(2022, 1, 2, 15, 0)
+        self.assertEqual(date(2022, 1, 2), get_shift_date_by_datetime(dt))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,96 @@
+import unittest
+import dotenv
+from aiohttp import web
+
+dotenv.load_dotenv('ntust.env')
+
+from app.mqtt.emqx import EmqxClient
+
+
+class FakeEmqxServer:
+    """A stand-in for the EMQX v4 HTTP API, serving an in-memory client list."""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.requests = 0
+        self.runner = None
+        self.port = None
+
+    async def list_clients(self, request: web.Request):
+        self.requests += 1
+        page, limit = int(request.query["_page"]), int(request.query["_limit"])
+        data = self.clients[(page - 1) * limit : page * limit]
+        return web.json_response(
+            {"code": 0, "data": data, "meta": {"page": page, "limit": limit, "count": len(self.clients)}}
+        )
+
+    async def get_client(self, request: web.Request):
+        self.requests += 1
+        client_id = request.match_info["client_id"]
+        data = [c for c in self.clients if c["clientid"] == client_id]
+        return web.json_response({"code": 0, "data": data})
+
+    @web.middleware
+    async def check_auth(self, request: web.Request, handler):
+        if request.headers.get("Authorization") is None:
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+
+    async def start(self):
+        app = web.Application(middlewares=[self.check_auth])
+        app.router.add_get("/api/v4/clients", self.list_clients)
+        app.router.add_get("/api/v4/clients/{client_id}", self.get_client)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def make_client(username: str, connected: bool = True):
+    return {"clientid": username, "username": username, "connected": connected, "ip_address": "10.0.0.1"}
+
+
+class EmqxClientTestModule(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        clients = [make_client(f"worker-{i}") for i in range(25)]
+        clients.append(make_client("offline-worker", connected=False))
+        self.server = FakeEmqxServer(clients)
+        await self.server.start()
+        self.emqx = EmqxClient(
+            f"http://127.0.0.1:{self.server.port}", "admin", "public",
+            max_concurrency=2, presence_ttl=60, page_size=10,
+        )
+
+    async def asyncTearDown(self):
+        await self.emqx.close()
+        await self.server.stop()
+
+    async def test_list_connected_clients(self):
+        clients = await self.emqx.list_connected_clients()
+        self.assertEqual(len(clients), 25)
+        self.assertNotIn("offline-worker", clients)
+        self.assertEqual(self.server.requests, 3)
+
+        # served from the presence cache
+        await self.emqx.list_connected_clients()
+        self.assertEqual(self.server.requests, 3)
+
+    async def test_check_connected(self):
+        self.assertEqual(await self.emqx.check_connected("worker-3"), (True, "10.0.0.1"))
+        self.assertEqual(await self.emqx.check_connected("offline-worker"), (False, None))
+        self.assertEqual(await self.emqx.check_connected("nobody"), (False, None))
+        self.assertEqual(self.server.requests, 3)
+
+        # once the list is cached, no more requests are sent
+        await self.emqx.list_connected_clients()
+        requests = self.server.requests
+        self.assertEqual(await self.emqx.check_connected("worker-24"), (True, "10.0.0.1"))
+        self.assertEqual(self.server.requests, requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
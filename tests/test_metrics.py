@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from typing import List, Tuple
+from unittest.mock import patch
+import dotenv
+from databases import Database
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+dotenv.load_dotenv('ntust.env')
+
+from app.routes import metrics as metrics_routes
+from app.services import auth as auth_service
+from app.utils.metrics import MetricsMiddleware, instrument_database, metrics_scope
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+async def call(app, method: str, path: str, headers: List[Tuple[bytes, bytes]] = []) -> int:
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "path": path, "raw_path": path.encode(),
+        "root_path": "", "scheme": "http", "query_string": b"", "headers": headers, "server": ("test", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+
+class MetricsTestModule(unittest.IsolatedAsyncioTestCase):
+    async def test_route_latency(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            return {"id": item_id}
+
+        name = "foxlink_http_request_duration_seconds_count"
+        before = sample(name, method="GET", route="/items/{item_id}", status="200")
+
+        self.assertEqual(await call(app, "GET", "/items/1"), 200)
+        self.assertEqual(await call(app, "GET", "/items/2"), 200)
+        self.assertEqual(await call(app, "GET", "/nothing"), 404)
+
+        self.assertEqual(sample(name, method="GET", route="/items/{item_id}", status="200") - before, 2)
+        self.assertGreaterEqual(sample(name, method="GET", route="unmatched", status="404"), 1)
+
+    async def test_database_queries(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db = instrument_database(Database(f"sqlite:///{tmp.name}/test.db"), "test-db")
+        await db.connect()
+
+        token = metrics_scope.set("test_routine")
+        try:
+            await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+            await db.execute_many("INSERT INTO t (id) VALUES (:id)", [{"id": i} for i in range(3)])
+            self.assertEqual(await db.fetch_val("SELECT COUNT(*) FROM t"), 3)
+        finally:
+            metrics_scope.reset(token)
+            await db.disconnect()
+
+        self.assertEqual(sample("foxlink_db_query_duration_seconds_count", database="test-db", scope="test_routine"), 3)
+        self.assertGreaterEqual(sample("foxlink_db_pool_wait_seconds_count", database="test-db"), 1)
+
+
+    async def test_metrics_token(self):
+        app = FastAPI()
+        app.include_router(metrics_routes.router)
+
+        # no token configured, /metrics is disabled
+        with patch.object(auth_service, "METRICS_TOKEN", ""):
+            self.assertEqual(await call(app, "GET", "/metrics"), 404)
+
+        with patch.object(auth_service, "METRICS_TOKEN", "scrape"):
+            self.assertEqual(await call(app, "GET", "/metrics"), 401)
+            self.assertEqual(await call(app, "GET", "/metrics", [(b"authorization", b"Bearer wrong")]), 401)
+            self.assertEqual(await call(app, "GET", "/metrics", [(b"authorization", b"Bearer scrape")]), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
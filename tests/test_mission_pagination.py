@@ -0,0 +1,34 @@
+import unittest
+import dotenv
+from datetime import datetime
+
+dotenv.load_dotenv('ntust.env')
+
+from fastapi.exceptions import HTTPException
+from app.routes.mission import parse_mission_fields
+from app.services.mission import decode_mission_cursor, encode_mission_cursor
+
+
+class MissionPaginationTestModule(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        created_date = datetime(2022, 7, 1, 8, 30, 15)
+        cursor = encode_mission_cursor(created_date, 42)
+
+        self.assertEqual((created_date, 42), decode_mission_cursor(cursor))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(HTTPException) as cm:
+            decode_mission_cursor("not-a-cursor")
+        self.assertEqual(400, cm.exception.status_code)
+
+    def test_fields(self):
+        self.assertIsNone(parse_mission_fields(None))
+        self.assertEqual({"mission_id", "device"}, parse_mission_fields("mission_id, device,"))
+
+        with self.assertRaises(HTTPException) as cm:
+            parse_mission_fields("mission_id,password_hash")
+        self.assertEqual(400, cm.exception.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import unittest
+import dotenv
+from datetime import datetime
+
+dotenv.load_dotenv('ntust.env')
+
+from fastapi.encoders import jsonable_encoder
+from app.models.schema import MissionDto
+from app.services.mission import mission_dto_dict
+from app.utils.response import ORJSONResponse
+
+
+def row(**kwargs):
+    return {
+        "id": 1,
+        "name": "設備故障",
+        "description": "M3 停機",
+        "repair_start_date": datetime(2022, 7, 1, 8, 10),
+        "repair_end_date": None,
+        "is_cancel": 0,
+        "is_emergency": 1,
+        "created_date": datetime(2022, 7, 1, 8, 0, 0, 123456),
+        "updated_date": datetime(2022, 7, 1, 8, 10),
+        "device_id": "P1@1@Device_1",
+        "device_name": "Device_1",
+        "device_cname": "機台 1",
+        "project": "P1",
+        "process": "M3",
+        "line": 1,
+        "workshop": "第九車間",
+        **kwargs,
+    }
+
+
+ASSIGNEES = [{"username": "rescue", "full_name": "維修人員"}]
+EVENTS = [
+    {
+        "category": 1,
+        "message": "馬達異常",
+        "done_verified": False,
+        "event_start_date": datetime(2022, 7, 1, 7, 59),
+        "event_end_date": None,
+    }
+]
+
+
+class MissionSerializationTestModule(unittest.TestCase):
+    def test_matches_mission_dto(self):
+        item = mission_dto_dict(row(), ASSIGNEES, EVENTS)
+        dto = MissionDto.parse_obj(item)
+
+        self.assertEqual(dto.dict(), item)
+        self.assertIs(True, item["is_emergency"])
+        self.assertIs(False, item["is_cancel"])
+        self.assertTrue(item["is_started"])
+        self.assertFalse(item["is_closed"])
+
+    def test_orjson_response_matches_json_encoder(self):
+        item = mission_dto_dict(row(), ASSIGNEES, EVENTS)
+        expected = jsonable_encoder([MissionDto.parse_obj(item)])
+
+        self.assertEqual(expected, json.loads(ORJSONResponse([item]).body))
+
+    def test_fields(self):
+        item = mission_dto_dict(row(), ASSIGNEES, EVENTS, {"mission_id", "is_started"})
+        self.assertEqual({"mission_id": 1, "is_started": True}, item)
+
+
+if __name__ == "__main__":
+    unittest.main()
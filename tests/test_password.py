@@ -0,0 +1,53 @@
+import threading
+import unittest
+from unittest.mock import patch
+import dotenv
+from passlib.context import CryptContext
+
+dotenv.load_dotenv('ntust.env')
+
+from app.services import migration, user as user_service
+from app.services.user import get_password_hash, verify_password
+
+
+class PasswordTestModule(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # a fast scheme, these tests are about where the hashing runs
+        self.threads = []
+        context = CryptContext(schemes=["md5_crypt"])
+
+        class RecordingContext:
+            def hash(_, secret):
+                self.threads.append(threading.current_thread().name)
+                return context.hash(secret)
+
+            def verify(_, secret, hash):
+                self.threads.append(threading.current_thread().name)
+                return context.verify(secret, hash)
+
+        patcher = patch.object(user_service, "pwd_context", RecordingContext())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_hash_off_event_loop(self):
+        password_hash = await get_password_hash("secret")
+
+        self.assertTrue(await verify_password("secret", password_hash))
+        self.assertFalse(await verify_password("wrong", password_hash))
+        self.assertEqual(len(self.threads), 3)
+        self.assertTrue(all(name.startswith("password-hash") for name in self.threads))
+
+    async def test_default_password_hash(self):
+        patcher = patch.object(migration, "_default_password_hash", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        password_hash = await migration.get_default_password_hash()
+
+        self.assertEqual(await migration.get_default_password_hash(), password_hash)
+        self.assertEqual(len(self.threads), 1)
+        self.assertTrue(await verify_password(migration.DEFAULT_PASSWORD, password_hash))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import unittest
+import dotenv
+from datetime import datetime, timedelta
+from paho.mqtt import client
+
+dotenv.load_dotenv('ntust.env')
+
+from fake_mqtt_broker import FakeMqttBroker
+from app.mqtt.main import connect_mqtt, disconnect_mqtt
+from app.mqtt.emqx import emqx_client
+from app.mqtt.presence import CONNECTED_TOPIC, DISCONNECTED_TOPIC, PresenceMap, presence_map
+
+
+def sys_event(username: str, event: str, ts: datetime):
+    topic = f"$SYS/brokers/emqx@node/clients/{username}/{event}"
+    payload = {"clientid": username, "username": username, "ts": int((ts - datetime(1970, 1, 1)).total_seconds() * 1000)}
+    return topic, json.dumps(payload).encode()
+
+
+class PresenceMapTestModule(unittest.TestCase):
+    def test_out_of_order_events(self):
+        p = PresenceMap()
+        now = datetime.utcnow()
+        p.handle_event(*sys_event("worker", "disconnected", now))
+        p.handle_event(*sys_event("worker", "connected", now - timedelta(seconds=1)))
+        self.assertFalse(p.get("worker").connected)
+
+    def test_seed(self):
+        p = PresenceMap()
+        p.enabled = True
+        now = datetime.utcnow()
+        self.assertIsNone(p.is_connected("worker-1"))
+
+        p.handle_event(*sys_event("worker-1", "connected", now - timedelta(minutes=1)))
+        p.handle_event(*sys_event("worker-2", "connected", now + timedelta(seconds=1)))
+        p.seed({"worker-3": {"ip_address": "10.0.0.1"}}, now)
+
+        # worker-1 is not in the list, worker-2 connected after the list was fetched
+        self.assertFalse(p.is_connected("worker-1"))
+        self.assertTrue(p.is_connected("worker-2"))
+        self.assertTrue(p.is_connected("worker-3"))
+        self.assertFalse(p.is_connected("nobody"))
+
+
+class BrokerPresenceTestModule(unittest.TestCase):
+    def setUp(self):
+        presence_map.clear()
+
+    def tearDown(self):
+        disconnect_mqtt()
+        self.broker.stop()
+        presence_map.clear()
+
+    def connect_worker(self, username: str) -> client.Client:
+        c = client.Client(username)
+        c.username_pw_set(username)
+        c.connect("127.0.0.1", port=self.broker.port)
+        c.loop_start()
+        return c
+
+    def test_track_presence(self):
+        self.broker = FakeMqttBroker()
+        connect_mqtt("127.0.0.1", self.broker.start(), "api-server", track_presence=True)
+        self.assertTrue(self.broker.wait_for(lambda: presence_map.enabled))
+        presence_map.seed({}, datetime.utcnow())
+
+        worker = self.connect_worker("worker-1")
+        self.assertTrue(self.broker.wait_for(lambda: presence_map.is_connected("worker-1") is True))
+
+        worker.disconnect()
+        worker.loop_stop()
+        self.assertTrue(self.broker.wait_for(lambda: presence_map.is_connected("worker-1") is False))
+
+    def test_handlers(self):
+        self.broker = FakeMqttBroker()
+        received = []
+        connect_mqtt(
+            "127.0.0.1", self.broker.start(), "api-server", handlers={"foxlink/test": received.append}
+        )
+        self.assertTrue(self.broker.wait_for(lambda: any("foxlink/test" in s.subscriptions for s in self.broker._sessions)))
+
+        sender = self.connect_worker("sender")
+        sender.publish("foxlink/test", b"changed", qos=1)
+        self.assertTrue(self.broker.wait_for(lambda: received == [b"changed"]))
+        sender.disconnect()
+        sender.loop_stop()
+
+    def test_subscription_denied(self):
+        self.broker = FakeMqttBroker(denied_topics=(CONNECTED_TOPIC, DISCONNECTED_TOPIC))
+        connect_mqtt("127.0.0.1", self.broker.start(), "api-server", track_presence=True)
+        self.assertFalse(self.broker.wait_for(lambda: presence_map.enabled, timeout=0.5))
+        self.assertIsNone(presence_map.is_connected("worker-1"))
+
+
+class PresenceSeedTestModule(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        presence_map.clear()
+        self.broker = FakeMqttBroker()
+
+        async def fetch_connected_clients():
+            return {"worker-1": {"username": "worker-1", "ip_address": "10.0.0.1"}}
+
+        # the clients connected before the API subscribed to the client events
+        emqx_client.fetch_connected_clients = fetch_connected_clients
+
+    async def asyncTearDown(self):
+        del emqx_client.fetch_connected_clients
+        disconnect_mqtt()
+        self.broker.stop()
+        presence_map.clear()
+
+    async def test_seed_after_subscribe(self):
+        connect_mqtt("127.0.0.1", self.broker.start(), "api-server", track_presence=True)
+
+        for _ in range(500):
+            if presence_map.is_ready():
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(presence_map.is_connected("worker-1"))
+        self.assertFalse(presence_map.is_connected("worker-2"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+import dotenv
+from databases import Database
+
+dotenv.load_dotenv('ntust.env')
+
+from app.utils.metrics import instrument_database
+from app.utils.profiler import fingerprint, profile_queries, recent_profiles
+
+
+class ProfilerTestModule(unittest.IsolatedAsyncioTestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM users\n  WHERE username = 'abc' AND level > 2 LIMIT :limit"),
+            "SELECT * FROM users WHERE username = ? AND level > ? LIMIT ?",
+        )
+        self.assertEqual(
+            fingerprint("SELECT id FROM t1 WHERE id IN (1, 2, 3)"),
+            fingerprint("SELECT id FROM t1 WHERE id IN (4)"),
+        )
+
+    async def test_profile_queries(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db = instrument_database(Database(f"sqlite:///{tmp.name}/test.db"), "test-db")
+        await db.connect()
+        self.addAsyncCleanup(db.disconnect)
+
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+        await db.execute_many("INSERT INTO t (id) VALUES (:id)", [{"id": i} for i in range(20)])
+
+        with profile_queries("test_routine", enabled=True) as profile:
+            await db.fetch_all("SELECT id FROM t WHERE id < 5")
+            for i in range(12):
+                await db.fetch_one("SELECT id FROM t WHERE id = :id", {"id": i})
+
+        self.assertIs(recent_profiles[-1], profile)
+        report = profile.report()
+        self.assertEqual(report["query_count"], 13)
+        self.assertEqual(report["n_plus_one"], ["SELECT id FROM t WHERE id = ?"])
+
+        rows = {q["sql"]: q["rows"] for q in report["queries"]}
+        self.assertEqual(rows["SELECT id FROM t WHERE id < ?"], 5)
+        self.assertEqual(rows["SELECT id FROM t WHERE id = ?"], 12)
+
+        # queries outside of the profiled block are not recorded
+        await db.fetch_all("SELECT id FROM t")
+        self.assertEqual(profile.query_count, 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
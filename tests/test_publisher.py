@@ -0,0 +1,97 @@
+import asyncio
+import json
+import unittest
+import dotenv
+from datetime import datetime
+from paho.mqtt import client
+
+dotenv.load_dotenv('ntust.env')
+
+from fake_mqtt_broker import FakeMqttBroker
+from app.mqtt.publisher import MqttPublisher, encode_payload
+
+
+class MqttPublisherTestModule(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.broker = FakeMqttBroker()
+        self.client = client.Client("publisher")
+        self.client.connect("127.0.0.1", port=self.broker.start())
+        self.client.loop_start()
+        self.assertTrue(self.broker.wait_for(self.client.is_connected))
+
+    async def asyncTearDown(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.broker.stop()
+
+    async def test_coalesce_retained_messages(self):
+        publisher = MqttPublisher(max_queue=10, max_inflight=2)
+        publisher.start(self.client)
+
+        for i in range(5):
+            publisher.submit("foxlink/users/worker/move-rescue-station", {"n": i}, qos=2, retain=True)
+            publisher.submit("foxlink/users/worker/missions", {"n": i}, qos=1)
+
+        self.assertTrue(await publisher.flush())
+        publisher.stop()
+
+        retained = [json.loads(p) for t, p, _, _ in self.broker.published if t.endswith("move-rescue-station")]
+        others = [json.loads(p) for t, p, _, _ in self.broker.published if t.endswith("missions")]
+        self.assertEqual(retained, [{"n": 4}])
+        self.assertEqual(others, [{"n": i} for i in range(5)])
+
+        stats = publisher.stats()
+        self.assertEqual(stats["coalesced"], 4)
+        self.assertEqual(stats["delivered"], 6)
+        self.assertIsNotNone(stats["latency_p99"])
+
+    async def test_drop_when_queue_is_full(self):
+        publisher = MqttPublisher(max_queue=2, max_inflight=1)
+        publisher.start(self.client)
+
+        results = [publisher.submit(f"foxlink/test/{i}", {}, qos=1) for i in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertTrue(await publisher.flush())
+        publisher.stop()
+        self.assertEqual(publisher.stats()["dropped"], 1)
+
+    async def test_publish_error(self):
+        publisher = MqttPublisher(max_queue=10, max_inflight=1)
+        publisher.start(self.client)
+
+        # paho raises ValueError for wildcards in the topic
+        publisher.submit("foxlink/test/#", {}, qos=1)
+        publisher.submit("foxlink/test/ok", {}, qos=1)
+
+        self.assertTrue(await publisher.flush())
+        self.assertTrue(publisher.running)
+        publisher.stop()
+
+        stats = publisher.stats()
+        self.assertEqual((stats["failed"], stats["delivered"]), (1, 1))
+
+    async def test_release_inflight_on_disconnect(self):
+        publisher = MqttPublisher(max_queue=10, max_inflight=1)
+        publisher.start(self.client)
+
+        # the ack of this message never reaches the publisher
+        self.client.on_publish = None
+        publisher.submit("foxlink/test/lost", {}, qos=1)
+        await asyncio.sleep(0.1)
+        self.assertEqual(publisher.stats()["inflight"], 1)
+
+        publisher._on_disconnect(self.client, None, 1)
+        self.client.on_publish = publisher._on_publish
+        publisher.submit("foxlink/test/next", {}, qos=1)
+
+        self.assertTrue(await publisher.flush())
+        publisher.stop()
+        self.assertEqual(publisher.stats()["delivered"], 1)
+
+    def test_encode_payload(self):
+        payload = {"date": datetime(2022, 6, 1, 8, 30), 1: "a"}
+        self.assertEqual(json.loads(encode_payload(payload)), {"date": "2022-06-01T08:30:00", "1": "a"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.utils.pubsub import PubSub
+
+
+class PubSubTestModule(unittest.IsolatedAsyncioTestCase):
+    async def test_publish(self):
+        bus: PubSub[str] = PubSub(10)
+        a = bus.subscribe("workshop-1")
+        b = bus.subscribe("workshop-1")
+        other = bus.subscribe("workshop-2")
+
+        self.assertEqual(2, bus.publish("workshop-1", "hello"))
+        self.assertEqual(0, bus.publish("nobody", "hello"))
+        self.assertEqual("hello", await a.get())
+        self.assertEqual("hello", await b.get())
+        self.assertTrue(other._queue.empty())
+
+    async def test_overflow(self):
+        bus: PubSub[int] = PubSub(2)
+        slow = bus.subscribe("workshop-1")
+
+        for i in range(3):
+            bus.publish("workshop-1", i)
+
+        # the slow subscriber is dropped, the oldest message makes room for the close sentinel
+        self.assertTrue(slow.overflowed)
+        self.assertFalse(bus.has_subscribers("workshop-1"))
+        self.assertEqual(1, await slow.get())
+        self.assertIsNone(await slow.get())
+
+    async def test_unsubscribe(self):
+        bus: PubSub[int] = PubSub(2)
+        s = bus.subscribe("workshop-1")
+        self.assertTrue(bus.has_subscribers())
+
+        bus.unsubscribe(s)
+        bus.unsubscribe(s)
+        self.assertFalse(bus.has_subscribers())
+        self.assertEqual(0, bus.publish("workshop-1", 1))
+        self.assertFalse(s.overflowed)
+        self.assertIsNone(await s.get())
+
+    async def test_close(self):
+        bus: PubSub[int] = PubSub(2)
+        subscriptions = [bus.subscribe("workshop-1"), bus.subscribe("workshop-2")]
+
+        bus.close()
+        self.assertEqual(set(), bus.topics())
+        for s in subscriptions:
+            self.assertIsNone(await s.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
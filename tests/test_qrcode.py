@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.services import workshop as workshop_service
+from app.services.workshop import (
+    cache_qrcode_zip,
+    get_cached_qrcode_zip,
+    get_qrcode_pool,
+    qrcode_zip_cache,
+    render_device_qrcodes,
+    shutdown_qrcode_pool,
+)
+
+
+class QRCodeZipCacheTestModule(unittest.TestCase):
+    def setUp(self):
+        qrcode_zip_cache.clear()
+        self.addCleanup(qrcode_zip_cache.clear)
+
+        patcher = patch.object(workshop_service, "QRCODE_ZIP_CACHE_MAX_BYTES", 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_updated_workshop(self):
+        updated_date = datetime(2022, 1, 1)
+        cache_qrcode_zip(1, updated_date, b"zip")
+
+        self.assertEqual(get_cached_qrcode_zip(1, updated_date), b"zip")
+        self.assertIsNone(get_cached_qrcode_zip(1, datetime(2022, 1, 2)))
+        self.assertNotIn(1, qrcode_zip_cache)
+
+    def test_evict_least_recently_used(self):
+        updated_date = datetime(2022, 1, 1)
+        cache_qrcode_zip(1, updated_date, b"1234")
+        cache_qrcode_zip(2, updated_date, b"1234")
+        get_cached_qrcode_zip(1, updated_date)
+        cache_qrcode_zip(3, updated_date, b"1234")
+
+        self.assertEqual(list(qrcode_zip_cache), [1, 3])
+
+        # a zip larger than the whole cache is not kept
+        cache_qrcode_zip(4, updated_date, b"12345678901")
+        self.assertEqual(list(qrcode_zip_cache), [1, 3])
+
+
+class QRCodePoolTestModule(unittest.IsolatedAsyncioTestCase):
+    async def test_spawn_pool(self):
+        self.addCleanup(shutdown_qrcode_pool)
+        pool = get_qrcode_pool()
+
+        self.assertEqual(pool._mp_context.get_start_method(), "spawn")
+        # the spawned worker imports the module to run the function
+        result = await asyncio.get_running_loop().run_in_executor(pool, render_device_qrcodes, [])
+        self.assertEqual(result, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
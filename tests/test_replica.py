@@ -0,0 +1,158 @@
+import asyncio
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+import dotenv
+from databases import Database
+from pymysql.err import ProgrammingError
+
+dotenv.load_dotenv('ntust.env')
+
+from app.core import replica as replica_module
+from app.core.replica import ReplicaRouter, mysql_replica_lag, read_replica, route_reads
+from app.core.transaction import after_commit
+
+
+class ReplicaTestModule(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.lag = 0.0
+
+        async def replica_lag(db: Database):
+            return self.lag
+
+        self.replica = Database(f"sqlite:///{tmp.name}/replica.db")
+        self.router = ReplicaRouter(self.replica, max_staleness=5, lag=replica_lag, lag_check_interval=0)
+        self.primary = route_reads(Database(f"sqlite:///{tmp.name}/primary.db"), self.router)
+
+        for db, name in ((self.primary, "primary"), (self.replica, "replica")):
+            await db.connect()
+            self.addAsyncCleanup(db.disconnect)
+            await db.execute("CREATE TABLE t (name TEXT)")
+            await db.execute("INSERT INTO t (name) VALUES (:name)", {"name": name})
+
+    async def served_by(self) -> str:
+        return await self.primary.fetch_val("SELECT name FROM t")
+
+    async def test_route_reads(self):
+        self.assertEqual(await self.served_by(), "primary")
+
+        with read_replica():
+            self.assertEqual(await self.served_by(), "replica")
+            # tasks started in the block inherit the preference
+            self.assertEqual(await asyncio.gather(self.served_by(), self.served_by()), ["replica", "replica"])
+
+        self.assertEqual(await self.served_by(), "primary")
+
+    async def test_stale_replica(self):
+        self.lag = 10
+        with read_replica():
+            self.assertEqual(await self.served_by(), "primary")
+
+        self.lag = None  # replication stopped
+        with read_replica():
+            self.assertEqual(await self.served_by(), "primary")
+
+        self.lag = 1
+        with read_replica():
+            self.assertEqual(await self.served_by(), "replica")
+
+    async def test_transaction(self):
+        # transactions and the queries in them always run on the primary, even in a read replica block
+        with read_replica():
+            async with self.primary.transaction():
+                await self.primary.execute("INSERT INTO t (name) VALUES ('block')")
+                self.assertEqual(await self.served_by(), "primary")
+
+            @self.primary.transaction()
+            async def insert():
+                await self.primary.execute("INSERT INTO t (name) VALUES ('decorator')")
+
+            await insert()
+
+            # reads are routed again once the transaction is over
+            self.assertEqual(await self.served_by(), "replica")
+
+        names = await self.primary.fetch_all("SELECT name FROM t ORDER BY name")
+        self.assertEqual([r["name"] for r in names], ["block", "decorator", "primary"])
+
+    async def test_after_commit(self):
+        calls = []
+
+        async with self.primary.transaction():
+            after_commit(lambda: calls.append("outer"))
+
+            with self.assertRaises(ValueError):
+                async with self.primary.transaction():
+                    after_commit(lambda: calls.append("rolled back savepoint"))
+                    raise ValueError()
+
+            async with self.primary.transaction():
+                after_commit(lambda: calls.append("savepoint"))
+
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, ["outer", "savepoint"])
+
+        with self.assertRaises(ValueError):
+            async with self.primary.transaction():
+                after_commit(lambda: calls.append("rolled back"))
+                raise ValueError()
+
+        after_commit(lambda: calls.append("no transaction"))
+        self.assertEqual(calls, ["outer", "savepoint", "no transaction"])
+
+    async def test_unavailable_replica(self):
+        self.router.replica = Database("sqlite:////nonexistent/dir/replica.db")
+
+        with read_replica():
+            self.assertEqual(await self.served_by(), "primary")
+            self.assertFalse(await self.router.is_usable())
+
+
+
+class FakeMySQLReplica:
+    def __init__(self, version: tuple, lag: int):
+        self.version = version
+        self.lag = lag
+        self.queries = []
+
+    async def fetch_one(self, query: str):
+        self.queries.append(query)
+
+        if query == "SHOW REPLICA STATUS":
+            if self.version < (8, 0, 22):
+                raise ProgrammingError(1064, "You have an error in your SQL syntax")
+            return SimpleNamespace(_mapping={"Seconds_Behind_Source": self.lag})
+
+        return SimpleNamespace(_mapping={"Seconds_Behind_Master": self.lag})
+
+
+class MySQLReplicaLagTestModule(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch.object(replica_module, "_legacy_replica_status", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_replica_status(self):
+        replica = FakeMySQLReplica((8, 0, 30), 3)
+
+        self.assertEqual(await mysql_replica_lag(replica), 3.0)
+        self.assertEqual(replica.queries, ["SHOW REPLICA STATUS"])
+
+    async def test_legacy_slave_status(self):
+        replica = FakeMySQLReplica((5, 7, 38), 4)
+
+        self.assertEqual(await mysql_replica_lag(replica), 4.0)
+        self.assertEqual(await mysql_replica_lag(replica), 4.0)
+        # the new statement is only tried once
+        self.assertEqual(replica.queries, ["SHOW REPLICA STATUS", "SHOW SLAVE STATUS", "SHOW SLAVE STATUS"])
+
+    async def test_replication_stopped(self):
+        self.assertIsNone(await mysql_replica_lag(FakeMySQLReplica((8, 0, 30), None)))
+
+
+if __name__ == '__main__':
+    unittest.main()
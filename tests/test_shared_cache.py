@@ -0,0 +1,66 @@
+import asyncio
+import json
+import threading
+import unittest
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from fake_mqtt_broker import FakeMqttBroker
+from app.mqtt.changes import (
+    CACHE_INVALIDATION_TOPIC,
+    cache_invalidation_handler,
+    invalidate_shared_cache,
+    share_cache,
+    shared_caches,
+)
+from app.mqtt.main import connect_mqtt, disconnect_mqtt
+from app.utils.cache import TTLCache
+
+
+class SharedCacheTestModule(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cache: TTLCache[int] = share_cache("test", TTLCache(60))
+        self.addCleanup(shared_caches.pop, "test")
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+
+    async def test_handle_invalidation(self):
+        handle = cache_invalidation_handler(asyncio.get_running_loop())
+
+        # sent by another process, received on paho's thread
+        thread = threading.Thread(target=handle, args=(b'{"name": "test", "key": "a"}',))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(2, self.cache.get("b"))
+
+        handle(b'{"name": "unknown", "key": null}')
+        handle(b'not json')
+        handle(b'{"name": "test", "key": null}')
+        await asyncio.sleep(0)
+        self.assertIsNone(self.cache.get("b"))
+
+    async def test_invalidate_shared_cache(self):
+        broker = FakeMqttBroker()
+        connect_mqtt("127.0.0.1", broker.start(), "api-server")
+        self.addCleanup(broker.stop)
+        self.addCleanup(disconnect_mqtt)
+
+        invalidate_shared_cache("test", "a")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(2, self.cache.get("b"))
+
+        for _ in range(500):
+            if len(broker.published) > 0:
+                break
+            await asyncio.sleep(0.01)
+
+        topic, payload, qos, _ = broker.published[0]
+        self.assertEqual((CACHE_INVALIDATION_TOPIC, 1), (topic, qos))
+        self.assertEqual({"name": "test", "key": "a"}, json.loads(payload))
+
+
+if __name__ == "__main__":
+    unittest.main()
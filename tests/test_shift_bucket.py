@@ -0,0 +1,74 @@
+import unittest
+import dotenv
+from datetime import date, datetime, timedelta, timezone
+
+dotenv.load_dotenv('ntust.env')
+
+from app.core.database import AuditActionEnum, AuditLogHeader, Mission, MissionEvent, ShiftType
+from app.services.statistics import get_shift_filter
+
+
+class ShiftFilterTestModule(unittest.TestCase):
+    def test_no_shift(self):
+        self.assertEqual(("", {}), get_shift_filter(None, datetime(2022, 1, 1), datetime(2022, 1, 31), "m"))
+
+    def test_shift_range(self):
+        # DAY_SHIFT_BEGIN is 07:40 (local time) in ntust.env
+        # 2022-01-01 00:00 UTC is 08:00 local time, 2022-01-31 20:00 UTC is 04:00 local time on 02-01
+        sql, params = get_shift_filter(ShiftType.night, datetime(2022, 1, 1, 0, 0), datetime(2022, 1, 31, 20, 0), "m")
+
+        self.assertEqual(
+            "AND m.shift_type = :shift_type AND (m.shift_date BETWEEN :start_shift_date AND :end_shift_date)", sql
+        )
+        self.assertEqual(
+            {"shift_type": ShiftType.night.value, "start_shift_date": date(2022, 1, 1), "end_shift_date": date(2022, 1, 31)},
+            params,
+        )
+
+        _, params = get_shift_filter(ShiftType.day, datetime(2022, 1, 1, 0, 0), datetime(2022, 1, 31, 20, 0), "m")
+        self.assertEqual(ShiftType.day.value, params["shift_type"])
+
+    def test_aware_dates(self):
+        local = timezone(timedelta(hours=8))
+        _, params = get_shift_filter(
+            ShiftType.day, datetime(2022, 1, 1, 8, 0, tzinfo=local), datetime(2022, 2, 1, 4, 0, tzinfo=local), "m"
+        )
+
+        self.assertEqual((date(2022, 1, 1), date(2022, 1, 31)), (params["start_shift_date"], params["end_shift_date"]))
+
+
+class ShiftBucketTestModule(unittest.IsolatedAsyncioTestCase):
+    async def fill(self, instance):
+        await type(instance).Meta.signals.pre_save.send(sender=type(instance), instance=instance)
+        return instance.shift_type, instance.shift_date
+
+    async def test_mission(self):
+        # 12:00 local time
+        m = Mission(name="test", description="", required_expertises=[], created_date=datetime(2022, 1, 1, 4, 0))
+        self.assertEqual((ShiftType.day.value, date(2022, 1, 1)), await self.fill(m))
+
+        # 23:00 local time, the night shift has not crossed midnight yet
+        m = Mission(name="test", description="", required_expertises=[], created_date=datetime(2022, 1, 1, 15, 0))
+        self.assertEqual((ShiftType.night.value, date(2022, 1, 1)), await self.fill(m))
+
+    async def test_night_shift_after_midnight(self):
+        # 04:00 local time on 01-02 belongs to the night shift started on 01-01
+        log = AuditLogHeader(
+            action=AuditActionEnum.USER_LOGIN.value, table_name="users", created_date=datetime(2022, 1, 1, 20, 0)
+        )
+        self.assertEqual((ShiftType.night.value, date(2022, 1, 1)), await self.fill(log))
+
+    async def test_mission_event(self):
+        # event_start_date is in local time
+        e = MissionEvent(event_id=1, table_name="test", category=1, event_start_date=datetime(2022, 1, 2, 4, 0))
+        self.assertEqual((ShiftType.night.value, date(2022, 1, 1)), await self.fill(e))
+
+        e = MissionEvent(event_id=1, table_name="test", category=1, event_start_date=datetime(2022, 1, 2, 7, 40))
+        self.assertEqual((ShiftType.day.value, date(2022, 1, 2)), await self.fill(e))
+
+        e = MissionEvent(event_id=1, table_name="test", category=1, event_start_date=None)
+        self.assertEqual((None, None), await self.fill(e))
+
+
+if __name__ == "__main__":
+    unittest.main()
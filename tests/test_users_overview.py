@@ -0,0 +1,52 @@
+import unittest
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.services.user import group_users_overview
+
+
+def row(shift, username, device_name, exp, superior=None):
+    return {
+        "username": username,
+        "full_name": f"{username} name",
+        "level": 1,
+        "workshop": "第九車間",
+        "shift": shift,
+        "exp": exp,
+        "superior": superior,
+        "project": "P1",
+        "process": "M3",
+        "device_name": device_name,
+        "line": 1,
+    }
+
+
+class UsersOverviewTestModule(unittest.TestCase):
+    def test_group_by_shift_and_user(self):
+        overview = group_users_overview([
+            row(0, "a", "D1", 1),
+            row(0, "a", "D2", 3, superior="boss"),
+            row(0, "a", "D3", 2, superior="other boss"),
+            row(0, "b", "D1", 2),
+            row(1, "a", "D1", 5),
+        ])
+
+        self.assertEqual([o.username for o in overview.day_shift], ["a", "b"])
+        self.assertEqual([o.username for o in overview.night_shift], ["a"])
+
+        a = overview.day_shift[0]
+        self.assertEqual(a.workshop, "第九車間")
+        self.assertEqual(a.superior, "boss")
+        self.assertEqual([(e.device_name, e.exp) for e in a.experiences], [("D1", 1), ("D2", 3), ("D3", 2)])
+        self.assertIsNone(overview.day_shift[1].superior)
+        self.assertEqual(overview.night_shift[0].experiences[0].exp, 5)
+
+    def test_empty(self):
+        overview = group_users_overview([])
+        self.assertEqual(overview.day_shift, [])
+        self.assertEqual(overview.night_shift, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
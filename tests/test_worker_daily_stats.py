@@ -0,0 +1,57 @@
+import unittest
+import dotenv
+from datetime import date, datetime
+
+dotenv.load_dotenv('ntust.env')
+
+from app.core.database import AuditActionEnum, worker_daily_stat_values
+from app.utils.utils import get_local_date_by_datetime, get_week_start_date
+
+
+class WorkerDailyStatTestModule(unittest.TestCase):
+    def test_local_date(self):
+        # 2022-01-01 20:00 UTC is 2022-01-02 04:00 local time
+        self.assertEqual(date(2022, 1, 2), get_local_date_by_datetime(datetime(2022, 1, 1, 20, 0)))
+        self.assertEqual(date(2022, 1, 1), get_local_date_by_datetime(datetime(2022, 1, 1, 15, 59)))
+
+    def test_week_start(self):
+        # WEEK_START is 1, weeks start on Monday; 2022-06-27 is a Monday
+        self.assertEqual(date(2022, 6, 27), get_week_start_date(date(2022, 6, 27)))
+        self.assertEqual(date(2022, 6, 27), get_week_start_date(date(2022, 7, 3)))
+        self.assertEqual(date(2022, 7, 4), get_week_start_date(date(2022, 7, 5)))
+
+    def test_login_values(self):
+        created = datetime(2022, 7, 1, 0, 30)
+        values = worker_daily_stat_values(AuditActionEnum.USER_LOGIN.value, "rescue", created, None)
+
+        self.assertEqual(date(2022, 7, 1), values["day"])
+        self.assertEqual((0, 0, 1), (values["accepted_count"], values["rejected_count"], values["login_count"]))
+        self.assertEqual(created, values["first_login_date"])
+        self.assertIsNone(values["last_logout_date"])
+
+    def test_logout_values(self):
+        created = datetime(2022, 7, 1, 10, 0)
+        values = worker_daily_stat_values(AuditActionEnum.USER_LOGOUT.value, "rescue", created, "OffWork")
+
+        self.assertEqual((0, 0, 0), (values["accepted_count"], values["rejected_count"], values["login_count"]))
+        self.assertIsNone(values["first_login_date"])
+        self.assertEqual(created, values["last_logout_date"])
+        self.assertEqual("OffWork", values["last_logout_reason"])
+
+    def test_mission_values(self):
+        created = datetime(2022, 7, 1, 10, 0)
+        accepted = worker_daily_stat_values(AuditActionEnum.MISSION_ACCEPTED.value, "rescue", created, None)
+        rejected = worker_daily_stat_values(AuditActionEnum.MISSION_REJECTED.value, "rescue", created, None)
+
+        self.assertEqual((1, 0), (accepted["accepted_count"], accepted["rejected_count"]))
+        self.assertEqual((0, 1), (rejected["accepted_count"], rejected["rejected_count"]))
+        self.assertIsNone(accepted["last_logout_reason"])
+
+    def test_untracked_action(self):
+        self.assertIsNone(
+            worker_daily_stat_values(AuditActionEnum.MISSION_STARTED.value, "rescue", datetime(2022, 7, 1), None)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from datetime import datetime, timedelta
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.core.database import WorkerStatusEnum
+from app.services.user import build_worker_status_dto
+
+
+class WorkerStatusDtoTestModule(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2022, 8, 1, 8, 0, 0)
+        self.status = {
+            "worker": "w1",
+            "full_name": "Worker 1",
+            "status": WorkerStatusEnum.working.value,
+            "last_event_end_date": self.now - timedelta(hours=1),
+            "at_device": "D1",
+            "device_cname": "Device 1",
+        }
+        self.mission = {
+            "created_date": self.now - timedelta(minutes=10),
+            "repair_start_date": self.now - timedelta(minutes=4),
+            "device": "D2",
+            "device_cname": "Device 2",
+            "is_rescue": False,
+        }
+
+    def test_working(self):
+        dto = build_worker_status_dto(self.status, 3, self.mission, self.now)
+
+        self.assertEqual(dto.worker_id, "w1")
+        self.assertEqual(dto.total_dispatches, 3)
+        self.assertEqual(dto.mission_duration, 600)
+        self.assertEqual(dto.repair_duration, 240)
+        self.assertEqual(dto.at_device, "D1")
+
+    def test_moving(self):
+        self.status["status"] = WorkerStatusEnum.moving.value
+        self.mission["repair_start_date"] = None
+        dto = build_worker_status_dto(self.status, 0, self.mission, self.now)
+
+        self.assertEqual(dto.at_device, "D2")
+        self.assertEqual(dto.at_device_cname, "Device 2")
+        self.assertIsNone(dto.repair_duration)
+
+    def test_rescue_mission(self):
+        self.mission["is_rescue"] = True
+        dto = build_worker_status_dto(self.status, 0, self.mission, self.now)
+
+        self.assertEqual(dto.mission_duration, 600)
+        self.assertIsNone(dto.repair_duration)
+
+    def test_idle(self):
+        self.status["status"] = WorkerStatusEnum.idle.value
+        dto = build_worker_status_dto(self.status, 0, self.mission, self.now)
+
+        self.assertIsNone(dto.mission_duration)
+        self.assertEqual(dto.at_device, "D1")
+
+
+if __name__ == '__main__':
+    unittest.main()
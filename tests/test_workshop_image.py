@@ -0,0 +1,69 @@
+import unittest
+import dotenv
+import numpy as np
+from datetime import datetime
+
+dotenv.load_dotenv('ntust.env')
+
+from app.models.schema import DeviceStatus, DeviceStatusEnum
+from app.services.workshop_image import ImageVariant, WorkshopImage, is_etag_matched
+
+
+def device(device_id: str, x: float, y: float, status: DeviceStatusEnum) -> DeviceStatus:
+    return DeviceStatus(device_id=device_id, x_axis=x, y_axis=y, status=status)
+
+
+class WorkshopImageTestModule(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.base = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+
+    def assert_same_as_full_redraw(self, variant: ImageVariant, statuses):
+        fresh = ImageVariant(self.base, variant.scale, variant.radius)
+        fresh.draw_statuses(statuses)
+        self.assertTrue(np.array_equal(variant.canvas, fresh.canvas))
+
+    def test_incremental_redraw(self):
+        statuses = [
+            device("a", 50, 50, DeviceStatusEnum.working),
+            device("b", 58, 52, DeviceStatusEnum.working),  # overlaps a and c
+            device("c", 66, 50, DeviceStatusEnum.halt),
+            device("d", 200, 100, DeviceStatusEnum.repairing),
+        ]
+        variant = ImageVariant(self.base, 1.0, 6)
+        self.assertEqual(variant.draw_statuses(statuses), 4)
+        self.assertEqual(variant.draw_statuses(statuses), 0)
+
+        statuses[1] = device("b", 58, 52, DeviceStatusEnum.repairing)
+        self.assertEqual(variant.draw_statuses(statuses), 1)
+        self.assert_same_as_full_redraw(variant, statuses)
+
+        # a device is moved, another is removed
+        statuses[3] = device("d", 10, 10, DeviceStatusEnum.repairing)
+        del statuses[2]
+        self.assertEqual(variant.draw_statuses(statuses), 2)
+        self.assert_same_as_full_redraw(variant, statuses)
+
+    def test_etag_matched(self):
+        self.assertTrue(is_etag_matched('"abc"', '"abc"'))
+        self.assertTrue(is_etag_matched('"abc"', 'W/"abc", "def"'))
+        self.assertTrue(is_etag_matched('"abc"', "*"))
+        self.assertFalse(is_etag_matched('"abc"', '"def"'))
+        self.assertFalse(is_etag_matched('"abc"', None))
+
+
+class WorkshopImageVariantTestModule(unittest.IsolatedAsyncioTestCase):
+    async def test_get_variant(self):
+        image = WorkshopImage(datetime.utcnow(), np.zeros((240, 320, 3), dtype=np.uint8))
+
+        full = await image.get_variant(None)
+        self.assertEqual((240, 320), full.canvas.shape[:2])
+
+        small = await image.get_variant(160)
+        self.assertEqual((120, 160), small.canvas.shape[:2])
+        self.assertEqual(0.5, small.scale)
+        self.assertIs(small, await image.get_variant(160))
+
+
+if __name__ == '__main__':
+    unittest.main()
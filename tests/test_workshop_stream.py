@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+import unittest
+from typing import Any, Dict, List, Tuple
+from unittest.mock import patch
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from app.models.schema import DeviceStatus, DeviceStatusEnum
+from app.services import workshop_stream
+from app.services.workshop_stream import WorkshopStreamHub
+
+
+def parse(message: bytes) -> Tuple[str, Any]:
+    event, data = message.decode().strip().split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+def mission(mission_id: int, workshop_name: str = "workshop-1", is_closed: bool = False) -> Dict[str, Any]:
+    return {
+        "mission_id": mission_id,
+        "device": {"workshop": workshop_name},
+        "is_closed": is_closed,
+        "is_cancel": False,
+    }
+
+
+class WorkshopStreamHubTestModule(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.missions: Dict[int, Dict[str, Any]] = {1: mission(1)}
+        self.devices: Dict[str, List[DeviceStatus]] = {
+            "workshop-1": [DeviceStatus(device_id="d1", x_axis=0, y_axis=0, status=DeviceStatusEnum.working)]
+        }
+
+        async def get_mission_dicts(mission_ids: List[int]):
+            return [self.missions[i] for i in mission_ids if i in self.missions]
+
+        async def get_missions_page(workshop_name: str, **kwargs):
+            missions = [
+                m for m in self.missions.values() if m["device"]["workshop"] == workshop_name and not m["is_closed"]
+            ]
+            return missions, None
+
+        async def get_all_devices_status(workshop_name: str):
+            return list(self.devices.get(workshop_name, []))
+
+        async def get_workshop_worker_status(workshop_name: str):
+            return []
+
+        for name, fake in [
+            ("get_mission_dicts", get_mission_dicts),
+            ("get_missions_page", get_missions_page),
+            ("get_all_devices_status", get_all_devices_status),
+            ("get_workshop_worker_status", get_workshop_worker_status),
+        ]:
+            patcher = patch.object(workshop_stream, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.hub = WorkshopStreamHub(batch_interval=0, queue_size=3)
+
+    async def next_event(self, stream) -> Tuple[str, Any]:
+        return parse(await asyncio.wait_for(stream.__anext__(), 1))
+
+    async def test_stream(self):
+        stream = self.hub.stream("workshop-1")
+        event, data = await self.next_event(stream)
+        self.assertEqual("snapshot", event)
+        self.assertEqual([1], [m["mission_id"] for m in data["missions"]])
+        self.assertEqual(["d1"], [d["device_id"] for d in data["devices"]])
+
+        # a new mission halts a device
+        self.missions[2] = mission(2)
+        self.devices["workshop-1"] = [DeviceStatus(device_id="d1", x_axis=0, y_axis=0, status=DeviceStatusEnum.halt)]
+        await self.hub.process({("mission", 2)})
+
+        self.assertEqual(("mission", mission(2)), await self.next_event(stream))
+        event, data = await self.next_event(stream)
+        self.assertEqual("device_status", event)
+        self.assertEqual([("d1", DeviceStatusEnum.halt.value)], [(d["device_id"], d["status"]) for d in data])
+
+        # the mission is deleted
+        del self.missions[2]
+        await self.hub.process({("mission", 2)})
+        self.assertEqual(("mission_removed", {"mission_id": 2}), await self.next_event(stream))
+
+        # missions of other workshops are not pushed
+        self.missions[3] = mission(3, "workshop-2")
+        await self.hub.process({("mission", 3), ("mission", 1)})
+        self.assertEqual(("mission", mission(1)), await self.next_event(stream))
+
+        await stream.aclose()
+        self.assertFalse(self.hub.bus.has_subscribers())
+
+    async def test_resync(self):
+        stream = self.hub.stream("workshop-1")
+        self.assertEqual("snapshot", (await self.next_event(stream))[0])
+
+        # the client does not read while more updates than its queue holds are pushed
+        for _ in range(4):
+            await self.hub.process({("mission", 1)})
+
+        events = [parse(message)[0] async for message in stream]
+        self.assertEqual(["mission", "mission", "resync"], events)
+        self.assertFalse(self.hub.bus.has_subscribers())
+
+    async def test_forget_workshop(self):
+        streams = [self.hub.stream("workshop-1"), self.hub.stream("workshop-1")]
+        for stream in streams:
+            await self.next_event(stream)
+        self.assertEqual({1: "workshop-1"}, self.hub._mission_workshops)
+
+        # nobody subscribes workshop-2, its missions are not tracked
+        self.missions[3] = mission(3, "workshop-2")
+        await self.hub.process({("mission", 3)})
+        self.assertNotIn(3, self.hub._mission_workshops)
+
+        await streams[0].aclose()
+        self.assertEqual({1: "workshop-1"}, self.hub._mission_workshops)
+
+        # the last client leaves
+        await streams[1].aclose()
+        self.assertEqual({}, self.hub._mission_workshops)
+        self.assertEqual({}, self.hub._devices)
+
+    async def test_change_notification(self):
+        self.hub.start()
+        self.addAsyncCleanup(self.hub.stop)
+        stream = self.hub.stream("workshop-1")
+        await self.next_event(stream)
+
+        # notifications arrive on paho's thread
+        self.missions[2] = mission(2)
+        thread = threading.Thread(target=self.hub.handle_change, args=(b'{"kind": "mission", "key": 2}',))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(("mission", mission(2)), await self.next_event(stream))
+        await stream.aclose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+import dotenv
+
+dotenv.load_dotenv('ntust.env')
+
+from fastapi import HTTPException
+from app.core.database import User
+from app.services import auth as auth_service
+from app.services.auth import (
+    create_access_token,
+    create_workshop_stream_token,
+    get_current_user,
+    get_workshop_stream_user,
+)
+
+
+class WorkshopStreamTokenTestModule(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        async def get_user_principal(username: str):
+            return User(
+                username=username,
+                password_hash="hash",
+                full_name=username,
+                expertises=[],
+                location=3,
+                is_active=True,
+                is_admin=False,
+                is_changepwd=False,
+                level=1 if username == "worker" else 2,
+            )
+
+        patcher = patch.object(auth_service, "get_user_principal", get_user_principal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def assertUnauthorized(self, aw):
+        with self.assertRaises(HTTPException) as cm:
+            await aw
+        self.assertEqual(cm.exception.status_code, 401)
+
+    async def test_stream_token(self):
+        token = create_workshop_stream_token("manager", "workshop-1")
+        user = await get_workshop_stream_user("workshop-1", token)
+        self.assertEqual(user.username, "manager")
+
+        # the token is only valid for its workshop
+        await self.assertUnauthorized(get_workshop_stream_user("workshop-2", token))
+
+    async def test_token_scopes(self):
+        access_token = create_access_token(data={"sub": "manager"})
+        stream_token = create_workshop_stream_token("manager", "workshop-1")
+
+        # neither token works in place of the other
+        await self.assertUnauthorized(get_workshop_stream_user("workshop-1", access_token))
+        await self.assertUnauthorized(get_current_user(stream_token))
+        self.assertEqual((await get_current_user(access_token)).username, "manager")
+
+    async def test_expired_token(self):
+        token = create_access_token(
+            data={"sub": "manager", "scope": "workshop-stream:workshop-1"},
+            expires_delta=timedelta(seconds=-1),
+        )
+        await self.assertUnauthorized(get_workshop_stream_user("workshop-1", token))
+
+    async def test_not_manager(self):
+        token = create_workshop_stream_token("worker", "workshop-1")
+        await self.assertUnauthorized(get_workshop_stream_user("workshop-1", token))
+
+
+if __name__ == '__main__':
+    unittest.main()